@@ -0,0 +1,110 @@
+import queue
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class DatabaseWriter(threading.Thread):
+    """Single writer thread committing the submitted statements in batches."""
+
+    def __init__(self, db_name, batch_size=1000, flush_interval=0.5):
+        super().__init__(name='DatabaseWriter', daemon=True)
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+
+    def submit(self, sql: str, params: tuple):
+        self.queue.put((sql, params))
+
+    def submit_many(self, sql: str, rows: list):
+        for params in rows:
+            self.queue.put((sql, params))
+
+    def flush(self):
+        if self.queue.unfinished_tasks == 0 or not self.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def stop(self):
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join()
+
+    def run(self):
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        logger.info(f"Database writer started on {self.db_name}")
+
+        # Consecutive statements with the same SQL are one executemany, committed once batch_size
+        # rows are waiting or flush_interval has elapsed
+        statements = []  # (sql, rows) runs in submission order
+        pending = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                sql, params = item
+                if statements and statements[-1][0] == sql:
+                    statements[-1][1].append(params)
+                else:
+                    statements.append((sql, [params]))
+                pending += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if pending < self.batch_size:
+                    continue
+
+            if pending:
+                self.commit(conn, statements, pending)
+                statements = []
+                pending = 0
+            deadline = None
+
+            if isinstance(item, threading.Event):
+                item.set()
+                self.queue.task_done()
+            elif item is _STOP:
+                self.queue.task_done()
+                break
+
+        conn.close()
+        logger.info("Database writer stopped")
+
+    def commit(self, conn, statements, pending):
+        for attempt in range(2):
+            try:
+                with conn:
+                    for sql, rows in statements:
+                        conn.executemany(sql, rows)
+                logger.debug(f"Committed {pending} queued rows")
+                break
+            except sqlite3.Error as e:
+                logger.warning(f"Error committing {pending} queued rows (attempt {attempt + 1}): {str(e)}")
+        else:
+            # One bad row must not lose the rows of every other submitter, each one gets its own transaction
+            failed = 0
+            for sql, rows in statements:
+                for params in rows:
+                    try:
+                        with conn:
+                            conn.execute(sql, params)
+                    except sqlite3.Error as e:
+                        failed += 1
+                        logger.error(f"Error writing {params} with {sql.split()[0]}: {str(e)}")
+            logger.info(f"Committed {pending - failed} of {pending} queued rows one by one")
+        for _ in range(pending):
+            self.queue.task_done()
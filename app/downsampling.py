@@ -0,0 +1,75 @@
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> tuple[np.ndarray, np.ndarray]:
+    """Largest-Triangle-Three-Buckets downsampling of a series sorted by x, without NaN.
+
+    Keeps the first and last points and, in each of the threshold - 2 buckets in between,
+    the point forming the largest triangle with the previously kept point and the average
+    of the next bucket. Bucket bounds and averages are computed with NumPy up front, the
+    remaining loop only does one vectorized argmax per bucket.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # threshold - 2 buckets over the points 1 .. n - 2, every bucket holds at least one point
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[:n - 1], starts) / counts
+    avg_y = np.add.reduceat(y[:n - 1], starts) / counts
+    # The third vertex of a bucket is the average of the following one, or the last point
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        areas = np.abs((ax - next_x[i]) * (y[start:end] - ay) - (ax - x[start:end]) * (next_y[i] - ay))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+class SeriesBuffer:
+    """Growable x/y arrays for live plots, x and y being views of the filled part."""
+
+    def __init__(self, capacity: int = 1024):
+        self._x = np.empty(capacity, dtype=np.float64)
+        self._y = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._x[:self.size]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._y[:self.size]
+
+    def reset(self, x: np.ndarray, y: np.ndarray):
+        self.size = 0
+        self._reserve(len(x))
+        self._x[:len(x)] = x
+        self._y[:len(y)] = y
+        self.size = len(x)
+
+    def append(self, x: float, y: float):
+        self._reserve(self.size + 1)
+        self._x[self.size] = x
+        self._y[self.size] = y
+        self.size += 1
+
+    def _reserve(self, size: int):
+        if size <= len(self._x):
+            return
+        capacity = max(size, 2 * len(self._x))
+        self._x = np.concatenate([self._x[:self.size], np.empty(capacity - self.size)])
+        self._y = np.concatenate([self._y[:self.size], np.empty(capacity - self.size)])
@@ -0,0 +1,267 @@
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import zipfile
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+# Dataset columns as (name, type), type being 'int', 'float' or 'str'
+DATASETS = {
+    'mesures': [('ts', 'int'), ('latence', 'float'), ('packets_perdus', 'float'), ('upload', 'float'),
+                ('download', 'float')],
+    'latence': [('ts', 'int'), ('latence', 'float'), ('packets_perdus', 'float')],
+    'bande_passante': [('ts', 'int'), ('upload', 'float'), ('download', 'float')],
+    'interface_stats': [('ts', 'int'), ('interface', 'str'), ('bytes_sent', 'float'), ('bytes_recv', 'float'),
+                        ('packets_sent', 'float'), ('packets_recv', 'float'), ('errors', 'float'),
+                        ('drops', 'float'), ('peak_bytes_sent', 'float'), ('peak_bytes_recv', 'float')],
+    'packets': [('time', 'float'), ('length', 'int'), ('source', 'str'), ('sport', 'int'),
+                ('destination', 'str'), ('dport', 'int'), ('protocol', 'str'), ('tcp_flags', 'str')],
+    'flows': [('source', 'str'), ('sport', 'int'), ('destination', 'str'), ('dport', 'int'),
+              ('protocol', 'str'), ('first_seen', 'float'), ('last_seen', 'float'), ('packets', 'int'),
+              ('bytes', 'int')],
+}
+
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow', '.npz': 'npz'}
+
+
+def chunked(rows: Iterable, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[list]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def history_chunks(db, host_id: int, dataset: str = 'mesures', since: Optional[int] = None,
+                   until: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[list]:
+    # Each chunk is one keyset page, oldest first
+    column_indexes = {'mesures': (0, 1, 2, 3, 4), 'latence': (0, 1, 2), 'bande_passante': (0, 3, 4)}[dataset]
+    skip_column = {'latence': 1, 'bande_passante': 3}.get(dataset)
+    cursor = None
+    while True:
+        rows, cursor = db.get_history_page(host_id, since, until, chunk_size, cursor, ascending=True)
+        if skip_column is not None:
+            rows = [row for row in rows if row[skip_column] is not None]
+        if rows:
+            yield [tuple(row[i] for i in column_indexes) for row in rows]
+        if cursor is None:
+            return
+
+
+def interface_stats_chunks(db, interface: Optional[str] = None, since: Optional[int] = None,
+                           until: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[list]:
+    clauses = ['1']
+    params = []
+    if interface is not None:
+        clauses.append('interface = ?')
+        params.append(interface)
+    if since is not None:
+        clauses.append('ts >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('ts < ?')
+        params.append(until)
+    db.flush()
+    cursor = db.reader().execute(f'''
+        SELECT ts, interface, bytes_sent, bytes_recv, packets_sent, packets_recv, errors, drops,
+               peak_bytes_sent, peak_bytes_recv
+        FROM interface_stats
+        WHERE {" AND ".join(clauses)}
+        ORDER BY ts
+    ''', params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def packet_rows(packets: Iterable[dict]) -> Iterator[tuple]:
+    names = [name for name, _ in DATASETS['packets']]
+    for packet_info in packets:
+        yield tuple(packet_info.get(name) for name in names)
+
+
+def pcap_packets(path: str) -> Iterator[dict]:
+    # Streams a capture file packet by packet instead of loading it with rdpcap
+    from scapy.all import PcapReader
+    from packet_capture import packet_to_info
+    with PcapReader(path) as reader:
+        for packet in reader:
+            yield packet_to_info(packet)
+
+
+def pcap_flows(path: str) -> List[tuple]:
+    from packet_capture import update_flows, flows_to_rows
+    flows = {}
+    for packet_info in pcap_packets(path):
+        update_flows(flows, packet_info)
+    return flows_to_rows(flows)
+
+
+def format_for_path(path: str) -> str:
+    fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported export file type: {path}")
+    return fmt
+
+
+def columnar_format() -> str:
+    return 'parquet' if pa is not None else 'npz'
+
+
+def write_chunks(chunks: Iterable[list], columns: List[tuple], path: str, fmt: Optional[str] = None) -> int:
+    """Write row chunks to path and return the number of rows written."""
+    # Only one chunk is held at a time
+    fmt = fmt or format_for_path(path)
+    if fmt in ('parquet', 'arrow') and pa is None:
+        raise RuntimeError("pyarrow is required for Parquet and Arrow exports, use .npz instead")
+    writer = {'csv': _write_csv, 'parquet': _write_arrow, 'arrow': _write_arrow, 'npz': _write_npz}[fmt]
+    rows = writer(chunks, columns, path, fmt)
+    logger.info(f"Exported {rows} rows to {path} ({fmt})")
+    return rows
+
+
+def _write_csv(chunks, columns, path, fmt):
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in columns])
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+
+def _arrow_schema(columns):
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _write_arrow(chunks, columns, path, fmt):
+    schema = _arrow_schema(columns)
+    rows = 0
+    writer = pq.ParquetWriter(path, schema) if fmt == 'parquet' else pa.ipc.new_file(path, schema)
+    try:
+        for chunk in chunks:
+            arrays = [pa.array([row[i] for row in chunk], type=schema.field(i).type) for i in range(len(columns))]
+            batch = pa.record_batch(arrays, schema=schema)
+            if fmt == 'parquet':
+                writer.write_batch(batch)
+            else:
+                writer.write(batch)
+            rows += len(chunk)
+    finally:
+        writer.close()
+    return rows
+
+
+def _column_array(values, kind):
+    if kind == 'str':
+        return np.array(['' if v is None else str(v) for v in values], dtype=np.str_)
+    if kind == 'int' and None not in values:
+        return np.array(values, dtype=np.int64)
+    # Missing values become NaN, so nullable integer columns are stored as floats
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _write_npz(chunks, columns, path, fmt):
+    rows = 0
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        # Each chunk is its own set of column arrays: chunk00000/ts, chunk00000/latence...
+        for index, chunk in enumerate(chunks):
+            for i, (name, kind) in enumerate(columns):
+                array = _column_array([row[i] for row in chunk], kind)
+                with archive.open(f'chunk{index:05d}/{name}.npy', 'w', force_zip64=True) as entry:
+                    np.lib.format.write_array(entry, array, allow_pickle=False)
+            rows += len(chunk)
+    return rows
+
+
+class ExportThread(QThread):
+    export_finished = pyqtSignal(int)
+    export_failed = pyqtSignal(str)
+
+    def __init__(self, chunks_factory, columns, path, fmt=None):
+        super().__init__()
+        self.chunks_factory = chunks_factory
+        self.columns = columns
+        self.path = path
+        self.fmt = fmt
+
+    def run(self):
+        try:
+            rows = write_chunks(self.chunks_factory(), self.columns, self.path, self.fmt)
+        except (OSError, ValueError, RuntimeError, sqlite3.Error) as e:
+            logger.error(f"Export to {self.path} failed: {str(e)}")
+            self.export_failed.emit(str(e))
+        else:
+            self.export_finished.emit(rows)
+
+
+def _epoch_us(value: Optional[str]) -> Optional[int]:
+    return None if value is None else int(datetime.fromisoformat(value).timestamp() * 1_000_000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export measurements and captures for offline analysis")
+    parser.add_argument('dataset', choices=list(DATASETS))
+    parser.add_argument('output', help="Output file (.csv, .parquet, .arrow or .npz)")
+    parser.add_argument('--db', default='network_monitor.db')
+    parser.add_argument('--host', help="Host name, for mesures, latence and bande_passante")
+    parser.add_argument('--interface', help="Interface name, for interface_stats")
+    parser.add_argument('--pcap', help="Capture file, for packets and flows")
+    parser.add_argument('--since', help="ISO date, e.g. 2025-01-31T00:00")
+    parser.add_argument('--until', help="ISO date")
+    parser.add_argument('--format', choices=['csv', 'parquet', 'arrow', 'npz'])
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    columns = DATASETS[args.dataset]
+    since, until = _epoch_us(args.since), _epoch_us(args.until)
+    if args.dataset in ('packets', 'flows'):
+        if not args.pcap:
+            parser.error("--pcap is required for packets and flows")
+        rows = packet_rows(pcap_packets(args.pcap)) if args.dataset == 'packets' else pcap_flows(args.pcap)
+        chunks = chunked(rows, args.chunk_size)
+        db = None
+    else:
+        from models import Database
+        db = Database(args.db, retention_days=None)
+        if args.dataset == 'interface_stats':
+            chunks = interface_stats_chunks(db, args.interface, since, until, args.chunk_size)
+        else:
+            host = next((h for h in db.get_hosts() if h.name == args.host), None)
+            if host is None:
+                db.close()
+                parser.error(f"Unknown host: {args.host}")
+            chunks = history_chunks(db, host.id, args.dataset, since, until, args.chunk_size)
+    try:
+        write_chunks(chunks, columns, args.output, args.format)
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+    finally:
+        if db is not None:
+            db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import csv
+import ipaddress
+import json
+import logging
+import socket
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+import numpy as np
+from models import now_us
+
+logger = logging.getLogger(__name__)
+
+# Fields of the record kept for each range, per kind
+RECORD_FIELDS = {
+    'location': ('country', 'region', 'city', 'latitude', 'longitude'),
+    'asn': ('asn', 'organization'),
+}
+
+# Layout of the free range files: format -> (kind, column names, None for the ignored ones)
+FORMATS = {
+    'dbip-city': ('location', ('start', 'end', None, 'country', 'region', 'city', 'latitude', 'longitude')),
+    'dbip-asn': ('asn', ('start', 'end', 'asn', 'organization')),
+    'ip2location': ('location', ('start', 'end', 'country', None, 'region', 'city', 'latitude', 'longitude')),
+    'ip2location-asn': ('asn', ('start', 'end', None, 'asn', 'organization')),
+}
+
+UPSERT = '''
+    INSERT INTO geoip_ranges (kind, source, imported, starts, ends, record_ids, records) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (kind) DO UPDATE SET source = excluded.source, imported = excluded.imported, starts = excluded.starts,
+                                     ends = excluded.ends, record_ids = excluded.record_ids, records = excluded.records
+'''
+
+
+def ip_to_int(value: str) -> Optional[int]:
+    """IPv4 address or integer as found in range files, None for IPv6."""
+    if value.isdigit():
+        return int(value)
+    try:
+        return struct.unpack('!I', socket.inet_aton(value))[0]
+    except OSError:
+        return None
+
+
+def _uint32_array(data: bytes) -> array:
+    values = array('I')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _uint32_bytes(values: np.ndarray) -> bytes:
+    return values.astype('<u4').tobytes()
+
+
+class RangeTable:
+    """Non-overlapping IPv4 ranges sorted by start, each pointing to one of a list of distinct records."""
+
+    def __init__(self, starts: array, ends: array, record_ids: array, records: list):
+        self.starts = starts
+        self.ends = ends
+        self.record_ids = record_ids
+        self.records = records
+        # Views over the same memory for bulk lookups
+        self.starts_np = np.frombuffer(starts, dtype=np.uint32)
+        self.ends_np = np.frombuffer(ends, dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, address: int) -> Optional[tuple]:
+        index = bisect_right(self.starts, address) - 1
+        if index >= 0 and address <= self.ends[index]:
+            return self.records[self.record_ids[index]]
+        return None
+
+    def find_many(self, addresses: np.ndarray) -> list:
+        indexes = np.searchsorted(self.starts_np, addresses, side='right') - 1
+        found = (indexes >= 0) & (addresses <= self.ends_np[np.maximum(indexes, 0)])
+        return [self.records[self.record_ids[index]] if hit else None
+                for index, hit in zip(indexes.tolist(), found.tolist())]
+
+
+class GeoIPDatabase:
+    """Offline country/city and ASN lookups from range files imported into the geoip_ranges table."""
+
+    def __init__(self, db, cache_size: int = 65536):
+        self.db = db
+        self.tables = {}
+        self.lock = threading.Lock()
+        # A lookup is a bisect over the range starts of each kind, lookup_many() one searchsorted per kind
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def table(self, kind: str) -> Optional[RangeTable]:
+        with self.lock:
+            if kind not in self.tables:
+                self.db.flush()
+                row = self.db.reader().execute(
+                    'SELECT starts, ends, record_ids, records FROM geoip_ranges WHERE kind = ?', (kind,)).fetchone()
+                self.tables[kind] = None if row is None else RangeTable(
+                    _uint32_array(row[0]), _uint32_array(row[1]), _uint32_array(row[2]),
+                    [tuple(record) for record in json.loads(row[3])])
+                if row is not None:
+                    logger.info(f"Loaded {len(self.tables[kind])} GeoIP {kind} ranges")
+            return self.tables[kind]
+
+    def available(self) -> bool:
+        return any(self.table(kind) is not None for kind in RECORD_FIELDS)
+
+    def import_csv(self, path: str, fmt: str) -> int:
+        """Replace the ranges of the format's kind with the IPv4 rows of a CSV file, return their count."""
+        kind, columns = FORMATS[fmt]
+        fields = RECORD_FIELDS[kind]
+        starts, ends, record_ids = [], [], []
+        record_index = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) < len(columns):
+                    continue
+                values = {name: value for name, value in zip(columns, row) if name}
+                start, end = ip_to_int(values['start']), ip_to_int(values['end'])
+                if start is None or end is None:
+                    continue
+                record = tuple(self._field(name, values.get(name, '')) for name in fields)
+                starts.append(start)
+                ends.append(end)
+                record_ids.append(record_index.setdefault(record, len(record_index)))
+        if not starts:
+            raise ValueError(f"No IPv4 range found in {path} ({fmt})")
+
+        order = np.argsort(np.array(starts, dtype=np.uint32), kind='stable')
+        self.db.writer.submit(UPSERT, (
+            kind, f"{fmt}:{path}", now_us(),
+            _uint32_bytes(np.array(starts, dtype=np.uint32)[order]),
+            _uint32_bytes(np.array(ends, dtype=np.uint32)[order]),
+            _uint32_bytes(np.array(record_ids, dtype=np.uint32)[order]),
+            json.dumps(list(record_index))))
+        self.db.flush()
+        with self.lock:
+            self.tables.pop(kind, None)
+        self.lookup.cache_clear()
+        logger.info(f"Imported {len(starts)} GeoIP {kind} ranges, {len(record_index)} distinct, from {path}")
+        return len(starts)
+
+    @staticmethod
+    def _field(name, value):
+        value = value.strip()
+        if name in ('latitude', 'longitude'):
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        if name == 'asn':
+            digits = value.upper().removeprefix('AS')
+            return int(digits) if digits.isdigit() else None
+        return value if value and value != '-' else None
+
+    def _lookup(self, ip: str) -> dict:
+        address = ip_to_int(ip) if ip else None
+        if address is None:
+            return {}
+        return self._merge([(kind, table.find(address)) for kind, table in self._tables()])
+
+    def lookup_many(self, ips: Iterable[str]) -> Dict[str, dict]:
+        """{ip: lookup(ip)} for many addresses at once, the per-address cache is bypassed."""
+        ips = list(dict.fromkeys(ips))
+        addresses = {ip: ip_to_int(ip) for ip in ips if ip}
+        valid = [ip for ip, address in addresses.items() if address is not None]
+        found = {ip: [] for ip in valid}
+        if valid:
+            values = np.array([addresses[ip] for ip in valid], dtype=np.uint32)
+            for kind, table in self._tables():
+                for ip, record in zip(valid, table.find_many(values)):
+                    found[ip].append((kind, record))
+        return {ip: self._merge(found.get(ip, [])) for ip in ips}
+
+    def _tables(self):
+        return [(kind, table) for kind in RECORD_FIELDS if (table := self.table(kind)) is not None]
+
+    @staticmethod
+    def _merge(records) -> dict:
+        info = {}
+        for kind, record in records:
+            if record is not None:
+                info.update((name, value) for name, value in zip(RECORD_FIELDS[kind], record) if value is not None)
+        return info
+
+
+def describe_location(info: dict) -> str:
+    """Short text for a table cell or a node label, e.g. "FR Paris, AS3215 Orange"."""
+    place = ' '.join(part for part in (info.get('country'), info.get('city')) if part)
+    network = f"AS{info['asn']} {info.get('organization') or ''}".strip() if info.get('asn') else ''
+    return ', '.join(part for part in (place, network) if part)
+
+
+def is_public(ip: str) -> bool:
+    try:
+        return ipaddress.ip_address(ip).is_global
+    except ValueError:
+        return False
+
+
+def main():
+    from models import Database
+    parser = argparse.ArgumentParser(description="Import and query the offline GeoIP/ASN database")
+    parser.add_argument('--db', default='network_monitor.db')
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help="Import a range CSV file (DB-IP or IP2Location LITE)")
+    importer.add_argument('path')
+    importer.add_argument('--format', choices=list(FORMATS), required=True)
+    lookup = commands.add_parser('lookup', help="Look addresses up")
+    lookup.add_argument('ips', nargs='+')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    db = Database(args.db, retention_days=None)
+    try:
+        geoip = GeoIPDatabase(db)
+        if args.command == 'import':
+            try:
+                geoip.import_csv(args.path, args.format)
+            except (OSError, ValueError) as e:
+                parser.error(str(e))
+        else:
+            for ip, info in geoip.lookup_many(args.ips).items():
+                print(f"{ip:<16} {describe_location(info) or '-'}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,121 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QStyle, QAbstractItemView, QDialog
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QTableView, QHeaderView, QStyle,
+                             QAbstractItemView, QDialog, QPushButton, QFileDialog, QMessageBox, QGroupBox,
+                             QLabel, QComboBox)
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
 from PyQt5.QtGui import QIcon, QPalette, QColor
 import pyqtgraph as pg
 import logging
 from datetime import datetime
-import numpy as np
+from downsampling import SeriesBuffer, lttb
+from export import DATASETS, ExportThread, history_chunks, format_for_path
 
 logger = logging.getLogger(__name__)
 
+HISTORY_HEADERS = ["Date", "Latence (ms)", "Paquets perdus (%)", "Upload (Mbps)", "Download (Mbps)"]
+HISTORY_METRICS = [None, "latence", "packets_perdus", "upload", "download"]
+STATISTICS_RANGES = [("Dernière heure", 3600), ("24 heures", 86400), ("7 jours", 7 * 86400),
+                     ("30 jours", 30 * 86400), ("Tout", None)]
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """History of one host, fetched page by page as the view scrolls."""
+
+    def __init__(self, db, host_id, style, page_size=500):
+        super().__init__()
+        self.db = db
+        self.host_id = host_id
+        self.page_size = page_size
+        # Raw (ts, latence, packets_perdus, upload, download) tuples, only formatted for visible cells
+        self.rows = []
+        self.cursor = None
+        self.exhausted = False
+        # One icon per column, shared by every cell of that column
+        self.icons = [None] + [style.standardIcon(icon) for icon in (
+            QStyle.SP_ArrowRight, QStyle.SP_MessageBoxWarning, QStyle.SP_ArrowUp, QStyle.SP_ArrowDown)]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HISTORY_HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HISTORY_HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self.rows[index.row()][index.column()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return datetime.fromtimestamp(value / 1_000_000).strftime("%Y-%m-%d %H:%M:%S")
+            return f"{value:.2f}" if value is not None else "N/A"
+        if role == Qt.DecorationRole:
+            return self.icons[column]
+        if role == Qt.TextAlignmentRole and column > 0:
+            return Qt.AlignCenter
+        return None
+
+    def value(self, row, column):
+        return self.rows[row][column]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        page, self.cursor = self.db.get_history_page(self.host_id, limit=self.page_size, cursor=self.cursor)
+        self.exhausted = self.cursor is None
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    def reload(self):
+        self.beginResetModel()
+        self.rows = []
+        self.cursor = None
+        self.exhausted = False
+        self.endResetModel()
+
+
 class HistoryWindow(QWidget):
-    def __init__(self, db, host_name):
+    def __init__(self, db, host):
         super().__init__()
         self.db = db
-        self.host_name = host_name
+        self.host_id = host.id
+        self.host_name = host.name
         self.init_ui()
         self.load_history()
+        self.update_statistics()
+        # Statistics are recomputed once measurements stop arriving for a moment
+        self.statistics_timer = QTimer(self)
+        self.statistics_timer.setSingleShot(True)
+        self.statistics_timer.setInterval(1000)
+        self.statistics_timer.timeout.connect(self.update_statistics)
+        self.db.add_listener(self.on_measurement)
 
     def init_ui(self):
         layout = QVBoxLayout()
-        self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(["Date", "Latence (ms)", "Paquets perdus (%)", "Upload (Mbps)", "Download (Mbps)"])
+        self.model = HistoryTableModel(self.db, self.host_id, self.style())
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        # Fixed row heights let the view skip measuring every fetched row
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.cellClicked.connect(self.cell_clicked)
+        self.table.clicked.connect(self.cell_clicked)
         layout.addWidget(self.table)
+        layout.addWidget(self.create_statistics_group())
+        self.export_button = QPushButton("Exporter")
+        self.export_button.setIcon(self.style().standardIcon(QStyle.SP_DialogSaveButton))
+        self.export_button.clicked.connect(self.export_history)
+        layout.addWidget(self.export_button)
         self.setLayout(layout)
+        self.export_thread = None
         self.setWindowIcon(QIcon('icons/history.png'))
 
         self.setWindowTitle("Historique")
@@ -38,6 +129,58 @@ class HistoryWindow(QWidget):
         self.setPalette(palette)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
 
+    def create_statistics_group(self):
+        group = QGroupBox("Statistiques")
+        layout = QVBoxLayout()
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(QLabel("Période:"))
+        self.range_combo = QComboBox()
+        for label, seconds in STATISTICS_RANGES:
+            self.range_combo.addItem(label, seconds)
+        self.range_combo.setCurrentIndex(1)
+        self.range_combo.currentIndexChanged.connect(self.update_statistics)
+        range_layout.addWidget(self.range_combo)
+        range_layout.addStretch()
+        layout.addLayout(range_layout)
+
+        grid = QGridLayout()
+        self.statistics_labels = {}
+        rows = [("availability", "Disponibilité"), ("loss_rate", "Taux de perte"),
+                ("latency", "Latence moy. / p50 / p95 / p99"), ("upload", "Upload p5 / p50 / p95"),
+                ("download", "Download p5 / p50 / p95")]
+        for row, (key, text) in enumerate(rows):
+            grid.addWidget(QLabel(text), row, 0)
+            self.statistics_labels[key] = QLabel("--")
+            grid.addWidget(self.statistics_labels[key], row, 1)
+        layout.addLayout(grid)
+        group.setLayout(layout)
+        return group
+
+    def update_statistics(self):
+        statistics = self.db.get_statistics(self.host_id, self.range_combo.currentData())
+
+        def fmt(values, unit):
+            return " / ".join("--" if v is None else f"{v:.2f}" for v in values) + f" {unit}"
+
+        availability = statistics['availability']
+        loss_rate = statistics['loss_rate']
+        latency, upload, download = statistics['latency'], statistics['upload'], statistics['download']
+        labels = self.statistics_labels
+        labels['availability'].setText("--" if availability is None else
+                                       f"{availability:.2f} % ({statistics['runs']} mesures)")
+        labels['loss_rate'].setText("--" if loss_rate is None else f"{loss_rate:.2f} %")
+        labels['latency'].setText(fmt((latency['mean'], latency['p50'], latency['p95'], latency['p99']), "ms"))
+        labels['upload'].setText(fmt((upload['p5'], upload['p50'], upload['p95']), "Mbps"))
+        labels['download'].setText(fmt((download['p5'], download['p50'], download['p95']), "Mbps"))
+
+    def on_measurement(self, host_id, ts, values):
+        if host_id == self.host_id:
+            self.statistics_timer.start()
+
+    def closeEvent(self, event):
+        self.db.remove_listener(self.on_measurement)
+        super().closeEvent(event)
+
     def apply_styles(self):
         self.setStyleSheet("""
             QMainWindow {
@@ -72,7 +215,7 @@ class HistoryWindow(QWidget):
             QPushButton:pressed {
                 background-color: #2573a7;
             }
-            QTableWidget {
+            QTableView {
                 gridline-color: #d3d3d3;
                 background-color: #ffffff;
                 border: 1px solid #3498db;
@@ -103,156 +246,140 @@ class HistoryWindow(QWidget):
 
     def load_history(self):
         logger.info(f"Loading history for host: {self.host_name}")
-        host_id = self.db.get_host_id(self.host_name)
-        if host_id is None:
-            logger.warning(f"No host found with name: {self.host_name}")
+        self.model.reload()
+        if self.model.canFetchMore():
+            self.model.fetchMore()
+        logger.info(f"Loaded first {self.model.rowCount()} historical records for {self.host_name}")
+
+    def export_history(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Exporter l'historique", f"{self.host_name}.csv",
+                                              "CSV (*.csv);;Parquet (*.parquet);;Arrow IPC (*.arrow);;NumPy (*.npz)")
+        if not path:
             return
-
-        latency_data = self.db.get_latency_history(host_id)
-        bandwidth_data = self.db.get_bandwidth_history(host_id)
-
-        combined_data = {}
-        for date, latency, packets_lost in latency_data:
-            combined_data[date] = [latency, packets_lost, None, None]
-        for date, upload, download in bandwidth_data:
-            if date in combined_data:
-                combined_data[date][2:] = [upload, download]
-            else:
-                combined_data[date] = [None, None, upload, download]
-
-        sorted_data = sorted(combined_data.items(), key=lambda x: x[0], reverse=True)
-
-        self.table.setRowCount(len(sorted_data))
-        for row, (date, data) in enumerate(sorted_data):
-            self.table.setItem(row, 0, QTableWidgetItem(date))
-            for col, value in enumerate(data, start=1):
-                item = QTableWidgetItem(f"{value:.2f}" if value is not None else "N/A")
-                item.setTextAlignment(Qt.AlignCenter)
-                if col == 1:  # Latence
-                    item.setIcon(self.style().standardIcon(QStyle.SP_ArrowRight))
-                elif col == 2:  # Paquets perdus
-                    item.setIcon(self.style().standardIcon(QStyle.SP_MessageBoxWarning))
-                elif col == 3:  # Upload
-                    item.setIcon(self.style().standardIcon(QStyle.SP_ArrowUp))
-                elif col == 4:  # Download
-                    item.setIcon(self.style().standardIcon(QStyle.SP_ArrowDown))
-                self.table.setItem(row, col, item)
-
-        logger.info(f"Loaded {len(sorted_data)} historical records for {self.host_name}")
-
-    def cell_clicked(self, row, column):
+        try:
+            format_for_path(path)
+        except ValueError as e:
+            QMessageBox.warning(self, "Erreur", str(e))
+            return
+        self.export_button.setEnabled(False)
+        self.export_thread = ExportThread(lambda: history_chunks(self.db, self.host_id), DATASETS['mesures'], path)
+        self.export_thread.export_finished.connect(self.on_export_finished)
+        self.export_thread.export_failed.connect(self.on_export_failed)
+        self.export_thread.start()
+
+    def on_export_finished(self, rows):
+        self.export_button.setEnabled(True)
+        QMessageBox.information(self, "Export", f"{rows} mesures exportées.")
+
+    def on_export_failed(self, error):
+        self.export_button.setEnabled(True)
+        QMessageBox.warning(self, "Erreur", f"Export impossible: {error}")
+
+    def cell_clicked(self, index):
+        column = index.column()
         if column == 0:  # Date column
             return
 
-        value = self.table.item(row, column).text()
-        
-        if value == "N/A":
+        if self.model.value(index.row(), column) is None:
             return
 
-        column_names = ["Date", "Latence", "Paquets perdus", "Upload", "Download"]
-        column_name = column_names[column]
-
-
-        
         self.plot_curve(column)
 
     def plot_curve(self, column):
-        dates = []
-        values = []
-        for row in range(self.table.rowCount()):
-            date_item = self.table.item(row, 0)
-            value_item = self.table.item(row, column)
-            if date_item and value_item and value_item.text() != "N/A":
-                dates.append(date_item.text())
-                values.append(float(value_item.text()))
-
-        dates.reverse()
-        values.reverse()
-
-        plot_window = PlotWindow(self, column, dates, values)
+        plot_window = PlotWindow(self, self.db, self.host_id, column)
         plot_window.show()
 
 class PlotWindow(QDialog):
-    def __init__(self, parent, column, dates, values, scale_minutes=1):
+    """Plot of one metric, downsampled to the plot width with LTTB."""
+    MAX_QUERY_POINTS = 20_000
+    REFRESH_MS = 500
+
+    def __init__(self, parent, db, host_id, column):
         super().__init__(parent)
-        self.setWindowTitle(f"Courbe - {parent.table.horizontalHeaderItem(column).text()}")
+        self.db = db
+        self.host_id = host_id
+        self.metric = HISTORY_METRICS[column]
+        self.setWindowTitle(f"Courbe - {HISTORY_HEADERS[column]}")
         self.setMinimumSize(800, 600)
 
         layout = QVBoxLayout()
-        plot_widget = pg.PlotWidget()
-        plot_widget.setBackground('k')  # fond noir
-        plot_widget.showGrid(x=True, y=True, alpha=0.3)
-        layout.addWidget(plot_widget)
+        self.plot_widget = pg.PlotWidget(axisItems={'bottom': pg.DateAxisItem(orientation='bottom')})
+        self.plot_widget.setBackground('k')  # fond noir
+        self.plot_widget.showGrid(x=True, y=True, alpha=0.3)
+        self.plot_widget.setLabel('left', HISTORY_HEADERS[column])
+        self.plot_widget.getAxis('bottom').setTickFont(pg.QtGui.QFont('Arial', 8))
+        layout.addWidget(self.plot_widget)
         self.setLayout(layout)
 
-        # Convert dates to timestamps for plotting
-        timestamps = []
-        for date in dates:
-            try:
-                dt = datetime.strptime(date, "%Y-%m-%d %H:%M:%S.%f")
-            except ValueError:
-                try:
-                    dt = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
-                except ValueError:
-                    try:
-                        dt = datetime.strptime(date, "%Y-%m-%d")
-                    except ValueError:
-                        print(f"Could not parse date: {date}")
-                        continue
-            timestamps.append(dt.timestamp())
-
-        # Plot the data
-        plot_widget.plot(x=timestamps, y=values, pen=pg.mkPen(color=(52, 152, 219), width=2))
-
-        plot_widget.setLabel('left', parent.table.horizontalHeaderItem(column).text())
-        plot_widget.setLabel('bottom', f'Date and Time ({scale_minutes}-minute intervals)')
-
-        # Customize x-axis
-        ax = plot_widget.getAxis('bottom')
-        ax.setStyle(tickTextOffset=10)
-
-        # Create a function to format dates based on the scale
-        def timestamp_to_str(timestamp):
-            dt = datetime.fromtimestamp(timestamp)
-            if scale_minutes < 60:
-                return dt.strftime("%Y-%m-%d %H:%M")
-            elif scale_minutes < 1440:  # Less than a day
-                return dt.strftime("%Y-%m-%d %H:00")
-            else:
-                return dt.strftime("%Y-%m-%d")
-
-        # Select ticks and set labels
-        ticks = self.select_ticks(timestamps, scale_minutes)
-        ax.setTicks([[(ts, timestamp_to_str(ts)) for ts in ticks]])
-
-        # Rotate x-axis labels for better readability
-        ax.setTickFont(pg.QtGui.QFont('Arial', 8))
-       
-
-        # Set tick spacing based on the scale
-        tick_spacing = scale_minutes * 60  # Convert minutes to seconds
-        ax.setTickSpacing(major=tick_spacing, minor=tick_spacing/2)
-
-        # Adjust the view range to show all data points
-        plot_widget.setXRange(min(timestamps), max(timestamps))
-
-    def select_ticks(self, timestamps, scale_minutes):
-        """Select ticks at regular intervals based on the scale, ensuring start and end are included."""
-        if len(timestamps) <= 20:
-            return timestamps
-        
-        start = min(timestamps)
-        end = max(timestamps)
-        duration = end - start
-        
-        # Aim for about 20 ticks, but respect the minimum scale
-        interval = max(duration / 19, scale_minutes * 60)
-        
-        ticks = [start]
-        current = start + interval
-        while current < end:
-            ticks.append(current)
-            current += interval
-        ticks.append(end)
-        
-        return ticks
\ No newline at end of file
+        self.curve = self.plot_widget.plot(pen=pg.mkPen(color=(52, 152, 219), width=2))
+        self.buffer = SeriesBuffer()
+        # While the view reaches the present, new measurements are appended and redrawn at most every REFRESH_MS
+        self.live = False
+        self.full_range = False
+        self.dirty = False
+        view_box = self.plot_widget.getViewBox()
+        view_box.setAutoVisible(y=True)
+
+        # Zoom and pan fire many range changes, only reload once they stop
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(200)
+        self.reload_timer.timeout.connect(self.load_visible_range)
+        view_box.sigXRangeChanged.connect(self.reload_timer.start)
+
+        # X auto range stays on until the user zooms, so live points scroll into view
+        self.load_range(None, None)
+        self.reload_timer.stop()
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(self.REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start()
+        self.db.add_listener(self.on_measurement)
+
+    def target_points(self):
+        # About two points per horizontal pixel, LTTB keeps the visual shape at that density
+        return max(100, 2 * int(self.plot_widget.getViewBox().width()))
+
+    def load_range(self, since, until):
+        resolution, series = self.db.get_series_arrays(self.host_id, self.metric, since, until,
+                                                       max_points=self.MAX_QUERY_POINTS)
+        x, y = lttb(series['ts'] / 1_000_000, series['mean'], self.target_points())
+        self.buffer.reset(x, y)
+        self.full_range = since is None and until is None
+        self.live = until is None
+        self.curve.setData(self.buffer.x, self.buffer.y)
+        self.dirty = False
+        self.plot_widget.setLabel('bottom', f"Date ({resolution})")
+        logger.info(f"Plotting {len(x)} of {len(series)} {self.metric} points at {resolution} resolution")
+
+    def load_visible_range(self):
+        view_box = self.plot_widget.getViewBox()
+        if view_box.autoRangeEnabled()[0]:
+            # Auto range follows the data, it only needs the whole series once
+            if not self.full_range:
+                self.load_range(None, None)
+            return
+        start, end = view_box.viewRange()[0]
+        # Load half a screen on each side so short pans do not show empty edges
+        margin = (end - start) / 2
+        following = self.buffer.size == 0 or end >= self.buffer.x[-1]
+        self.load_range(int((start - margin) * 1_000_000), None if following else int((end + margin) * 1_000_000))
+
+    def on_measurement(self, host_id, ts, values):
+        value = values.get(self.metric)
+        if not self.live or host_id != self.host_id or value is None:
+            return
+        # Only buffered here, the refresh timer caps how often the curve is redrawn
+        self.buffer.append(ts / 1_000_000, value)
+        self.dirty = True
+
+    def refresh(self):
+        if self.dirty:
+            self.curve.setData(self.buffer.x, self.buffer.y)
+            self.dirty = False
+
+    def done(self, result):
+        self.refresh_timer.stop()
+        self.db.remove_listener(self.on_measurement)
+        super().done(result)
@@ -0,0 +1,276 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+import time
+from typing import AsyncIterator, Callable, Optional
+import psutil
+from PyQt5.QtCore import QThread, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+TCP_PROBE_PORTS = (80, 443, 22, 445, 3389)
+
+
+def local_network(ip_range: str) -> Optional[str]:
+    """Name of the interface whose IPv4 subnet contains ip_range, None if it is not on-link."""
+    network = ipaddress.ip_network(ip_range, strict=False)
+    for nic, addresses in psutil.net_if_addrs().items():
+        for address in addresses:
+            if address.family != socket.AF_INET or not address.netmask:
+                continue
+            subnet = ipaddress.ip_network(f"{address.address}/{address.netmask}", strict=False)
+            if not subnet.is_loopback and network.subnet_of(subnet):
+                return nic
+    return None
+
+
+class ArpProber:
+    """Broadcasts ARP who-has requests from a prebuilt frame, only the target address is patched per probe."""
+    name = 'ARP'
+
+    def __init__(self, iface: str):
+        self.iface = iface
+
+    async def start(self, on_reply: Callable[[str, Optional[str]], None]):
+        from scapy.all import conf, AsyncSniffer, Ether, ARP
+        loop = asyncio.get_running_loop()
+        self.socket = conf.L2socket(iface=self.iface)
+        self.template = bytearray(bytes(Ether(dst='ff:ff:ff:ff:ff:ff') / ARP(pdst='0.0.0.0')))
+        self.sniffer = AsyncSniffer(iface=self.iface, filter='arp', store=False,
+                                    prn=lambda p: p.haslayer(ARP) and p[ARP].op == 2 and
+                                    loop.call_soon_threadsafe(on_reply, p[ARP].psrc, p[ARP].hwsrc))
+        self.sniffer.start()
+
+    def send(self, ip: str):
+        # The ARP target protocol address is the last field of the frame (bytes 38 to 42)
+        self.template[38:42] = socket.inet_aton(ip)
+        self.socket.send(bytes(self.template))
+
+    async def drain(self):
+        pass
+
+    async def stop(self):
+        self.sniffer.stop()
+        self.socket.close()
+
+
+class IcmpProber:
+    """ICMP echo requests tagged with our own identifier, so other pings on the host are ignored."""
+    name = 'ICMP'
+
+    async def start(self, on_reply: Callable[[str, Optional[str]], None]):
+        from scapy.all import conf, AsyncSniffer, IP, ICMP
+        loop = asyncio.get_running_loop()
+        self.ident = os.getpid() & 0xFFFF
+        self.socket = conf.L3socket()
+        self.sniffer = AsyncSniffer(filter='icmp[icmptype] = icmp-echoreply', store=False,
+                                    prn=lambda p: p.haslayer(ICMP) and p[ICMP].id == self.ident and
+                                    loop.call_soon_threadsafe(on_reply, p[IP].src, None))
+        self.sniffer.start()
+        self.sequence = 0
+
+    def send(self, ip: str):
+        from scapy.all import IP, ICMP
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        self.socket.send(IP(dst=ip) / ICMP(id=self.ident, seq=self.sequence))
+
+    async def drain(self):
+        pass
+
+    async def stop(self):
+        self.sniffer.stop()
+        self.socket.close()
+
+
+class TcpProber:
+    """Unprivileged fallback: a TCP connect that is accepted or refused means the host is up."""
+    name = 'TCP'
+
+    def __init__(self, ports=TCP_PROBE_PORTS, timeout: float = 1.0, max_connections: int = 512):
+        self.ports = ports
+        self.timeout = timeout
+        self.max_connections = max_connections
+
+    async def start(self, on_reply: Callable[[str, Optional[str]], None]):
+        self.on_reply = on_reply
+        self.connections = asyncio.Semaphore(self.max_connections)
+        self.tasks = set()
+
+    def send(self, ip: str):
+        task = asyncio.ensure_future(self._probe(ip))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _probe(self, ip):
+        for port in self.ports:
+            async with self.connections:
+                try:
+                    _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.timeout)
+                    writer.close()
+                except ConnectionRefusedError:
+                    pass
+                except (OSError, asyncio.TimeoutError):
+                    continue
+            self.on_reply(ip, None)
+            return
+
+    async def drain(self):
+        # Probes still connecting would otherwise answer after the sweep has ended
+        if self.tasks:
+            await asyncio.wait(list(self.tasks))
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+def default_prober(ip_range: str, method: str = 'auto'):
+    """ARP on a local subnet, ICMP otherwise, TCP connect when raw sockets are not allowed."""
+    iface = local_network(ip_range)
+    if method == 'auto':
+        method = 'arp' if iface else 'icmp'
+    if method in ('arp', 'icmp'):
+        try:
+            from scapy.all import conf
+            conf.L3socket().close()
+        except (OSError, ImportError) as e:
+            logger.warning(f"Raw sockets unavailable ({str(e)}), falling back to TCP connect probes")
+            return TcpProber()
+    if method == 'arp' and iface:
+        return ArpProber(iface)
+    if method in ('arp', 'icmp'):
+        return IcmpProber()
+    return TcpProber()
+
+
+class HostDiscovery:
+    """Paced host sweep: probes leave at most `rate` per second and answers are yielded as they come."""
+
+    def __init__(self, prober, rate: float = 1000.0, timeout: float = 1.0, retries: int = 1,
+                 resolve_names: bool = True):
+        # Only sends probes and reports replies, the same sweep runs over ARP, ICMP, TCP or a simulated network
+        self.prober = prober
+        self.rate = rate
+        self.timeout = timeout
+        self.retries = retries
+        self.resolve_names = resolve_names
+        self.sent = 0
+        self.total = 0
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    async def sweep(self, ip_range: str) -> AsyncIterator[dict]:
+        network = ipaddress.ip_network(ip_range, strict=False)
+        targets = [str(ip) for ip in (network.hosts() if network.num_addresses > 2 else network)]
+        wanted = set(targets)
+        found = set()
+        results = asyncio.Queue()
+        pending_names = set()
+        loop = asyncio.get_running_loop()
+        self.total = len(targets) * (self.retries + 1)
+        self.sent = 0
+
+        def on_reply(ip, mac):
+            if ip not in wanted or ip in found:
+                return
+            found.add(ip)
+            host = {'ip': ip, 'hostname': '', 'status': 'Up', 'adresse_mac': mac or 'N/A'}
+            if self.resolve_names:
+                task = loop.create_task(self._resolve(host, results))
+                pending_names.add(task)
+                task.add_done_callback(pending_names.discard)
+            else:
+                results.put_nowait(host)
+
+        async def send_all():
+            started = time.monotonic()
+            for attempt in range(self.retries + 1):
+                if self.stopped:
+                    break
+                for ip in targets:
+                    if self.stopped:
+                        break
+                    if ip in found:
+                        self.total -= 1
+                        continue
+                    self.prober.send(ip)
+                    self.sent += 1
+                    # Pace against the start time so sleep granularity does not lower the rate
+                    delay = started + self.sent / self.rate - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await self.prober.drain()
+                await asyncio.sleep(self.timeout)
+            if pending_names:
+                await asyncio.wait(list(pending_names))
+            results.put_nowait(None)
+
+        await self.prober.start(on_reply)
+        sender = loop.create_task(send_all())
+        try:
+            while True:
+                host = await results.get()
+                if host is None:
+                    break
+                yield host
+        finally:
+            sender.cancel()
+            await self.prober.stop()
+            logger.info(f"Discovery of {ip_range} finished: {len(found)} hosts up, {self.sent} probes sent")
+
+    async def _resolve(self, host, results):
+        try:
+            name, _ = await asyncio.wait_for(asyncio.get_running_loop().getnameinfo((host['ip'], 0)), 1.0)
+            if name != host['ip']:
+                host['hostname'] = name
+        except (OSError, asyncio.TimeoutError):
+            pass
+        results.put_nowait(host)
+
+
+class DiscoveryThread(QThread):
+    host_found = pyqtSignal(dict)
+    progress = pyqtSignal(int, int)
+    error = pyqtSignal(str)
+
+    def __init__(self, ip_range: str, method: str = 'auto', rate: float = 1000.0, resolve_names: bool = True):
+        super().__init__()
+        self.ip_range = ip_range
+        self.method = method
+        self.rate = rate
+        self.resolve_names = resolve_names
+        self.discovery = None
+
+    def run(self):
+        logger.info(f"Starting {self.method} discovery of {self.ip_range} at {self.rate} probes/s")
+        try:
+            asyncio.run(self._run())
+        except (OSError, ValueError) as e:
+            logger.error(f"Discovery of {self.ip_range} failed: {str(e)}")
+            self.error.emit(str(e))
+
+    async def _run(self):
+        self.discovery = HostDiscovery(default_prober(self.ip_range, self.method), rate=self.rate,
+                                       resolve_names=self.resolve_names)
+        reporter = asyncio.get_running_loop().create_task(self._report_progress())
+        try:
+            async for host in self.discovery.sweep(self.ip_range):
+                self.host_found.emit(host)
+        finally:
+            reporter.cancel()
+            self.progress.emit(self.discovery.total, self.discovery.total)
+
+    async def _report_progress(self):
+        while True:
+            self.progress.emit(self.discovery.sent, self.discovery.total)
+            await asyncio.sleep(0.5)
+
+    def stop(self):
+        if self.discovery is not None:
+            self.discovery.stop()
+        self.wait()
@@ -0,0 +1,61 @@
+import logging
+from typing import List, Optional
+from PyQt5.QtCore import QObject, pyqtSignal
+from models import Host
+
+logger = logging.getLogger(__name__)
+
+
+class HostRegistry(QObject):
+    """In-memory view of the hosts table, indexed by id, name and IP."""
+    hosts_changed = pyqtSignal()
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self._by_id = {}
+        self._by_name = {}
+        self._by_ip = {}
+        self.reload()
+
+    def reload(self):
+        self._index(self.db.get_hosts())
+        logger.info(f"Host registry loaded {len(self._by_id)} hosts")
+
+    def _index(self, hosts: List[Host]):
+        by_id = {host.id: host for host in hosts}
+        by_name = {host.name: host for host in hosts}
+        by_ip = {host.ip: host for host in hosts}
+        # Swapped in at once, lookups from worker threads never see a half-updated registry
+        self._by_id, self._by_name, self._by_ip = by_id, by_name, by_ip
+        self.hosts_changed.emit()
+
+    def hosts(self) -> List[Host]:
+        return list(self._by_id.values())
+
+    def get(self, host_id: int) -> Optional[Host]:
+        return self._by_id.get(host_id)
+
+    def by_name(self, name: str) -> Optional[Host]:
+        return self._by_name.get(name)
+
+    def by_ip(self, ip: str) -> Optional[Host]:
+        return self._by_ip.get(ip)
+
+    def add_host(self, name: str, ip: str) -> Host:
+        # Raises sqlite3.IntegrityError when the name or the IP is already registered
+        host = Host(self.db.add_host(name, ip), name, ip)
+        self._index(self.hosts() + [host])
+        return host
+
+    def update_host(self, host_id: int, name: str, ip: str) -> Host:
+        old = self._by_id[host_id]
+        self.db.update_host(old.name, name, ip)
+        host = Host(host_id, name, ip)
+        self._index([host if h.id == host_id else h for h in self.hosts()])
+        return host
+
+    def delete_host(self, host_id: int):
+        host = self._by_id[host_id]
+        self.db.delete_host(host.name)
+        self._index([h for h in self.hosts() if h.id != host_id])
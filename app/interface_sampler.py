@@ -0,0 +1,103 @@
+from collections import deque
+import time
+import logging
+import psutil
+from PyQt5.QtCore import QThread, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv', 'errin', 'errout', 'dropin', 'dropout')
+
+
+class InterfaceSampler(QThread):
+    # One row per interface: (interface, epoch µs, bytes_sent/s, bytes_recv/s, packets_sent/s,
+    # packets_recv/s, errors/s, drops/s, peak bytes_sent/s, peak bytes_recv/s)
+    aggregate_ready = pyqtSignal(list)
+
+    def __init__(self, interval=0.25, buffer_seconds=120, aggregate_every=60.0):
+        super().__init__()
+        self.interval = interval
+        self.aggregate_every = aggregate_every
+        self.buffer_size = max(2, int(buffer_seconds / interval))
+        self.buffers = {}
+        self.window_start = {}
+        self.running = False
+
+    def start(self):
+        # Set before the thread runs so an early stop() cannot be overwritten
+        self.running = True
+        super().start()
+
+    def run(self):
+        logger.info(f"Interface sampler started ({self.interval}s interval)")
+        last_flush = time.monotonic()
+        while self.running:
+            self.sample()
+            now = time.monotonic()
+            if now - last_flush >= self.aggregate_every:
+                rows = self.aggregate()
+                if rows:
+                    self.aggregate_ready.emit(rows)
+                last_flush = now
+            self.msleep(int(self.interval * 1000))
+        logger.info("Interface sampler stopped")
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+    def sample(self):
+        timestamp = time.monotonic()
+        for nic, counters in psutil.net_io_counters(pernic=True).items():
+            buffer = self.buffers.get(nic)
+            if buffer is None:
+                buffer = self.buffers[nic] = deque(maxlen=self.buffer_size)
+            sample = (timestamp,) + tuple(getattr(counters, name) for name in COUNTERS)
+            # A counter going backwards means the interface was reset, restart its window
+            if buffer and any(new < old for new, old in zip(sample[1:], buffer[-1][1:])):
+                buffer.clear()
+            if not buffer:
+                self.window_start[nic] = sample
+            buffer.append(sample)
+
+    def rates(self, nic) -> dict:
+        buffer = self.buffers.get(nic)
+        if not buffer or len(buffer) < 2:
+            return {}
+        return self._rates(buffer[-2], buffer[-1])
+
+    def _rates(self, first, last) -> dict:
+        elapsed = last[0] - first[0]
+        if elapsed <= 0:
+            return {}
+        deltas = dict(zip(COUNTERS, ((new - old) / elapsed for new, old in zip(last[1:], first[1:]))))
+        return {
+            'bytes_sent': deltas['bytes_sent'],
+            'bytes_recv': deltas['bytes_recv'],
+            'packets_sent': deltas['packets_sent'],
+            'packets_recv': deltas['packets_recv'],
+            'errors': deltas['errin'] + deltas['errout'],
+            'drops': deltas['dropin'] + deltas['dropout'],
+        }
+
+    def aggregate(self) -> list:
+        ts = time.time_ns() // 1000
+        rows = []
+        for nic, buffer in self.buffers.items():
+            start = self.window_start.get(nic)
+            if start is None or len(buffer) < 2 or buffer[-1][0] <= start[0]:
+                continue
+            average = self._rates(start, buffer[-1])
+            # Peaks only look at samples taken inside the current window
+            window = [sample for sample in buffer if sample[0] >= start[0]]
+            peaks = [self._rates(a, b) for a, b in zip(window, window[1:])]
+            rows.append((
+                nic, ts,
+                average['bytes_sent'], average['bytes_recv'],
+                average['packets_sent'], average['packets_recv'],
+                average['errors'], average['drops'],
+                max((p['bytes_sent'] for p in peaks if p), default=0.0),
+                max((p['bytes_recv'] for p in peaks if p), default=0.0),
+            ))
+            self.window_start[nic] = buffer[-1]
+        return rows
@@ -0,0 +1,134 @@
+import ipaddress
+import logging
+from typing import Iterable, List, Optional
+from PyQt5.QtCore import QObject, pyqtSignal
+from models import now_us
+
+logger = logging.getLogger(__name__)
+
+HOST_UPSERT = '''
+    INSERT INTO inventory_hosts (ip, mac, hostname, first_seen, last_seen, up) VALUES (?, ?, ?, ?, ?, 1)
+    ON CONFLICT (ip) DO UPDATE SET mac = excluded.mac, hostname = excluded.hostname,
+                                   last_seen = excluded.last_seen, up = 1
+'''
+HOST_DOWN = 'UPDATE inventory_hosts SET up = 0 WHERE ip = ?'
+PORT_UPSERT = '''
+    INSERT INTO inventory_ports (ip, port, protocol, service, first_seen, last_seen, open)
+    VALUES (?, ?, 'tcp', ?, ?, ?, 1)
+    ON CONFLICT (ip, port, protocol) DO UPDATE SET service = excluded.service,
+                                                   last_seen = excluded.last_seen, open = 1
+'''
+PORT_CLOSED = "UPDATE inventory_ports SET open = 0 WHERE ip = ? AND port = ? AND protocol = 'tcp'"
+EVENT_INSERT = 'INSERT INTO inventory_events (ts, kind, ip, detail) VALUES (?, ?, ?, ?)'
+
+CHANGE_LABELS = {
+    'host_new': "Nouvel hôte",
+    'host_back': "Hôte de retour",
+    'host_gone': "Hôte disparu",
+    'mac_changed': "Adresse MAC modifiée",
+    'port_opened': "Port ouvert",
+    'port_closed': "Port fermé",
+}
+
+
+def describe_change(change: dict) -> str:
+    detail = f" ({change['detail']})" if change['detail'] else ""
+    return f"{CHANGE_LABELS[change['kind']]}: {change['ip']}{detail}"
+
+
+class Inventory(QObject):
+    """Hosts, MAC addresses and open ports seen by scans, with first/last seen times."""
+    changes_detected = pyqtSignal(list)
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        # Scans are diffed against the state kept in memory, only the differences are written
+        self.reload()
+
+    def reload(self):
+        self.db.flush()
+        conn = self.db.reader()
+        self.hosts = {ip: {'mac': mac, 'hostname': hostname, 'up': bool(up)}
+                      for ip, mac, hostname, up in conn.execute(
+                          'SELECT ip, mac, hostname, up FROM inventory_hosts')}
+        self.open_ports = {}
+        for ip, port, service in conn.execute('SELECT ip, port, service FROM inventory_ports WHERE open = 1'):
+            self.open_ports.setdefault(ip, {})[port] = service
+        logger.info(f"Inventory loaded {len(self.hosts)} hosts")
+
+    def record_hosts(self, ip_range: str, hosts: Iterable[dict], unscanned: Iterable[str] = ()) -> List[dict]:
+        """Diff a finished discovery of ip_range against the inventory, hosts being scan result dicts.
+        Hosts in the unscanned sub-networks (e.g. failed chunks) are not marked as gone."""
+        network = ipaddress.ip_network(ip_range, strict=False)
+        unscanned = [ipaddress.ip_network(chunk, strict=False) for chunk in unscanned]
+        ts = now_us()
+        current = {host['ip']: host for host in hosts}
+        previous = {ip for ip, host in self.hosts.items()
+                    if host['up'] and ipaddress.ip_address(ip) in network
+                    and not any(ipaddress.ip_address(ip) in chunk for chunk in unscanned)}
+        known = set(self.hosts)
+        changes = []
+        for ip in current.keys() - known:
+            changes.append(self._event(ts, 'host_new', ip, self._known(current[ip].get('adresse_mac'))))
+        for ip in (current.keys() & known) - previous:
+            changes.append(self._event(ts, 'host_back', ip, None))
+        for ip in previous - current.keys():
+            changes.append(self._event(ts, 'host_gone', ip, None))
+            self.hosts[ip]['up'] = False
+            self.db.writer.submit(HOST_DOWN, (ip,))
+
+        rows = []
+        for ip, host in current.items():
+            old = self.hosts.get(ip, {})
+            mac = self._known(host.get('adresse_mac')) or old.get('mac')
+            hostname = self._known(host.get('hostname')) or old.get('hostname')
+            # Only ARP and nmap report MACs, a probe without one does not count as a change
+            if old.get('mac') and mac != old['mac']:
+                changes.append(self._event(ts, 'mac_changed', ip, f"{old['mac']} -> {mac}"))
+            self.hosts[ip] = {'mac': mac, 'hostname': hostname, 'up': True}
+            rows.append((ip, mac, hostname, ts, ts))
+        self.db.writer.submit_many(HOST_UPSERT, rows)
+        return self._publish(ip_range, changes)
+
+    def record_ports(self, ip: str, open_ports: dict, scanned_ports: Iterable[int]) -> List[dict]:
+        """Diff a port scan of ip, open_ports mapping each open port to its service name."""
+        ts = now_us()
+        scanned = set(scanned_ports)
+        previous = self.open_ports.get(ip, {})
+        # Ports outside this scan keep their state
+        was_open = previous.keys() & scanned
+        changes = [self._event(ts, 'port_opened', ip, f"{port} {open_ports[port] or ''}".strip())
+                   for port in sorted(open_ports.keys() - was_open)]
+        changes += [self._event(ts, 'port_closed', ip, str(port)) for port in sorted(was_open - open_ports.keys())]
+        for port in was_open - open_ports.keys():
+            self.db.writer.submit(PORT_CLOSED, (ip, port))
+        self.open_ports[ip] = {**{port: service for port, service in previous.items() if port not in scanned},
+                               **open_ports}
+        self.db.writer.submit_many(PORT_UPSERT, [(ip, port, service, ts, ts) for port, service in open_ports.items()])
+        return self._publish(ip, changes)
+
+    def events(self, ip: Optional[str] = None, limit: int = 100) -> List[tuple]:
+        # (ts, kind, ip, detail), newest first
+        self.db.flush()
+        if ip is None:
+            cursor = self.db.reader().execute('SELECT ts, kind, ip, detail FROM inventory_events '
+                                              'ORDER BY id DESC LIMIT ?', (limit,))
+        else:
+            cursor = self.db.reader().execute('SELECT ts, kind, ip, detail FROM inventory_events '
+                                              'WHERE ip = ? ORDER BY ts DESC LIMIT ?', (ip, limit))
+        return cursor.fetchall()
+
+    def _event(self, ts, kind, ip, detail):
+        return {'ts': ts, 'kind': kind, 'ip': ip, 'detail': detail}
+
+    @staticmethod
+    def _known(value):
+        return value if value and value != 'N/A' else None
+
+    def _publish(self, scope, changes):
+        self.db.writer.submit_many(EVENT_INSERT, [(c['ts'], c['kind'], c['ip'], c['detail']) for c in changes])
+        logger.info(f"Inventory of {scope}: {len(changes)} changes")
+        if changes:
+            self.changes_detected.emit(changes)
+        return changes
@@ -1,18 +1,25 @@
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QLabel, QLineEdit, QPushButton, QGroupBox,
                             QListWidget, QMessageBox, QInputDialog, QTableWidget, 
-                            QHeaderView, QTableWidgetItem, QStyle, QFrame)
+                            QHeaderView, QTableWidgetItem, QStyle, QFrame, QListWidgetItem)
 from PyQt5.QtCore import QTimer, QThread, pyqtSignal, QRegExp, Qt
 from PyQt5.QtGui import QIcon, QRegExpValidator, QPalette, QColor, QFont
 from models import Host, Latence, BandePassante, Database
-from datetime import datetime
 import logging
+import sqlite3
 from history_window import HistoryWindow
 from packet_capture import PacketCaptureWidget
 from network_scan import NetworkScannerWidget
 from service_os_detection import ServiceOSDetection
 from alert_system import AlertSystem
 from traceroute_window import TracerouteVisualization
+from topology_window import TopologyVisualization
+from interface_sampler import InterfaceSampler
+from host_registry import HostRegistry
+from scan_cache import ScanCache
+from inventory import Inventory, describe_change
+from geoip import GeoIPDatabase
+from reverse_dns import ReverseDNSService
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -129,6 +136,12 @@ class MainWindow(QMainWindow):
         
         logger.info("Initializing MainWindow")
         self.db = Database()
+        self.hosts = HostRegistry(self.db)
+        self.scan_cache = ScanCache(self.db)
+        self.inventory = Inventory(self.db)
+        self.inventory.changes_detected.connect(self.display_inventory_changes)
+        self.geoip = GeoIPDatabase(self.db)
+        self.reverse_dns = ReverseDNSService()
         self.history_window = None # Added instance variable
         
         main_widget = QWidget()
@@ -225,6 +238,8 @@ class MainWindow(QMainWindow):
         self.network_scan_button.clicked.connect(self.show_network_scan)
         self.traceroute_button = QPushButton("Traceroute")
         self.traceroute_button.clicked.connect(self.show_traceroute)
+        self.topology_button = QPushButton("Topologie")
+        self.topology_button.clicked.connect(self.show_topology)
         self.service_os_detection_button = QPushButton("Détection Services/OS")
         self.service_os_detection_button.clicked.connect(self.show_service_os_detection)
 
@@ -235,6 +250,7 @@ class MainWindow(QMainWindow):
 
         config_layout.addWidget(self.network_scan_button)
         config_layout.addWidget(self.traceroute_button)
+        config_layout.addWidget(self.topology_button)
     
 
         metrics_layout.addLayout(self.admin_button_layout)
@@ -250,6 +266,7 @@ class MainWindow(QMainWindow):
         self.network_scan_button.setIcon(self.style().standardIcon(QStyle.SP_ComputerIcon))
         self.service_os_detection_button.setIcon(self.style().standardIcon(QStyle.SP_DriveHDIcon))
         self.traceroute_button.setIcon(self.style().standardIcon(QStyle.SP_ArrowRight))
+        self.topology_button.setIcon(self.style().standardIcon(QStyle.SP_DirLinkIcon))
 
 
         # Initially hide the buttons
@@ -284,13 +301,25 @@ class MainWindow(QMainWindow):
         }
         self.alert_system = AlertSystem(email_config) # Added alert system initialization
 
+        # Passive interface throughput telemetry, aggregated once a minute
+        self.interface_sampler = InterfaceSampler()
+        self.interface_sampler.aggregate_ready.connect(self.save_interface_stats)
+        self.interface_sampler.start()
+
+        # Expire raw measurements past the retention period
+        self.retention_timer = QTimer()
+        self.retention_timer.timeout.connect(self.db.purge_expired)
+        self.retention_timer.start(3600000)
+
         
     def load_hosts(self):
-        logger.info("Loading hosts from database")
-        hosts = self.db.get_hosts()
+        logger.info("Loading hosts from registry")
+        hosts = self.hosts.hosts()
         self.host_list.clear()
         for host in hosts:
-            self.host_list.addItem(f"{host.name} ({host.ip})")
+            item = QListWidgetItem(f"{host.name} ({host.ip})")
+            item.setData(Qt.UserRole, host.id)
+            self.host_list.addItem(item)
         logger.info(f"Loaded {len(hosts)} hosts")
     
     def add_host(self):
@@ -299,7 +328,12 @@ class MainWindow(QMainWindow):
         ip = self.host_ip_input.text()
         if name and ip:
             logger.info(f"Adding host: {name} ({ip})")
-            self.db.add_host(name, ip)
+            try:
+                self.hosts.add_host(name, ip)
+            except sqlite3.IntegrityError:
+                logger.warning(f"Host already exists: {name} ({ip})")
+                QMessageBox.warning(self, "Erreur", "Un hôte avec ce nom ou cette adresse IP existe déjà.")
+                return
             self.load_hosts()
             self.host_name_input.clear()
             self.host_ip_input.clear()
@@ -310,27 +344,31 @@ class MainWindow(QMainWindow):
     
     def update_host(self):
         if self.selected_host:
-            host_name, host_ip = self.selected_host.split(' (')
-            host_ip = host_ip.rstrip(')')
+            host_name, host_ip = self.selected_host.name, self.selected_host.ip
 
             new_name, ok1 = QInputDialog.getText(self, "Update Host", "Enter new name:", text=host_name)
             if ok1 and new_name:
                 new_ip, ok2 = QInputDialog.getText(self, "Update Host", "Enter new IP:", text=host_ip)
                 if ok2 and new_ip:
-                    self.db.update_host(host_name, new_name, new_ip)
+                    try:
+                        host = self.hosts.update_host(self.selected_host.id, new_name, new_ip)
+                    except sqlite3.IntegrityError:
+                        logger.warning(f"Host already exists: {new_name} ({new_ip})")
+                        QMessageBox.warning(self, "Erreur", "Un hôte avec ce nom ou cette adresse IP existe déjà.")
+                        return
                     self.load_hosts()
-                    self.selected_host = f"{new_name} ({new_ip})"
-                    self.selected_host_label.setText(f"Hôte sélectionné: {self.selected_host}")
+                    self.selected_host = host
+                    self.selected_host_label.setText(f"Hôte sélectionné: {host.name} ({host.ip})")
                     logger.info(f"Host updated: {host_name} -> {new_name}, {host_ip} -> {new_ip}")
 
     def delete_host(self):
         if self.selected_host:
-            host_name = self.selected_host.split(' (')[0]
+            host_name = self.selected_host.name
             reply = QMessageBox.question(self, "Delete Host", 
                                          f"Are you sure you want to delete {host_name}?",
                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.Yes:
-                self.db.delete_host(host_name)
+                self.hosts.delete_host(self.selected_host.id)
                 self.load_hosts()
                 self.selected_host = None
                 self.selected_host_label.setText("Hôte sélectionné: Aucun")
@@ -350,9 +388,8 @@ class MainWindow(QMainWindow):
         logger.info("Host selection changed")
         selected_items = self.host_list.selectedItems()
         if selected_items:
-            selected_host = selected_items[0].text()
-            self.selected_host_label.setText(f"Hôte sélectionné: {selected_host}")
-            self.selected_host = selected_host
+            self.selected_host = self.hosts.get(selected_items[0].data(Qt.UserRole))
+            self.selected_host_label.setText(f"Hôte sélectionné: {selected_items[0].text()}")
             self.start_test_button.show()
             self.show_history_button.show()
             self.edit_host_button.show()
@@ -393,8 +430,9 @@ class MainWindow(QMainWindow):
     def show_history(self):
         logger.info("Showing history")
         if self.selected_host:
-            host_name = self.selected_host.split(' (')[0]
-            self.history_window = HistoryWindow(self.db, host_name)
+            if self.history_window:
+                self.history_window.close()
+            self.history_window = HistoryWindow(self.db, self.selected_host)
             self.history_window.show()
     
     def start_metrics_calculation(self):
@@ -402,8 +440,7 @@ class MainWindow(QMainWindow):
             logger.info("No host selected, skipping metrics calculation")
             return
         
-        host_ip = self.selected_host.split('(')[1].strip(')')
-        host = Host(0, self.selected_host.split(' (')[0], host_ip)
+        host = self.selected_host
         logger.info(f"Starting metrics calculation for host: {host.name} ({host.ip})")
         
         if self.worker is not None and self.worker.isRunning():
@@ -436,12 +473,11 @@ class MainWindow(QMainWindow):
         self.metrics_table.setItem(3, 1, QTableWidgetItem(f"{upload:.2f} Mbps"))
         
         # Enregistrement des métriques dans la base de données
-        now = datetime.now()
-        if self.selected_host:
-            host_id = self.db.get_host_id(self.selected_host.split(' (')[0])
-            logger.info(f"Saving metrics to database for host_id: {host_id}")
-            self.db.add_latence(host_id, now, latency, int(packets_lost))
-            self.db.add_bande_passante(host_id, now, upload, download)
+        host = self.worker.host
+        if self.hosts.get(host.id) is not None:
+            logger.info(f"Saving metrics to database for host_id: {host.id}")
+            self.db.add_mesure(host.id, latence=latency, packets_perdus=packets_lost,
+                               upload=upload, download=download)
     
         # Re-enable the buttons after calculation
         self.start_test_button.setEnabled(True)
@@ -455,20 +491,23 @@ class MainWindow(QMainWindow):
         self.service_os_detection_button.setEnabled(True)
         logger.info("Buttons re-enabled after calculation")
         
+    def save_interface_stats(self, rows):
+        self.db.add_interface_stats(rows)
+
     def closeEvent(self, event):
         logger.info("Application closing")
         if self.worker is not None and self.worker.isRunning():
             logger.info("Terminating worker thread")
             self.worker.terminate()
             self.worker.wait()
+        self.interface_sampler.stop()
+        self.reverse_dns.close()
         self.db.close()
         logger.info("Database connection closed")
         super().closeEvent(event)
 
     def show_packet_capture(self):
-        _, host_ip = self.selected_host.split(' (')
-        host_ip = host_ip.rstrip(')')
-        self.packet_capture_widget = PacketCaptureWidget(host_ip) 
+        self.packet_capture_widget = PacketCaptureWidget(self.selected_host.ip, self.hosts, self.reverse_dns)
         self.packet_capture_widget.show()
         self.packet_capture_widget.start_capture()
     # def show_anomaly_detection(self):
@@ -476,19 +515,29 @@ class MainWindow(QMainWindow):
     #     self.anomaly_detection_window.show()
 
     def show_network_scan(self):
-        self.network_scan_window = NetworkScannerWidget()
+        self.network_scan_window = NetworkScannerWidget(self.scan_cache, self.inventory, self.geoip, self.reverse_dns)
         self.network_scan_window.show()
 
     def show_traceroute(self):
-        self.traceroute_window = TracerouteVisualization()
+        self.traceroute_window = TracerouteVisualization(self.geoip, self.reverse_dns)
         self.traceroute_window.show()
 
+    def show_topology(self):
+        self.topology_window = TopologyVisualization(self.geoip, self.reverse_dns)
+        self.topology_window.show()
+
     def show_service_os_detection(self):
-        _, host_ip = self.selected_host.split(' (')
-        host_ip = host_ip.rstrip(')')
-        self.service_os_detection_window = ServiceOSDetection(host_ip)
+        self.service_os_detection_window = ServiceOSDetection(self.selected_host.ip, self.scan_cache, self.inventory)
         self.service_os_detection_window.show()
 
+    def display_inventory_changes(self, changes):
+        for change in changes:
+            logger.info(f"Inventory change: {describe_change(change)}")
+        summary = ", ".join(describe_change(change) for change in changes[:3])
+        if len(changes) > 3:
+            summary += f" et {len(changes) - 3} autre(s)"
+        self.statusBar().showMessage(f"Inventaire: {len(changes)} changement(s) - {summary}", 30000)
+
     def display_anomaly(self, anomaly): # Added method
         self.anomaly_display.append(f"Anomalie détectée: {anomaly['type']} - {anomaly['description']}")
         self.anomaly_visualization.update_anomalies(anomaly)
@@ -1,13 +1,19 @@
 from datetime import datetime
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterator, List, Optional
 import subprocess
 import speedtest
 import psutil
 import sqlite3
+import threading
+import weakref
 import os
+from pathlib import Path
 import time
 import logging
+import numpy as np
+from throughput import ThroughputTester
+from db_writer import DatabaseWriter
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -66,11 +72,21 @@ class BandePassante(Metric):
     upload: float
     download: float
 
-    def __init__(self, host: Host):
+    def __init__(self, host: Host, streams: int = 4, duration: float = 5.0):
         self.host = host
+        self.streams = streams
+        self.duration = duration
     
     def calculer(self) -> tuple[float, float]:
         logger.info(f"Calculating bandwidth for host: {self.host.name} ({self.host.ip})")
+        # Measure against the host's own throughput responder when it runs one,
+        # speedtest only gives the internet link speed
+        tester = ThroughputTester(self.host.ip, streams=self.streams, duration=self.duration)
+        if tester.responder_available():
+            try:
+                return tester.measure()
+            except OSError as e:
+                logger.warning(f"Throughput test against {self.host.ip} failed, falling back to speedtest: {str(e)}")
         try:
             st = speedtest.Speedtest(secure=True)
             logger.info("Starting download speed test")
@@ -88,14 +104,358 @@ class BandePassante(Metric):
             logger.error(f"Error calculating bandwidth: {str(e)}")
             return 0.0, 0.0
 
+def _create_unique_or_plain_index(conn, name: str, table: str, column: str):
+    duplicates = conn.execute(f'''
+        SELECT COUNT(*) FROM (SELECT {column} FROM {table} GROUP BY {column} HAVING COUNT(*) > 1)
+    ''').fetchone()[0]
+    if duplicates:
+        # Existing duplicates are left for the user to clean up, lookups still get an index
+        logger.warning(f"{duplicates} duplicate values in {table}.{column}, creating a non-unique index")
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})')
+    else:
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({column})')
+
+
+def _migration_add_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_latence_host_date ON latence (host_id, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bande_passante_host_date ON bande_passante (host_id, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_interface_stats_interface_date ON interface_stats (interface, date)')
+    _create_unique_or_plain_index(conn, 'idx_hosts_name', 'hosts', 'name')
+    _create_unique_or_plain_index(conn, 'idx_hosts_ip', 'hosts', 'ip')
+
+
+# Bucket widths in seconds, from finest to coarsest
+ROLLUP_RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# metric -> column of the mesures table
+ROLLUP_METRICS = {
+    'latence': 'latence',
+    'packets_perdus': 'packets_perdus',
+    'upload': 'upload',
+    'download': 'download',
+}
+
+SERIES_DTYPE = np.dtype([('ts', np.int64), ('mean', np.float64), ('min', np.float64), ('max', np.float64),
+                         ('count', np.int64)])
+
+ROLLUP_UPSERT = '''
+    INSERT INTO rollups (metric, host_id, resolution, bucket, count, min_value, max_value, sum_value, sum_squares)
+    VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?)
+    ON CONFLICT (metric, host_id, resolution, bucket) DO UPDATE SET
+        count = count + 1,
+        min_value = MIN(min_value, excluded.min_value),
+        max_value = MAX(max_value, excluded.max_value),
+        sum_value = sum_value + excluded.sum_value,
+        sum_squares = sum_squares + excluded.sum_squares
+'''
+
+
+def now_us() -> int:
+    # Measurements are stamped in integer microseconds since the epoch (UTC)
+    return time.time_ns() // 1000
+
+
+def _text_to_epoch_us(date: Optional[str]) -> Optional[int]:
+    if date is None:
+        return None
+    try:
+        return int(datetime.fromisoformat(date).timestamp() * 1_000_000)
+    except ValueError:
+        return None
+
+
+def _migration_add_rollups(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollups (
+            metric TEXT NOT NULL,
+            host_id INTEGER NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            min_value REAL,
+            max_value REAL,
+            sum_value REAL,
+            sum_squares REAL,
+            PRIMARY KEY (metric, host_id, resolution, bucket)
+        ) WITHOUT ROWID
+    ''')
+    legacy_sources = {
+        'latence': ('latence', 'valeur'),
+        'packets_perdus': ('latence', 'packets_perdus'),
+        'upload': ('bande_passante', 'upload'),
+        'download': ('bande_passante', 'download'),
+    }
+    for metric, (table, column) in legacy_sources.items():
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            conn.execute(f'''
+                INSERT OR REPLACE INTO rollups (metric, host_id, resolution, bucket, count,
+                                                min_value, max_value, sum_value, sum_squares)
+                SELECT ?, host_id, ?, CAST(strftime('%s', date) AS INTEGER) / ? * ?, COUNT(*),
+                       MIN({column}), MAX({column}), SUM({column}), SUM({column} * {column})
+                FROM {table}
+                WHERE {column} IS NOT NULL AND date IS NOT NULL
+                GROUP BY host_id, CAST(strftime('%s', date) AS INTEGER) / ?
+            ''', (metric, resolution, resolution, resolution, resolution))
+
+
+def _rebuild_rollups(conn):
+    conn.execute('DELETE FROM rollups')
+    for metric, column in ROLLUP_METRICS.items():
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            conn.execute(f'''
+                INSERT INTO rollups (metric, host_id, resolution, bucket, count,
+                                     min_value, max_value, sum_value, sum_squares)
+                SELECT ?, host_id, ?, ts / 1000000 / ? * ?, COUNT(*),
+                       MIN({column}), MAX({column}), SUM({column}), SUM({column} * {column})
+                FROM mesures
+                WHERE {column} IS NOT NULL
+                GROUP BY host_id, ts / 1000000 / ?
+            ''', (metric, resolution, resolution, resolution, resolution))
+
+
+def _migration_unify_measurements(conn):
+    conn.create_function('to_epoch_us', 1, _text_to_epoch_us, deterministic=True)
+    conn.execute('''
+        CREATE TABLE mesures (
+            run_id INTEGER PRIMARY KEY,
+            host_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            latence REAL,
+            packets_perdus REAL,
+            upload REAL,
+            download REAL,
+            FOREIGN KEY (host_id) REFERENCES hosts (id)
+        )
+    ''')
+    # Latency and bandwidth of one test were saved with the same date, which rebuilds the run
+    conn.execute('''
+        INSERT INTO mesures (host_id, ts, latence, packets_perdus, upload, download)
+        SELECT host_id, ts, latence, packets_perdus, upload, download FROM (
+            SELECT l.host_id, to_epoch_us(l.date) AS ts, l.valeur AS latence, l.packets_perdus,
+                   b.upload, b.download
+            FROM latence l
+            LEFT JOIN bande_passante b ON b.host_id = l.host_id AND b.date = l.date
+            UNION ALL
+            SELECT b.host_id, to_epoch_us(b.date), NULL, NULL, b.upload, b.download
+            FROM bande_passante b
+            WHERE NOT EXISTS (SELECT 1 FROM latence l WHERE l.host_id = b.host_id AND l.date = b.date)
+        )
+        WHERE host_id IS NOT NULL AND ts IS NOT NULL
+        ORDER BY ts
+    ''')
+    conn.execute('CREATE INDEX idx_mesures_host_ts ON mesures (host_id, ts)')
+    conn.execute('DROP TABLE latence')
+    conn.execute('DROP TABLE bande_passante')
+    _rebuild_rollups(conn)
+
+    conn.execute('''
+        CREATE TABLE interface_stats_ts (
+            id INTEGER PRIMARY KEY,
+            interface TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            bytes_sent REAL,
+            bytes_recv REAL,
+            packets_sent REAL,
+            packets_recv REAL,
+            errors REAL,
+            drops REAL,
+            peak_bytes_sent REAL,
+            peak_bytes_recv REAL
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO interface_stats_ts (interface, ts, bytes_sent, bytes_recv, packets_sent, packets_recv,
+                                        errors, drops, peak_bytes_sent, peak_bytes_recv)
+        SELECT interface, to_epoch_us(date), bytes_sent, bytes_recv, packets_sent, packets_recv,
+               errors, drops, peak_bytes_sent, peak_bytes_recv
+        FROM interface_stats
+        WHERE to_epoch_us(date) IS NOT NULL
+    ''')
+    conn.execute('DROP TABLE interface_stats')
+    conn.execute('ALTER TABLE interface_stats_ts RENAME TO interface_stats')
+    conn.execute('CREATE INDEX idx_interface_stats_interface_ts ON interface_stats (interface, ts)')
+
+
+def _migration_add_scan_cache(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_cache (
+            target TEXT NOT NULL,
+            scan_type TEXT NOT NULL,
+            arguments TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            result TEXT NOT NULL,
+            PRIMARY KEY (target, scan_type, arguments)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _migration_add_inventory(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_hosts (
+            ip TEXT PRIMARY KEY,
+            mac TEXT,
+            hostname TEXT,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            up INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_ports (
+            ip TEXT NOT NULL,
+            port INTEGER NOT NULL,
+            protocol TEXT NOT NULL DEFAULT 'tcp',
+            service TEXT,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            open INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (ip, port, protocol)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inventory_events (
+            id INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            ip TEXT NOT NULL,
+            detail TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_inventory_events_ip ON inventory_events (ip, ts)')
+
+
+def _migration_add_geoip(conn):
+    # One row per kind ('location' or 'asn'): uint32 range starts/ends sorted by start, the
+    # record of each range and the distinct records as JSON, loaded as arrays by geoip.py
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS geoip_ranges (
+            kind TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            imported INTEGER NOT NULL,
+            starts BLOB NOT NULL,
+            ends BLOB NOT NULL,
+            record_ids BLOB NOT NULL,
+            records TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+# Applied in order, the schema version is tracked in PRAGMA user_version
+MIGRATIONS = [
+    (1, "Index time-series tables on (host_id, date) and hosts on name and ip", _migration_add_indexes),
+    (2, "Add minute/hour/day rollups of latency and bandwidth", _migration_add_rollups),
+    (3, "Store measurements by run in mesures with epoch microsecond timestamps", _migration_unify_measurements),
+    (4, "Add a persistent cache of nmap scan results", _migration_add_scan_cache),
+    (5, "Add the network inventory of hosts, open ports and change events", _migration_add_inventory),
+    (6, "Add offline GeoIP and ASN range tables", _migration_add_geoip),
+]
+
+# Hot queries that must be served by an index, checked after migrating
+QUERY_PLAN_CHECKS = [
+    ("history", 'SELECT ts, latence, packets_perdus, upload, download FROM mesures WHERE host_id = ? '
+                'ORDER BY ts DESC', (1,)),
+    ("history page", 'SELECT ts, latence, run_id FROM mesures WHERE host_id = ? AND ts >= ? AND ts < ? '
+                     'AND (ts, run_id) < (?, ?) ORDER BY ts DESC, run_id DESC LIMIT ?', (1, 0, 2 ** 62, 2 ** 62, 0, 500)),
+    ("interface history", 'SELECT ts, bytes_sent FROM interface_stats WHERE interface = ? ORDER BY ts DESC', ('eth0',)),
+    ("host by ip", 'SELECT id FROM hosts WHERE ip = ?', ('127.0.0.1',)),
+    ("host by name", 'SELECT id FROM hosts WHERE name = ?', ('localhost',)),
+    ("rollup series", 'SELECT bucket, count FROM rollups WHERE metric = ? AND host_id = ? AND resolution = ? '
+                      'AND bucket BETWEEN ? AND ? ORDER BY bucket', ('latence', 1, 60, 0, 0)),
+]
+
+
+# Seconds a cached summary over a relative window (e.g. the last hour) stays valid without new runs
+STATISTICS_REFRESH = 60
+
+
+class _ReaderHandle:
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
 class Database:
-    def __init__(self, db_name='network_monitor.db'):
+    def __init__(self, db_name='network_monitor.db', apply_migrations=True, batch_size=1000, flush_interval=0.5,
+                 retention_days=90):
         self.db_name = db_name
-        self.conn = sqlite3.connect(db_name)
+        # Raw measurements older than this are purged, rollups are kept (None keeps everything)
+        self.retention_days = retention_days
+        # Host management stays on this connection, measurements go through the writer
+        # thread and history queries use per-thread read-only connections
+        self.conn = sqlite3.connect(db_name, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
         self.create_tables()
+        if apply_migrations:
+            self.migrate()
+        self.writer = DatabaseWriter(db_name, batch_size, flush_interval)
+        self.writer.start()
+        self.purge_expired()
+        self._readers = threading.local()
+        self._reader_conns = set()
+        self._reader_lock = threading.Lock()
+        # Called as listener(host_id, ts, values) on the thread calling add_mesure
+        self.listeners = []
+        # (host_id, last_seconds) -> (refresh period, statistics), dropped when the host gets a new measurement
+        self._statistics_cache = {}
         logger.info(f"Database initialized: {db_name}")
 
+    def reader(self) -> sqlite3.Connection:
+        handle = getattr(self._readers, 'handle', None)
+        if handle is None:
+            uri = Path(self.db_name).resolve().as_uri() + '?mode=ro'
+            handle = self._readers.handle = _ReaderHandle(
+                sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False))
+            with self._reader_lock:
+                self._reader_conns.add(handle.conn)
+            # Thread locals are dropped when their thread ends, short-lived workers do not leak connections
+            weakref.finalize(handle, self._release_reader, handle.conn)
+        return handle.conn
+
+    def _release_reader(self, conn):
+        with self._reader_lock:
+            self._reader_conns.discard(conn)
+        conn.close()
+
+    def flush(self):
+        # Wait until every queued measurement is committed
+        self.writer.flush()
+
+    def schema_version(self) -> int:
+        return self.conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def migrate(self):
+        version = self.schema_version()
+        pending = [m for m in MIGRATIONS if m[0] > version]
+        if not pending:
+            return
+        for number, description, migration in pending:
+            logger.info(f"Applying database migration {number}: {description}")
+            with self.conn:
+                migration(self.conn)
+                self.conn.execute(f'PRAGMA user_version = {number}')
+        self.conn.execute('ANALYZE')
+        logger.info(f"Database schema at version {self.schema_version()}")
+        self.check_query_plans()
+
+    def query_plan(self, query: str, params: tuple = ()) -> List[str]:
+        cursor = self.conn.execute(f'EXPLAIN QUERY PLAN {query}', params)
+        return [row[3] for row in cursor.fetchall()]
+
+    def check_query_plans(self) -> List[tuple]:
+        """Return the hot queries whose plan scans a table or sorts outside an index."""
+        problems = []
+        for name, query, params in QUERY_PLAN_CHECKS:
+            plan = self.query_plan(query, params)
+            if any(step.startswith('SCAN') or 'TEMP B-TREE' in step for step in plan):
+                logger.warning(f"Query '{name}' is not served by an index: {plan}")
+                problems.append((name, plan))
+        return problems
+
     def create_tables(self):
+        # Baseline schema (version 0), later changes are applied by migrate()
+        if self.schema_version() > 0:
+            return
         logger.info("Creating database tables if they don't exist")
         with self.conn:
             self.conn.execute('''
@@ -125,9 +485,25 @@ class Database:
                     FOREIGN KEY (host_id) REFERENCES hosts (id)
                 )
             ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS interface_stats (
+                    id INTEGER PRIMARY KEY,
+                    interface TEXT NOT NULL,
+                    date TIMESTAMP,
+                    bytes_sent REAL,
+                    bytes_recv REAL,
+                    packets_sent REAL,
+                    packets_recv REAL,
+                    errors REAL,
+                    drops REAL,
+                    peak_bytes_sent REAL,
+                    peak_bytes_recv REAL
+                )
+            ''')
         logger.info("Database tables created successfully")
 
     def add_host(self, name: str, ip: str) -> int:
+        # Raises sqlite3.IntegrityError when the name or the IP is already registered
         logger.info(f"Adding new host: {name} ({ip})")
         with self.conn:
             cursor = self.conn.execute('INSERT INTO hosts (name, ip) VALUES (?, ?)', (name, ip))
@@ -151,24 +527,196 @@ class Database:
                 logger.info(f"Host does not exist: {ip}")
                 return False
 
-    def add_latence(self, host_id: int, date: datetime, valeur: float, packets_perdus: int):
-        logger.info(f"Adding latency data for host_id {host_id}: {valeur}ms, {packets_perdus}% packets lost")
-        with self.conn:
-            self.conn.execute('''
-                INSERT INTO latence (host_id, date, valeur, packets_perdus)
-                VALUES (?, ?, ?, ?)
-            ''', (host_id, date, valeur, packets_perdus))
+    def add_mesure(self, host_id: int, ts: Optional[int] = None, latence: Optional[float] = None,
+                   packets_perdus: Optional[float] = None, upload: Optional[float] = None,
+                   download: Optional[float] = None):
+        # One row per test run, metrics that were not measured stay NULL
+        ts = now_us() if ts is None else ts
+        logger.debug(f"Queueing measurement for host_id {host_id}: latency {latence}ms, {packets_perdus}% lost, "
+                     f"upload {upload} Mbps, download {download} Mbps")
+        self.writer.submit('''
+            INSERT INTO mesures (host_id, ts, latence, packets_perdus, upload, download)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (host_id, ts, latence, packets_perdus, upload, download))
+        values = {'latence': latence, 'packets_perdus': packets_perdus, 'upload': upload, 'download': download}
+        self.update_rollups(host_id, ts, values)
+        self.invalidate_statistics(host_id)
+        for listener in list(self.listeners):
+            listener(host_id, ts, values)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
 
-    def add_bande_passante(self, host_id: int, date: datetime, upload: float, download: float):
-        logger.info(f"Adding bandwidth data for host_id {host_id}: Upload {upload:.2f} Mbps, Download {download:.2f} Mbps")
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def update_rollups(self, host_id: int, ts: int, values: dict):
+        # Queued with the raw insert, so both land in the same group commit
+        seconds = ts // 1_000_000
+        for metric, value in values.items():
+            if value is None:
+                continue
+            for resolution in ROLLUP_RESOLUTIONS.values():
+                self.writer.submit(ROLLUP_UPSERT, (metric, host_id, resolution, seconds // resolution * resolution,
+                                                   value, value, value, value * value))
+
+    def rebuild_rollups(self):
+        logger.info("Rebuilding rollups from raw measurements")
+        self.flush()
         with self.conn:
-            self.conn.execute('''
-                INSERT INTO bande_passante (host_id, date, upload, download)
-                VALUES (?, ?, ?, ?)
-            ''', (host_id, date, upload, download))
+            _rebuild_rollups(self.conn)
+
+    def purge_expired(self):
+        if self.retention_days is None:
+            return
+        cutoff = now_us() - self.retention_days * 86400 * 1_000_000
+        logger.info(f"Purging raw measurements older than {datetime.fromtimestamp(cutoff / 1_000_000):%Y-%m-%d %H:%M}")
+        for table in ('mesures', 'interface_stats'):
+            self.writer.submit(f'DELETE FROM {table} WHERE ts < ?', (cutoff,))
+        self.invalidate_statistics()
+
+    def get_statistics(self, host_id: int, last_seconds: Optional[int] = None) -> dict:
+        """Summary of the raw measurements of the last last_seconds (all of them if None).
+
+        Counts and means come from SQL, percentiles from NumPy over the column arrays.
+        Results are cached per (host_id, last_seconds) until the host gets a new measurement,
+        and for at most STATISTICS_REFRESH seconds with a relative window so old runs age out.
+        """
+        key = (host_id, last_seconds)
+        period = 0 if last_seconds is None else now_us() // (STATISTICS_REFRESH * 1_000_000)
+        cached = self._statistics_cache.get(key)
+        if cached is None or cached[0] != period:
+            cached = self._statistics_cache[key] = (period, self._compute_statistics(host_id, last_seconds))
+        return cached[1]
+
+    def invalidate_statistics(self, host_id: Optional[int] = None):
+        if host_id is None:
+            self._statistics_cache = {}
+        else:
+            self._statistics_cache = {key: value for key, value in self._statistics_cache.items()
+                                      if key[0] != host_id}
+
+    def _compute_statistics(self, host_id, last_seconds):
+        since = 0 if last_seconds is None else now_us() - last_seconds * 1_000_000
+        self.flush()
+        conn = self.reader()
+        runs, pinged, reachable, loss_rate = conn.execute('''
+            SELECT COUNT(*), COUNT(packets_perdus), SUM(packets_perdus < 100), AVG(packets_perdus)
+            FROM mesures
+            WHERE host_id = ? AND ts >= ?
+        ''', (host_id, since)).fetchone()
+
+        def column(name, condition=''):
+            cursor = conn.execute(f'SELECT {name} FROM mesures WHERE host_id = ? AND ts >= ? '
+                                  f'AND {name} IS NOT NULL {condition}', (host_id, since))
+            return np.fromiter(cursor, dtype=[('value', np.float64)])['value']
+
+        def percentiles(values, qs):
+            if not len(values):
+                return {f'p{q}': None for q in qs}
+            return dict(zip((f'p{q}' for q in qs), np.percentile(values, qs).tolist()))
+
+        # A run that lost every packet has no latency, ping reports 0 ms for it
+        latency = column('latence', 'AND packets_perdus < 100')
+        upload = column('upload')
+        download = column('download')
+        logger.info(f"Computed statistics for host_id {host_id} over {runs} runs")
+        return {
+            'runs': runs,
+            'availability': 100.0 * reachable / pinged if pinged else None,
+            'loss_rate': loss_rate,
+            'latency': {'mean': float(latency.mean()) if len(latency) else None,
+                        **percentiles(latency, (50, 95, 99))},
+            'upload': percentiles(upload, (5, 50, 95)),
+            'download': percentiles(download, (5, 50, 95)),
+        }
+
+    def get_series(self, host_id: int, metric: str, since: Optional[int] = None,
+                   until: Optional[int] = None, max_points: int = 1000) -> tuple[str, List[tuple]]:
+        """Return (resolution, rows) for a metric, rows being (ts, mean, min, max, count) in time order.
+
+        Timestamps are epoch microseconds. Raw rows are used while the range is still within
+        retention and small enough, otherwise the finest rollup giving at most max_points buckets.
+        """
+        name, cursor = self._series_cursor(host_id, metric, since, until, max_points)
+        return name, cursor.fetchall() if cursor is not None else []
+
+    def get_series_arrays(self, host_id: int, metric: str, since: Optional[int] = None,
+                          until: Optional[int] = None, max_points: int = 1000) -> tuple[str, np.ndarray]:
+        # Same as get_series but as a structured array (ts, mean, min, max, count), without Python tuples
+        name, cursor = self._series_cursor(host_id, metric, since, until, max_points)
+        if cursor is None:
+            return name, np.empty(0, dtype=SERIES_DTYPE)
+        return name, np.fromiter(cursor, dtype=SERIES_DTYPE)
+
+    def _series_cursor(self, host_id, metric, since, until, max_points):
+        column = ROLLUP_METRICS[metric]
+        self.flush()
+        conn = self.reader()
+        if since is None or until is None:
+            first, last = conn.execute('SELECT MIN(ts), MAX(ts) FROM mesures WHERE host_id = ?',
+                                       (host_id,)).fetchone()
+            if first is None:
+                first, last = conn.execute('SELECT MIN(bucket) * 1000000, (MAX(bucket) + 86400) * 1000000 '
+                                           'FROM rollups WHERE metric = ? AND host_id = ? AND resolution = ?',
+                                           (metric, host_id, ROLLUP_RESOLUTIONS['day'])).fetchone()
+            if first is None:
+                return 'raw', None
+            since = first if since is None else since
+            until = last if until is None else until
+
+        in_retention = self.retention_days is None or since >= now_us() - self.retention_days * 86400 * 1_000_000
+        if in_retention:
+            raw_count = conn.execute('SELECT COUNT(*) FROM mesures WHERE host_id = ? AND ts BETWEEN ? AND ?',
+                                     (host_id, since, until)).fetchone()[0]
+            if raw_count <= max_points:
+                return 'raw', conn.execute(f'''
+                    SELECT ts, {column}, {column}, {column}, 1
+                    FROM mesures
+                    WHERE host_id = ? AND ts BETWEEN ? AND ? AND {column} IS NOT NULL
+                    ORDER BY ts
+                ''', (host_id, since, until))
+
+        span = (until - since) / 1_000_000
+        name, resolution = next(((name, seconds) for name, seconds in ROLLUP_RESOLUTIONS.items()
+                                 if span / seconds <= max_points), list(ROLLUP_RESOLUTIONS.items())[-1])
+        logger.info(f"Reading {metric} series for host_id {host_id} at {name} resolution")
+        return name, conn.execute('''
+            SELECT bucket * 1000000, sum_value / count, min_value, max_value, count
+            FROM rollups
+            WHERE metric = ? AND host_id = ? AND resolution = ? AND bucket BETWEEN ? AND ?
+            ORDER BY bucket
+        ''', (metric, host_id, resolution, since // 1_000_000 // resolution * resolution, until // 1_000_000))
+
+    def add_interface_stats(self, rows: List[tuple]):
+        logger.debug(f"Queueing interface statistics for {len(rows)} interfaces")
+        self.writer.submit_many('''
+            INSERT INTO interface_stats (interface, ts, bytes_sent, bytes_recv, packets_sent,
+                                         packets_recv, errors, drops, peak_bytes_sent, peak_bytes_recv)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+    def get_interface_history(self, interface: str) -> List[tuple]:
+        logger.info(f"Fetching interface statistics for: {interface}")
+        self.flush()
+        with self.reader() as conn:
+            cursor = conn.execute('''
+                SELECT ts, bytes_sent, bytes_recv, packets_sent, packets_recv, errors, drops,
+                       peak_bytes_sent, peak_bytes_recv
+                FROM interface_stats
+                WHERE interface = ?
+                ORDER BY ts DESC
+            ''', (interface,))
+            return cursor.fetchall()
 
     def close(self):
         logger.info("Closing database connection")
+        self.writer.stop()
+        with self._reader_lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
         self.conn.close()
 
     def get_host_id(self, name: str) -> int:
@@ -183,27 +731,74 @@ class Database:
                 logger.warning(f"No host found with name: {name}")
                 return None
 
-    def get_latency_history(self, host_id: int) -> List[tuple]:
+    def _history_page(self, columns: str, condition: Optional[str], host_id: int, since: Optional[int],
+                      until: Optional[int], limit: Optional[int], cursor: Optional[tuple],
+                      ascending: bool) -> tuple[List[tuple], Optional[tuple]]:
+        # Keyset pagination on (host_id, ts, run_id): a page starts strictly after the cursor,
+        # so the cost of a page does not depend on how deep into the history it is
+        clauses = ['host_id = ?']
+        params = [host_id]
+        if condition:
+            clauses.append(condition)
+        if since is not None:
+            clauses.append('ts >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('ts < ?')
+            params.append(until)
+        if cursor is not None:
+            clauses.append('(ts, run_id) > (?, ?)' if ascending else '(ts, run_id) < (?, ?)')
+            params.extend(cursor)
+        order = 'ASC' if ascending else 'DESC'
+        query = f'SELECT ts, {columns}, run_id FROM mesures WHERE {" AND ".join(clauses)} ' \
+                f'ORDER BY ts {order}, run_id {order}'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        self.flush()
+        rows = self.reader().execute(query, params).fetchall()
+        next_cursor = (rows[-1][0], rows[-1][-1]) if limit is not None and len(rows) == limit else None
+        return [row[:-1] for row in rows], next_cursor
+
+    def get_history_page(self, host_id: int, since: Optional[int] = None, until: Optional[int] = None,
+                         limit: int = 500, cursor: Optional[tuple] = None,
+                         ascending: bool = False) -> tuple[List[tuple], Optional[tuple]]:
+        """Return up to limit runs in [since, until) and the cursor of the next page (None on the last one).
+
+        Rows are (ts, latence, packets_perdus, upload, download), newest first unless ascending.
+        """
+        logger.debug(f"Fetching history page for host_id {host_id} after cursor {cursor}")
+        return self._history_page('latence, packets_perdus, upload, download', None,
+                                  host_id, since, until, limit, cursor, ascending)
+
+    def iter_history(self, host_id: int, since: Optional[int] = None, until: Optional[int] = None,
+                     page_size: int = 500, ascending: bool = False) -> Iterator[tuple]:
+        # Streams the history one page at a time, only a single page is ever held in memory
+        cursor = None
+        while True:
+            rows, cursor = self.get_history_page(host_id, since, until, page_size, cursor, ascending)
+            yield from rows
+            if cursor is None:
+                return
+
+    def get_history(self, host_id: int, since: Optional[int] = None, until: Optional[int] = None,
+                    limit: Optional[int] = None, cursor: Optional[tuple] = None) -> List[tuple]:
+        # (ts, latence, packets_perdus, upload, download), newest run first
+        logger.info(f"Fetching measurement history for host_id: {host_id}")
+        return self._history_page('latence, packets_perdus, upload, download', None,
+                                  host_id, since, until, limit, cursor, False)[0]
+
+    def get_latency_history(self, host_id: int, since: Optional[int] = None, until: Optional[int] = None,
+                            limit: Optional[int] = None, cursor: Optional[tuple] = None) -> List[tuple]:
         logger.info(f"Fetching latency history for host_id: {host_id}")
-        with self.conn:
-            cursor = self.conn.execute('''
-                SELECT date, valeur, packets_perdus
-                FROM latence
-                WHERE host_id = ?
-                ORDER BY date DESC
-            ''', (host_id,))
-            return cursor.fetchall()
+        return self._history_page('latence, packets_perdus', 'latence IS NOT NULL',
+                                  host_id, since, until, limit, cursor, False)[0]
 
-    def get_bandwidth_history(self, host_id: int) -> List[tuple]:
+    def get_bandwidth_history(self, host_id: int, since: Optional[int] = None, until: Optional[int] = None,
+                              limit: Optional[int] = None, cursor: Optional[tuple] = None) -> List[tuple]:
         logger.info(f"Fetching bandwidth history for host_id: {host_id}")
-        with self.conn:
-            cursor = self.conn.execute('''
-                SELECT date, upload, download
-                FROM bande_passante
-                WHERE host_id = ?
-                ORDER BY date DESC
-            ''', (host_id,))
-            return cursor.fetchall()
+        return self._history_page('upload, download', 'upload IS NOT NULL',
+                                  host_id, since, until, limit, cursor, False)[0]
 
     def update_host(self, old_name: str, new_name: str, new_ip: str):
         logger.info(f"Updating host: {old_name} -> {new_name}, {new_ip}")
@@ -216,12 +811,14 @@ class Database:
 
     def delete_host(self, name: str):
         logger.info(f"Deleting host: {name}")
+        self.flush()
         with self.conn:
             host_id = self.get_host_id(name)
             if host_id:
                 self.conn.execute('DELETE FROM hosts WHERE id = ?', (host_id,))
-                self.conn.execute('DELETE FROM latence WHERE host_id = ?', (host_id,))
-                self.conn.execute('DELETE FROM bande_passante WHERE host_id = ?', (host_id,))
+                self.conn.execute('DELETE FROM mesures WHERE host_id = ?', (host_id,))
+                self.conn.execute('DELETE FROM rollups WHERE host_id = ?', (host_id,))
+                self.invalidate_statistics(host_id)
                 logger.info(f"Host and associated data deleted for {name}")
             else:
                 logger.warning(f"No host found with name: {name}")
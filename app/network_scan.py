@@ -1,95 +1,274 @@
+import asyncio
+import ipaddress
+import logging
+import math
+import os
+import socket
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, as_completed
 import nmap
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QComboBox, QProgressBar, QTextEdit, QMessageBox
 from PyQt5.QtCore import pyqtSignal, QThread, pyqtSlot, QRegExp
 from PyQt5.QtGui import  QRegExpValidator, QPalette, QColor
+from host_discovery import DiscoveryThread
+from port_scanner import AsyncPortScanner
+from service_fingerprint import ServiceFingerprinter
+from inventory import describe_change
+from geoip import describe_location
+
+logger = logging.getLogger(__name__)
+
+# Label shown in the method list -> DiscoveryThread method, None runs nmap -sn
+SCAN_METHODS = [("Auto (ARP/ICMP)", 'auto'), ("ARP", 'arp'), ("ICMP", 'icmp'), ("TCP", 'tcp'), ("nmap", None)]
+
+def split_network(ip_range, workers):
+    """Split a CIDR into sub-networks: at most 256 addresses each, and at least two per worker."""
+    network = ipaddress.ip_network(ip_range, strict=False)
+    parts = max(2 * workers, network.num_addresses // 256)
+    prefix = min(network.max_prefixlen, network.prefixlen + math.ceil(math.log2(parts)))
+    return [str(subnet) for subnet in network.subnets(new_prefix=prefix)]
+
+
+def parse_ports(port_range):
+    # "1-1024", "22,80,443" or a mix of both
+    ports = set()
+    for part in port_range.replace(' ', '').split(','):
+        if '-' in part:
+            start, end = map(int, part.split('-'))
+            ports.update(range(start, end + 1))
+        elif part:
+            ports.add(int(part))
+    return sorted(ports)
+
+
+def split_ports(ports, parts):
+    """Split sorted ports into at most parts contiguous nmap port specifications."""
+    size = math.ceil(len(ports) / max(1, parts)) if ports else 0
+    specs = []
+    for offset in range(0, len(ports), size or 1):
+        chunk = ports[offset:offset + size]
+        ranges = []
+        start = previous = chunk[0]
+        for port in chunk[1:]:
+            if port != previous + 1:
+                ranges.append(f"{start}-{previous}" if start != previous else str(start))
+                start = port
+            previous = port
+        ranges.append(f"{start}-{previous}" if start != previous else str(start))
+        specs.append(','.join(ranges))
+    return specs
+
+
+def service_name(port):
+    try:
+        return socket.getservbyport(port, 'tcp')
+    except OSError:
+        return ''
+
+
+def scan_hosts_chunk(hosts, arguments='-sn'):
+    # Runs in a worker process, each worker drives its own nmap
+    nm = nmap.PortScanner()
+    nm.scan(hosts=hosts, arguments=arguments)
+    found = []
+    for host in nm.all_hosts():
+        if nm[host].state() == 'up':
+            found.append({
+                'ip': host,
+                'hostname': nm[host].hostname(),
+                'status': 'Up',
+                'adresse_mac': nm[host]['addresses'].get('mac', 'N/A')
+            })
+    return found
+
+
+def scan_ports_chunk(ip, ports, arguments=''):
+    # Runs in a worker process, state of every TCP port nmap reported
+    nm = nmap.PortScanner()
+    nm.scan(ip, arguments=f'{arguments} -p {ports}'.strip())
+    if ip not in nm.all_hosts():
+        return []
+    return [[port, info['state']] for port, info in sorted(nm[ip].get('tcp', {}).items())]
+
 
 class NetworkScanner(QWidget):
+    """nmap scans split into chunks and run by a pool of worker processes."""
     scan_complete = pyqtSignal(list)
-    
-    def __init__(self):
+    chunk_complete = pyqtSignal(list)
+    scan_progress = pyqtSignal(int, int, float)  # addresses done, total, estimated seconds left
+    chunk_failed = pyqtSignal(str, str)  # sub-network, error
+
+    def __init__(self, max_workers=None, cache=None):
         super().__init__()
-        self.nm = nmap.PortScanner()
+        self.cache = cache
+        self.fingerprinter = ServiceFingerprinter(cache=cache)
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.pool = None
+
+    def executor(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.pool
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
 
     def scan_network(self, ip_range):
-        print(f"Scanning network: {ip_range}")
-        self.nm.scan(hosts=ip_range, arguments='-sn')
+        logger.info(f"Scanning network: {ip_range}")
+        chunks = split_network(ip_range, self.max_workers)
+        sizes = {chunk: ipaddress.ip_network(chunk).num_addresses for chunk in chunks}
+        total = sum(sizes.values())
+        done = 0
         hosts = []
-        for host in self.nm.all_hosts():
-            if self.nm[host].state() == 'up':
-                hosts.append({
-                    'ip': host,
-                    'hostname': self.nm[host].hostname(),
-                    'status': 'Up',
-                    'adresse_mac': self.nm[host]['addresses'].get('mac', 'N/A')
-                })
+        started = time.monotonic()
+        futures = {self.executor().submit(scan_hosts_chunk, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                found = future.result()
+            except CancelledError:
+                continue
+            except Exception as e:
+                logger.error(f"Scan of {chunk} failed: {str(e)}")
+                self.chunk_failed.emit(chunk, str(e))
+                found = []
+            done += sizes[chunk]
+            hosts.extend(found)
+            elapsed = time.monotonic() - started
+            self.chunk_complete.emit(found)
+            self.scan_progress.emit(done, total, elapsed / done * (total - done))
+        logger.info(f"Scan of {ip_range} done: {len(hosts)} hosts up in {time.monotonic() - started:.1f}s")
         self.scan_complete.emit(hosts)
 
-    def scan_ports(self, ip, port_range):
-        self.nm.scan(ip, arguments=f'-p {port_range}')
-        open_ports = []
-        for port in self.nm[ip]['tcp']:
-            if self.nm[ip]['tcp'][port]['state'] == 'open':
-                open_ports.append({
-                    'port': port,
-                    'service': self.nm[ip]['tcp'][port]['name'],
-                    'version': self.nm[ip]['tcp'][port]['version']
-                })
-        return open_ports
-    
-    def scan_ports_anomaly(self, ip, port_range):
-        self.nm.scan(ip, arguments=f'-p {port_range}')
-        port_status = []
-        start_port, end_port = map(int, port_range.split('-'))
-        for port in range(start_port, end_port+1):
-            if port in self.nm[ip]['tcp']:
-                status = self.nm[ip]['tcp'][port]['state']
-                service = self.nm[ip]['tcp'][port]['name']
-                version = self.nm[ip]['tcp'][port]['version']
-            else:
-                status = 'closed'
-                service = ''
-                version = ''
-            port_status.append({
-                'port': port,
-                'status': status,
-                'service': service,
-                'version': version
-            })
-        return port_status
+    def cached(self, target, scan_type, arguments, scan, force_refresh=False):
+        if self.cache is None:
+            return scan()
+        return self.cache.cached(target, scan_type, arguments, scan, force_refresh)
 
-    def detect_os(self, ip):
-        
-        self.nm.scan(ip, arguments='-O')
-        if 'osmatch' in self.nm[ip]:
-            return self.nm[ip]['osmatch'][0]['name']
-        return 'Unknown'
+    async def scan_open_ports(self, ip, ports, scanner=None, force_refresh=False):
+        """Yield (port, state) for the ports that are not closed, from the built-in connect scanner
+        or the cache. The result is only cached when the scan ran to the end."""
+        key = ','.join(split_ports(ports, 1))
+        cached = None if self.cache is None or force_refresh else self.cache.get(ip, 'ports-connect', key)
+        if cached is not None:
+            for port, state in cached:
+                yield port, state
+            return
+        scanner = scanner or AsyncPortScanner()
+        found = []
+        async for port, state in scanner.scan(ip, ports):
+            if state != 'closed':
+                found.append([port, state])
+                yield port, state
+        if not scanner.stopped and self.cache is not None:
+            self.cache.put(ip, 'ports-connect', key, found)
+
+    async def scan_nmap_ports(self, ip, ports, cancelled=None, force_refresh=False):
+        """Yield (port, state) for the ports nmap does not report closed, the port list split
+        across the worker processes and each part yielded as soon as it is scanned. The result
+        is only cached when every part was scanned."""
+        key = f"-p {','.join(split_ports(ports, 1))}"
+        cached = None if self.cache is None or force_refresh else self.cache.get(ip, 'ports', key)
+        if cached is not None:
+            for port, state in cached:
+                yield port, state
+            return
+        loop = asyncio.get_running_loop()
+        futures = [asyncio.wrap_future(self.executor().submit(scan_ports_chunk, ip, spec), loop=loop)
+                   for spec in split_ports(ports, self.max_workers)]
+        pending = set(futures)
+        found = []
+        failed = False
+        try:
+            while pending and not (cancelled and cancelled()):
+                done, pending = await asyncio.wait(pending, timeout=0.2, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        states = future.result()
+                    except Exception as e:
+                        logger.error(f"Port scan of {ip} failed: {str(e)}")
+                        failed = True
+                        continue
+                    for port, state in states:
+                        if state != 'closed':
+                            found.append([port, state])
+                            yield port, state
+        finally:
+            for future in pending:
+                future.cancel()
+        if not (pending or failed) and self.cache is not None:
+            self.cache.put(ip, 'ports', key, sorted(found))
+
+    def detect_os(self, ip, force_refresh=False):
+        def scan():
+            # A scanner per call, PortScanner keeps the results of its last scan
+            nm = nmap.PortScanner()
+            nm.scan(ip, arguments='-O')
+            if 'osmatch' in nm[ip]:
+                return nm[ip]['osmatch'][0]['name']
+            return 'Unknown'
+
+        return self.cached(ip, 'os', '-O', scan, force_refresh)
 
 
 class NetworkScannerWidget(QWidget):
-    def __init__(self):
+    def __init__(self, cache=None, inventory=None, geoip=None, reverse_dns=None):
         super().__init__()
-        self.network_scanner = NetworkScanner()
+        self.network_scanner = NetworkScanner(cache=cache)
+        self.inventory = inventory
+        self.geoip = geoip
+        self.reverse_dns = reverse_dns
+        if reverse_dns is not None:
+            reverse_dns.name_resolved.connect(self.name_resolved)
+        self.scan_hosts = []
+        # ip -> (row, host) of the hosts still without a name
+        self.unnamed_rows = {}
+        self.scan_range = None
+        self.scan_cancelled = False
+        # Errors of the running scan: failed nmap chunks, or the whole discovery sweep
+        self.failed_chunks = []
+        self.scan_error = None
         self.input_field = QLineEdit()
+        self.method_combo = QComboBox()
+        for label, method in SCAN_METHODS:
+            self.method_combo.addItem(label, method)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
         self.scan_button = QPushButton("Scan")
         self.scan_button.clicked.connect(self.start_scan)
         self.table = QTableWidget()
         
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["IP", "Hostname", "Status", "Adresse MAC"])
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(["IP", "Hostname", "Status", "Adresse MAC", "Localisation"])
         header = self.table.horizontalHeader()       
         header.setSectionResizeMode(0, QHeaderView.Stretch)
         header.setSectionResizeMode(1, QHeaderView.Stretch)
         header.setSectionResizeMode(2, QHeaderView.Stretch)
         header.setSectionResizeMode(3, QHeaderView.Stretch)
+        header.setSectionResizeMode(4, QHeaderView.Stretch)
        
         
         layout = QVBoxLayout()
-        layout.addWidget(self.input_field)
+        input_layout = QHBoxLayout()
+        input_layout.addWidget(self.input_field)
+        input_layout.addWidget(self.method_combo)
+        layout.addLayout(input_layout)
         layout.addWidget(self.scan_button)
+        layout.addWidget(self.progress_bar)
         layout.addWidget(self.table)
+        # Differences with the previous scans of the range, filled when a scan ends
+        self.changes_display = QTextEdit()
+        self.changes_display.setReadOnly(True)
+        self.changes_display.setMaximumHeight(120)
+        self.changes_display.setVisible(inventory is not None)
+        layout.addWidget(self.changes_display)
         self.table.setContentsMargins(10, 10, 10, 10)
         self.setLayout(layout)
-        self.network_scanner.scan_complete.connect(self.display_scan_results)
+        self.network_scanner.chunk_complete.connect(self.add_host_rows)
+        self.network_scanner.chunk_failed.connect(self.chunk_failed)
+        self.network_scanner.scan_progress.connect(self.update_scan_progress)
         self.setWindowTitle("Scan Réseau")
         self.setMinimumSize(1000, 800)
 
@@ -173,33 +352,102 @@ class NetworkScannerWidget(QWidget):
     def start_scan(self):
         self.scan_button.setEnabled(False)
         self.input_field.setEnabled(False)
+        self.method_combo.setEnabled(False)
+        self.table.setRowCount(0)
         ip_range = self.input_field.text()
-        self.scan_thread = ScanThread(self.network_scanner, ip_range)
+        self.scan_hosts = []
+        self.unnamed_rows = {}
+        self.scan_range = ip_range
+        self.failed_chunks = []
+        self.scan_error = None
+        method = self.method_combo.currentData()
+        # Hosts are added to the table as they answer, or as each nmap chunk finishes
+        if method is None:
+            self.scan_thread = ScanThread(self.network_scanner, ip_range)
+        else:
+            # The shared resolver names the hosts once they are in the table, without holding the sweep
+            self.scan_thread = DiscoveryThread(ip_range, method, resolve_names=self.reverse_dns is None)
+            self.scan_thread.host_found.connect(self.add_host_row)
+            self.scan_thread.progress.connect(self.update_progress)
+            self.scan_thread.error.connect(self.discovery_failed)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
+        self.progress_bar.setVisible(True)
         self.scan_thread.finished.connect(self.scan_finished)
         self.scan_thread.start()
 
     def scan_finished(self):
         self.scan_button.setEnabled(True)
         self.input_field.setEnabled(True)
+        self.method_combo.setEnabled(True)
+        self.progress_bar.setVisible(False)
         self.scan_thread = None
+        if self.scan_error is not None:
+            # A sweep that failed says nothing about the hosts it did not report
+            QMessageBox.critical(self, "Erreur", f"Échec du scan de {self.scan_range}: {self.scan_error}")
+            return
+        if self.failed_chunks:
+            QMessageBox.warning(self, "Scan incomplet", "Échec du scan de:\n" + "\n".join(
+                f"{chunk}: {error}" for chunk, error in self.failed_chunks))
+        if self.inventory is not None and not self.scan_cancelled:
+            changes = self.inventory.record_hosts(self.scan_range, self.scan_hosts,
+                                                  [chunk for chunk, _ in self.failed_chunks])
+            self.changes_display.clear()
+            self.changes_display.append(f"{len(changes)} changement(s) sur {self.scan_range}")
+            for change in changes:
+                self.changes_display.append(describe_change(change))
+
+    def chunk_failed(self, chunk, error):
+        self.failed_chunks.append((chunk, error))
+
+    def discovery_failed(self, error):
+        self.scan_error = error
+
+    def update_progress(self, sent, total):
+        self.progress_bar.setMaximum(max(total, 1))
+        self.progress_bar.setValue(sent)
+
+    def update_scan_progress(self, done, total, eta):
+        self.update_progress(done, total)
+        self.progress_bar.setFormat(f"%p% - environ {eta:.0f} s restantes")
+
+    def add_host_rows(self, hosts):
+        # One bulk GeoIP lookup for the whole chunk
+        locations = self.geoip.lookup_many(host['ip'] for host in hosts) if self.geoip is not None else {}
+        if self.reverse_dns is not None:
+            self.reverse_dns.request(host['ip'] for host in hosts if not host['hostname'])
+        for host in hosts:
+            self.add_host_row(host, locations.get(host['ip']))
+
+    def add_host_row(self, host, location=None):
+        if location is None and self.geoip is not None:
+            location = self.geoip.lookup(host['ip'])
+        if not host['hostname'] and self.reverse_dns is not None:
+            host['hostname'] = self.reverse_dns.name(host['ip']) or ''
+        self.scan_hosts.append(host)
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        if not host['hostname']:
+            self.unnamed_rows[host['ip']] = (row, host)
+        self.table.setItem(row, 0, QTableWidgetItem(host['ip']))
+        self.table.setItem(row, 1, QTableWidgetItem(host['hostname']))
+        self.table.setItem(row, 2, QTableWidgetItem(host['status']))
+        self.table.setItem(row, 3, QTableWidgetItem(host['adresse_mac']))
+        self.table.setItem(row, 4, QTableWidgetItem(describe_location(location or {})))
 
-    def display_scan_results(self, hosts):
-        self.table.setRowCount(len(hosts))
-        print(f"hosts number: {len(hosts)}")
-        for i, host in enumerate(hosts):
-            ip = host['ip']
-            hostname = host['hostname']
-            status = host['status']
-            adresse_mac = host['adresse_mac']
-            self.table.setItem(i, 0, QTableWidgetItem(ip))
-            self.table.setItem(i, 1, QTableWidgetItem(hostname))
-            self.table.setItem(i, 2, QTableWidgetItem(status))
-            self.table.setItem(i, 3, QTableWidgetItem(adresse_mac))
-            
+    def name_resolved(self, ip, name):
+        if ip in self.unnamed_rows:
+            row, host = self.unnamed_rows.pop(ip)
+            host['hostname'] = name
+            self.table.setItem(row, 1, QTableWidgetItem(name))
 
     def closeEvent(self, event):
-        if self.scan_thread is not None:
-            self.scan_thread.quit()
+        # Chunks not started yet are cancelled, running ones finish before the window closes
+        self.scan_cancelled = True
+        self.network_scanner.shutdown()
+        if isinstance(self.scan_thread, DiscoveryThread):
+            self.scan_thread.stop()
+        elif self.scan_thread is not None:
             self.scan_thread.wait()
         event.accept()
 
@@ -1,17 +1,76 @@
+from collections import defaultdict, deque
+import threading
 from scapy.all import sniff, IP, TCP, UDP, ICMP, ARP
 from PyQt5.QtCore import QObject, pyqtSignal, QThread
-from PyQt5.QtWidgets import QWidget, QListWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QHBoxLayout, QAbstractItemView, QHeaderView, QListWidget, QListWidgetItem
+from PyQt5.QtWidgets import QWidget, QListWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QHBoxLayout, QAbstractItemView, QHeaderView, QListWidget, QListWidgetItem, QPushButton, QFileDialog, QMessageBox
 from PyQt5.QtGui import QPalette, QColor
 
+def packet_to_info(packet) -> dict:
+    packet_info = {
+        "time": float(packet.time),
+        "length": len(packet),
+        "source": packet[IP].src if IP in packet else packet.src,
+        "destination": packet[IP].dst if IP in packet else packet.dst,
+        "protocol": "Unknown",
+        "sport": None,
+        "dport": None,
+        "tcp_flags": None
+    }
+
+    if IP in packet:
+        if TCP in packet:
+            packet_info["protocol"] = "TCP"
+            packet_info["sport"] = packet[TCP].sport
+            packet_info["dport"] = packet[TCP].dport
+            packet_info["tcp_flags"] = str(packet[TCP].flags)
+        elif UDP in packet:
+            packet_info["protocol"] = "UDP"
+            packet_info["sport"] = packet[UDP].sport
+            packet_info["dport"] = packet[UDP].dport
+        elif ICMP in packet:
+            packet_info["protocol"] = "ICMP"
+    elif ARP in packet:
+        packet_info["protocol"] = "ARP"
+
+    if packet_info["protocol"] in ["TCP", "UDP"]:
+        if packet_info["sport"] == 110 or packet_info["dport"] == 110:
+            packet_info["protocol"] = "POP"
+        elif packet_info["sport"] == 25 or packet_info["dport"] == 25:
+            packet_info["protocol"] = "SMTP"
+    return packet_info
+
+
+def update_flows(flows: dict, packet_info: dict):
+    # Flows are keyed on the 5-tuple: [first seen, last seen, packets, bytes]
+    key = (packet_info["source"], packet_info["sport"], packet_info["destination"],
+           packet_info["dport"], packet_info["protocol"])
+    flow = flows.get(key)
+    if flow is None:
+        flows[key] = [packet_info["time"], packet_info["time"], 1, packet_info["length"]]
+    else:
+        flow[1] = packet_info["time"]
+        flow[2] += 1
+        flow[3] += packet_info["length"]
+
+
+def flows_to_rows(flows: dict) -> list:
+    return [key + tuple(value) for key, value in flows.items()]
+
+
 class PacketCapture(QObject):
     packet_captured = pyqtSignal(dict)
 
-    def __init__(self, target_ip):
+    def __init__(self, target_ip, hosts=None):
         super().__init__()
+        self.hosts = hosts
         self.is_capturing = False
         self.packet_list = QListWidget()
         self.max_packets = 1000  # Maximum number of packets to capture
         self.target_ip = target_ip
+        # Kept for export, the sniffer thread appends while the GUI thread reads snapshots
+        self.lock = threading.Lock()
+        self.packets = deque(maxlen=self.max_packets)
+        self.flows = {}
 
     def start_capture(self):
         self.is_capturing = True
@@ -24,35 +83,17 @@ class PacketCapture(QObject):
         self.sniff_thread.wait()
 
     def process_packet(self, packet):
-        packet_info = {
-            "source": packet[IP].src if IP in packet else packet.src,
-            "destination": packet[IP].dst if IP in packet else packet.dst,
-            "protocol": "Unknown",
-            "sport": None,
-            "dport": None,
-            "tcp_flags": None
-        }
-
-        if IP in packet:
-            if TCP in packet:
-                packet_info["protocol"] = "TCP"
-                packet_info["sport"] = packet[TCP].sport
-                packet_info["dport"] = packet[TCP].dport
-                packet_info["tcp_flags"] = packet[TCP].flags
-            elif UDP in packet:
-                packet_info["protocol"] = "UDP"
-                packet_info["sport"] = packet[UDP].sport
-                packet_info["dport"] = packet[UDP].dport
-            elif ICMP in packet:
-                packet_info["protocol"] = "ICMP"
-        elif ARP in packet:
-            packet_info["protocol"] = "ARP"
-        
-        if packet_info["protocol"] in ["TCP", "UDP"]:
-            if packet_info["sport"] == 110 or packet_info["dport"] == 110:
-                packet_info["protocol"] = "POP"
-            elif packet_info["sport"] == 25 or packet_info["dport"] == 25:
-                packet_info["protocol"] = "SMTP"
+        packet_info = packet_to_info(packet)
+
+        # Label known hosts from the shared registry, no database lookup per packet
+        if self.hosts is not None:
+            for key in ("source", "destination"):
+                host = self.hosts.by_ip(packet_info[key])
+                packet_info[f"{key}_name"] = host.name if host else None
+
+        with self.lock:
+            self.packets.append(packet_info)
+            update_flows(self.flows, packet_info)
 
         self.packet_captured.emit(packet_info)
         self.packet_list.addItem(str(packet_info))
@@ -60,6 +101,10 @@ class PacketCapture(QObject):
     def get_packet_list(self):
         return self.packet_list
 
+    def snapshot(self):
+        with self.lock:
+            return list(self.packets), flows_to_rows(self.flows)
+
 class SniffThread(QThread):
     def __init__(self, packet_capture):
         super().__init__()
@@ -76,9 +121,14 @@ class SniffThread(QThread):
             self.quit()
 
 class PacketCaptureWidget(QWidget):
-    def __init__(self, target_ip):
+    def __init__(self, target_ip, hosts=None, reverse_dns=None):
         super().__init__()
-        self.packet_capture = PacketCapture(target_ip)
+        self.packet_capture = PacketCapture(target_ip, hosts)
+        self.reverse_dns = reverse_dns
+        # Address cells still waiting for a reverse DNS name, by IP
+        self.unnamed_items = defaultdict(list)
+        if reverse_dns is not None:
+            reverse_dns.name_resolved.connect(self.name_resolved)
         self.packet_table = QTableWidget()
         self.packet_table.setColumnCount(6)
         self.packet_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
@@ -99,6 +149,13 @@ class PacketCaptureWidget(QWidget):
         # Create layouts
         filter_layout = QVBoxLayout()
         filter_layout.addWidget(self.protocol_list)
+        self.export_packets_button = QPushButton("Exporter les paquets")
+        self.export_packets_button.clicked.connect(lambda: self.export_capture('packets'))
+        filter_layout.addWidget(self.export_packets_button)
+        self.export_flows_button = QPushButton("Exporter les flux")
+        self.export_flows_button.clicked.connect(lambda: self.export_capture('flows'))
+        filter_layout.addWidget(self.export_flows_button)
+        self.export_thread = None
 
         table_layout = QVBoxLayout()
         table_layout.addWidget(self.packet_table)
@@ -167,14 +224,66 @@ class PacketCaptureWidget(QWidget):
     def add_packet_to_table(self, packet_info):
         row = self.packet_table.rowCount()
         self.packet_table.insertRow(row)
-        self.packet_table.setItem(row, 0, QTableWidgetItem(str(packet_info["source"])))
+        self.packet_table.setItem(row, 0, self.address_item(packet_info, "source"))
         self.packet_table.setItem(row, 1, QTableWidgetItem(str(packet_info["sport"])))
-        self.packet_table.setItem(row, 2, QTableWidgetItem(str(packet_info["destination"])))
+        self.packet_table.setItem(row, 2, self.address_item(packet_info, "destination"))
         self.packet_table.setItem(row, 3, QTableWidgetItem(str(packet_info["dport"])))
         self.packet_table.setItem(row, 4, QTableWidgetItem(str(packet_info["protocol"])))
         self.packet_table.setItem(row, 5, QTableWidgetItem(str(packet_info["tcp_flags"])))
         self.filter_packets()
 
+    def export_capture(self, dataset):
+        from export import DATASETS, ExportThread, chunked, packet_rows, format_for_path
+        path, _ = QFileDialog.getSaveFileName(self, "Exporter la capture", f"{dataset}.csv",
+                                              "CSV (*.csv);;Parquet (*.parquet);;Arrow IPC (*.arrow);;NumPy (*.npz)")
+        if not path:
+            return
+        try:
+            format_for_path(path)
+        except ValueError as e:
+            QMessageBox.warning(self, "Erreur", str(e))
+            return
+        packets, flows = self.packet_capture.snapshot()
+        rows = packet_rows(packets) if dataset == 'packets' else flows
+        self.set_export_enabled(False)
+        self.export_thread = ExportThread(lambda: chunked(rows), DATASETS[dataset], path)
+        self.export_thread.export_finished.connect(self.on_export_finished)
+        self.export_thread.export_failed.connect(self.on_export_failed)
+        self.export_thread.start()
+
+    def set_export_enabled(self, enabled):
+        self.export_packets_button.setEnabled(enabled)
+        self.export_flows_button.setEnabled(enabled)
+
+    def on_export_finished(self, rows):
+        self.set_export_enabled(True)
+        QMessageBox.information(self, "Export", f"{rows} lignes exportées.")
+
+    def on_export_failed(self, error):
+        self.set_export_enabled(True)
+        QMessageBox.warning(self, "Erreur", f"Export impossible: {error}")
+
+    def closeEvent(self, event):
+        # The export thread reads the snapshot taken when it started, let it finish writing the file
+        if self.export_thread is not None:
+            self.export_thread.wait()
+        super().closeEvent(event)
+
+    def address_item(self, packet_info, key):
+        # Registered hosts keep their name, other addresses get their reverse DNS name once known
+        address = str(packet_info[key])
+        name = packet_info.get(f"{key}_name")
+        if name is None and self.reverse_dns is not None:
+            name = self.reverse_dns.name(address)
+        item = QTableWidgetItem(f"{address} ({name})" if name else address)
+        if name is None and self.reverse_dns is not None:
+            self.unnamed_items[address].append(item)
+        return item
+
+    def name_resolved(self, ip, name):
+        for item in self.unnamed_items.pop(ip, []):
+            item.setText(f"{ip} ({name})")
+
     def filter_packets(self):
         selected_protocols = [item.text() for item in self.protocol_list.selectedItems()]
         for row in range(self.packet_table.rowCount()):
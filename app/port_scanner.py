@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import logging
+import socket
+import time
+from typing import AsyncIterator, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+STATES = ('open', 'closed', 'filtered')
+
+
+class PortBitmap:
+    """Set of TCP ports stored as one bit per port (8 KB for the whole port space)."""
+    __slots__ = ('bits',)
+
+    def __init__(self, ports: Iterable[int] = ()):
+        self.bits = bytearray(8192)
+        for port in ports:
+            self.add(port)
+
+    def add(self, port: int):
+        self.bits[port >> 3] |= 1 << (port & 7)
+
+    def discard(self, port: int):
+        self.bits[port >> 3] &= ~(1 << (port & 7)) & 0xFF
+
+    def __contains__(self, port: int) -> bool:
+        return bool(self.bits[port >> 3] & (1 << (port & 7)))
+
+    def __iter__(self):
+        for index, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        yield index << 3 | bit
+
+    def __len__(self) -> int:
+        return bin(int.from_bytes(self.bits, 'little')).count('1')
+
+
+class PortStates:
+    """Result of a scan of one host: a bitmap per state, ports never probed are in none of them."""
+
+    def __init__(self):
+        self.bitmaps = {state: PortBitmap() for state in STATES}
+
+    def set(self, port: int, state: str):
+        for name, bitmap in self.bitmaps.items():
+            if name == state:
+                bitmap.add(port)
+            else:
+                bitmap.discard(port)
+
+    def state(self, port: int) -> Optional[str]:
+        return next((name for name, bitmap in self.bitmaps.items() if port in bitmap), None)
+
+    def ports(self, state: str) -> list:
+        return list(self.bitmaps[state])
+
+    def counts(self) -> dict:
+        return {state: len(bitmap) for state, bitmap in self.bitmaps.items()}
+
+
+class RttEstimator:
+    """Connect timeout derived from measured round trips, as TCP does (RFC 6298): srtt + 4 * rttvar."""
+
+    def __init__(self, initial: float = 1.0, minimum: float = 0.05, maximum: float = 3.0):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.srtt = None
+        self.rttvar = None
+
+    def update(self, rtt: float):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def timeout(self) -> float:
+        if self.srtt is None:
+            return self.initial
+        return min(self.maximum, max(self.minimum, self.srtt + 4 * self.rttvar))
+
+
+class HostRateLimiter:
+    """Spaces connection attempts to one host by at least 1 / rate seconds."""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncPortScanner:
+    """TCP connect scanner: accepted is open, refused is closed, no answer in time is filtered."""
+
+    def __init__(self, concurrency: int = 500, rate: Optional[float] = None, timeout: float = 1.0,
+                 min_timeout: float = 0.05, max_timeout: float = 3.0, retries: int = 1):
+        # Connections in flight across all hosts, attempts per second to each host
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.results = {}
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    async def scan(self, ip: str, ports: Iterable[int]) -> AsyncIterator[tuple]:
+        """Yield (port, state) for ip as each probe completes."""
+        async for _, port, state in self.scan_hosts([ip], ports):
+            yield port, state
+
+    async def scan_hosts(self, ips: Iterable[str], ports: Iterable[int]) -> AsyncIterator[tuple]:
+        """Yield (ip, port, state) as probes complete, hosts being scanned in parallel."""
+        ports = list(ports)
+        probes = asyncio.Queue()
+        results = asyncio.Queue()
+        hosts = {}
+        for ip in ips:
+            hosts[ip] = (RttEstimator(self.timeout, self.min_timeout, self.max_timeout),
+                         HostRateLimiter(self.rate))
+            self.results[ip] = PortStates()
+        # Port-major order spreads the workers over every host, each host's rate limit applies
+        # to its own share of the probes instead of holding up the whole pool
+        for port in ports:
+            for ip in hosts:
+                probes.put_nowait((ip, port))
+        total = probes.qsize()
+
+        async def worker():
+            while not self.stopped:
+                try:
+                    ip, port = probes.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                rtt, limiter = hosts[ip]
+                state = await self._probe(ip, port, rtt, limiter)
+                self.results[ip].set(port, state)
+                results.put_nowait((ip, port, state))
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(self.concurrency, total))]
+        done = asyncio.ensure_future(asyncio.gather(*workers))
+        done.add_done_callback(lambda _: results.put_nowait(None))
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(done, return_exceptions=True)
+
+    async def _probe(self, ip, port, rtt, limiter):
+        loop = asyncio.get_running_loop()
+        # Follows the round trips measured on the host, doubled for each retry of a filtered port
+        timeout = rtt.timeout()
+        for _ in range(self.retries + 1):
+            await limiter.wait()
+            family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout)
+                rtt.update(time.monotonic() - started)
+                return 'open'
+            except ConnectionRefusedError:
+                rtt.update(time.monotonic() - started)
+                return 'closed'
+            except asyncio.TimeoutError:
+                timeout = min(self.max_timeout, timeout * 2)
+            except OSError:
+                # Host or network unreachable, retrying will not help
+                return 'filtered'
+            finally:
+                sock.close()
+        return 'filtered'
+
+
+def main():
+    from network_scan import parse_ports
+    parser = argparse.ArgumentParser(description="TCP connect port scan")
+    parser.add_argument('hosts', nargs='+')
+    parser.add_argument('-p', '--ports', default='1-1024', help="e.g. 1-65535 or 22,80,443")
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--rate', type=float, help="Connection attempts per second and per host")
+    parser.add_argument('--timeout', type=float, default=1.0, help="Initial connect timeout in seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    async def run():
+        scanner = AsyncPortScanner(args.concurrency, args.rate, args.timeout)
+        started = time.monotonic()
+        async for ip, port, state in scanner.scan_hosts(args.hosts, parse_ports(args.ports)):
+            if state == 'open':
+                print(f"{ip}:{port} open")
+        for ip, states in scanner.results.items():
+            logger.info(f"{ip}: {states.counts()} in {time.monotonic() - started:.2f}s")
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+from PyQt5.QtCore import QObject, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+MISS = object()
+
+
+def is_ip(value: str) -> bool:
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+
+class NameCache:
+    """ip -> host name with an expiry, None being kept as a negative answer for a shorter time."""
+
+    def __init__(self, ttl: float = 3600.0, negative_ttl: float = 300.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # least recently used first
+        # The GUI thread reads the cache directly while the resolver thread fills it
+        self.lock = threading.Lock()
+
+    def get(self, ip: str):
+        """Cached name, None for a cached failure, MISS when unknown or expired."""
+        with self.lock:
+            entry = self.entries.get(ip)
+            if entry is None:
+                return MISS
+            expires, name = entry
+            if expires < time.monotonic():
+                del self.entries[ip]
+                return MISS
+            self.entries.move_to_end(ip)
+            return name
+
+    def put(self, ip: str, name: Optional[str]):
+        with self.lock:
+            self.entries[ip] = (time.monotonic() + (self.ttl if name else self.negative_ttl), name)
+            self.entries.move_to_end(ip)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class ReverseDNSResolver:
+    """PTR lookups through the system resolver on a bounded thread pool, with a shared cache."""
+
+    def __init__(self, cache: Optional[NameCache] = None, concurrency: int = 16, timeout: float = 2.0):
+        self.cache = cache or NameCache()
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='reverse-dns')
+        self.pending = {}
+
+    async def resolve(self, ip: str) -> Optional[str]:
+        name = self.cache.get(ip)
+        if name is not MISS:
+            return name
+        # Concurrent requests for the same address wait for a single lookup
+        if ip not in self.pending:
+            self.pending[ip] = asyncio.ensure_future(self._lookup(ip))
+            self.pending[ip].add_done_callback(lambda _: self.pending.pop(ip, None))
+        return await asyncio.shield(self.pending[ip])
+
+    async def resolve_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+        ips = list(dict.fromkeys(ips))
+        names = await asyncio.gather(*(self.resolve(ip) for ip in ips))
+        return dict(zip(ips, names))
+
+    async def _lookup(self, ip: str) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        # The system resolver rather than raw DNS queries: hosts files, NetBIOS/mDNS names and the
+        # configured servers work the same on Windows and Linux
+        try:
+            name, _ = await asyncio.wait_for(
+                loop.run_in_executor(self.pool, socket.getnameinfo, (ip, 0), socket.NI_NAMEREQD), self.timeout)
+        except (OSError, UnicodeError, asyncio.TimeoutError):
+            name = None
+        self.cache.put(ip, name)
+        return name
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ReverseDNSService(QObject):
+    """Qt side of the resolver, shared by the capture table, traceroute and scanner windows."""
+    name_resolved = pyqtSignal(str, str)
+
+    def __init__(self, resolver: Optional[ReverseDNSResolver] = None):
+        super().__init__()
+        self.resolver = resolver or ReverseDNSResolver()
+        # Addresses queued and not answered yet, so a table asking again does not queue them twice
+        self.in_flight = set()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='reverse-dns-loop', daemon=True)
+        self.thread.start()
+
+    def name(self, ip: str) -> Optional[str]:
+        # Never blocks: a miss queues a lookup and the name comes later through name_resolved
+        name = self.resolver.cache.get(ip)
+        if name is MISS:
+            self.request([ip])
+            return None
+        return name
+
+    def request(self, ips: Iterable[str]):
+        """Queue lookups for every address not cached yet, e.g. a whole scan chunk at once."""
+        missing = [ip for ip in dict.fromkeys(ips) if ip not in self.in_flight and is_ip(ip)
+                   and self.resolver.cache.get(ip) is MISS]
+        if missing:
+            self.in_flight.update(missing)
+            asyncio.run_coroutine_threadsafe(self._resolve_many(missing), self.loop)
+
+    async def _resolve(self, ip):
+        try:
+            name = await self.resolver.resolve(ip)
+        finally:
+            self.in_flight.discard(ip)
+        if name:
+            self.name_resolved.emit(ip, name)
+        return name
+
+    async def _resolve_many(self, ips):
+        await asyncio.gather(*(self._resolve(ip) for ip in ips))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1.0)
+        self.resolver.close()
@@ -0,0 +1,84 @@
+import json
+import logging
+import threading
+from typing import Optional
+from models import now_us
+
+logger = logging.getLogger(__name__)
+
+# Seconds a result stays valid, per scan type
+DEFAULT_TTLS = {'ports': 3600, 'ports-connect': 3600, 'os': 7 * 86400, 'service': 86400}
+# Results meaning the scan found nothing, kept only NEGATIVE_TTL seconds so the scan is retried soon
+NEGATIVE_RESULTS = {'os': 'Unknown'}
+NEGATIVE_TTL = 300
+
+UPSERT = '''
+    INSERT INTO scan_cache (target, scan_type, arguments, ts, result) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (target, scan_type, arguments) DO UPDATE SET ts = excluded.ts, result = excluded.result
+'''
+
+
+class ScanCache:
+    """Scan results keyed by (target, scan type, arguments), kept in memory and in the scan_cache table."""
+
+    def __init__(self, db, ttls: Optional[dict] = None):
+        self.db = db
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.purge()
+
+    def get(self, target: str, scan_type: str, arguments: str = ''):
+        key = (target, scan_type, arguments)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            self.db.flush()
+            row = self.db.reader().execute(
+                'SELECT ts, result FROM scan_cache WHERE target = ? AND scan_type = ? AND arguments = ?',
+                key).fetchone()
+            if row is None:
+                return None
+            entry = (row[0], json.loads(row[1]))
+            with self.lock:
+                self.entries[key] = entry
+        ts, result = entry
+        ttl = NEGATIVE_TTL if result == NEGATIVE_RESULTS.get(scan_type) else self.ttls.get(scan_type, 0)
+        if now_us() - ts > ttl * 1_000_000:
+            return None
+        logger.info(f"Using cached {scan_type} scan of {target} ({arguments})")
+        return result
+
+    def put(self, target: str, scan_type: str, arguments: str, result):
+        ts = now_us()
+        with self.lock:
+            self.entries[(target, scan_type, arguments)] = (ts, result)
+        # Through the writer thread, storing a result never blocks a scan
+        self.db.writer.submit(UPSERT, (target, scan_type, arguments, ts, json.dumps(result)))
+
+    def cached(self, target: str, scan_type: str, arguments: str, scan, force_refresh: bool = False):
+        """Return the cached result, or run scan() and cache what it returns."""
+        if not force_refresh:
+            result = self.get(target, scan_type, arguments)
+            if result is not None:
+                return result
+        result = scan()
+        self.put(target, scan_type, arguments, result)
+        return result
+
+    def invalidate(self, target: Optional[str] = None):
+        with self.lock:
+            self.entries = {key: entry for key, entry in self.entries.items()
+                            if target is not None and key[0] != target}
+        if target is None:
+            self.db.writer.submit('DELETE FROM scan_cache', ())
+        else:
+            self.db.writer.submit('DELETE FROM scan_cache WHERE target = ?', (target,))
+
+    def purge(self):
+        for scan_type, ttl in self.ttls.items():
+            self.db.writer.submit('DELETE FROM scan_cache WHERE scan_type = ? AND ts < ?',
+                                  (scan_type, now_us() - ttl * 1_000_000))
+        # Entries of scan types that are no longer cached
+        placeholders = ', '.join('?' * len(self.ttls))
+        self.db.writer.submit(f'DELETE FROM scan_cache WHERE scan_type NOT IN ({placeholders})', tuple(self.ttls))
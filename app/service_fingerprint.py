@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import re
+from collections import defaultdict
+from typing import Iterable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Probe(NamedTuple):
+    name: str
+    payload: bytes      # b'' only waits for the server to speak first
+    ports: tuple        # ports where this probe is sent before the generic ones
+
+
+class Signature(NamedTuple):
+    service: str
+    pattern: bytes      # matched from the start of the response, '.' also matches newlines
+    product: str = ''
+    version: bytes = b''  # groups of the pattern referenced as \1, \2..., e.g. rb'protocol \1'
+    ports: tuple = ()
+    ignore_case: bool = False
+
+
+PROBES = [
+    Probe('null', b'', ()),
+    Probe('http', b'GET / HTTP/1.0\r\n\r\n', (80, 81, 443, 591, 8000, 8008, 8080, 8081, 8443, 8888, 9000)),
+    Probe('redis', b'*1\r\n$4\r\nINFO\r\n', (6379,)),
+    Probe('generic', b'\r\n\r\n', ()),
+]
+
+SIGNATURES = [
+    Signature('ssh', rb'^SSH-[\d.]+-OpenSSH_([\w.]+)', 'OpenSSH', rb'\1', (22,)),
+    Signature('ssh', rb'^SSH-[\d.]+-dropbear_([\w.]+)', 'Dropbear sshd', rb'\1', (22,)),
+    Signature('ssh', rb'^SSH-([\d.]+)-', '', rb'protocol \1', (22,)),
+    Signature('ftp', rb'^220[ -].*?vsFTPd ([\w.]+)', 'vsftpd', rb'\1', (21,)),
+    Signature('ftp', rb'^220[ -].*?ProFTPD ([\w.]+)', 'ProFTPD', rb'\1', (21,)),
+    Signature('ftp', rb'^220[ -].*?FileZilla Server(?: version)? ([\w.]+)', 'FileZilla ftpd', rb'\1', (21,)),
+    Signature('ftp', rb'^220[ -][^\r\n]*ftp', '', b'', (21,), True),
+    Signature('smtp', rb'^220[ -][^\r\n]*ESMTP Postfix', 'Postfix smtpd', b'', (25, 587)),
+    Signature('smtp', rb'^220[ -][^\r\n]*ESMTP Exim ([\w.]+)', 'Exim smtpd', rb'\1', (25, 587)),
+    Signature('smtp', rb'^220[ -][^\r\n]*(?:E?SMTP|mail)', '', b'', (25, 587), True),
+    Signature('pop3', rb'^\+OK[^\r\n]*Dovecot', 'Dovecot pop3d', b'', (110,)),
+    Signature('pop3', rb'^\+OK', '', b'', (110,)),
+    Signature('imap', rb'^\* OK[^\r\n]*Dovecot', 'Dovecot imapd', b'', (143,)),
+    Signature('imap', rb'^\* OK[^\r\n]*IMAP', '', b'', (143,), True),
+    Signature('redis', rb'^\$\d+\r\n# Server\r\nredis_version:([\w.]+)', 'Redis', rb'\1', (6379,)),
+    Signature('redis', rb'^-NOAUTH', 'Redis', b'', (6379,)),
+    Signature('http', rb'^HTTP/1\.[01] \d\d\d .*?\r\nServer: nginx/([\w.]+)', 'nginx', rb'\1', (80, 443, 8080)),
+    Signature('http', rb'^HTTP/1\.[01] \d\d\d .*?\r\nServer: Apache/([\w.]+)', 'Apache httpd', rb'\1', (80, 443, 8080)),
+    Signature('http', rb'^HTTP/1\.[01] \d\d\d .*?\r\nServer: Microsoft-IIS/([\w.]+)', 'Microsoft IIS httpd', rb'\1', (80, 443)),
+    Signature('http', rb'^HTTP/1\.[01] \d\d\d .*?\r\nServer: ([^\r\n]+)', '', rb'\1', (80, 443, 8080), True),
+    Signature('http', rb'^HTTP/1\.[01] \d\d\d', '', b'', (80, 443, 8080)),
+    Signature('mysql', rb'^.\x00\x00\x00\x0a([\w.-]+)\x00', 'MySQL', rb'\1', (3306,)),
+    Signature('vnc', rb'^RFB (\d{3}\.\d{3})\n', 'VNC', rb'protocol \1', (5900,)),
+    Signature('telnet', rb'^\xff[\xfb-\xfe]', '', b'', (23,)),
+]
+
+# Bytes that can start a pattern without being a literal first byte
+_PATTERN_META = b'\\.[](){}*+?|^$'
+
+
+def _first_bytes(signature: Signature) -> Optional[set]:
+    """Bytes a response must start with to match, None when the pattern does not begin with a literal."""
+    pattern = signature.pattern[1:] if signature.pattern.startswith(b'^') else signature.pattern
+    if not pattern:
+        return None
+    if pattern[0] in _PATTERN_META:
+        # An escaped punctuation character is still a literal, classes like \d are not
+        if pattern[0] == ord('\\') and len(pattern) > 1 and not chr(pattern[1]).isalnum():
+            first = pattern[1]
+        else:
+            return None
+    else:
+        first = pattern[0]
+    if signature.ignore_case:
+        return {ord(chr(first).lower()), ord(chr(first).upper())}
+    return {first}
+
+
+class SignatureIndex:
+    """Signatures compiled once into alternations, grouped by port and by the first byte of the response."""
+
+    def __init__(self, signatures: Iterable[Signature] = SIGNATURES):
+        self.signatures = list(signatures)
+        # rb'protocol \1' -> [b'protocol ', 1]: literals and numbers of the groups of the signature
+        self.versions = [[int(part) if index % 2 else part
+                          for index, part in enumerate(re.split(rb'\\(\d)', signature.version)) if part]
+                         for signature in self.signatures]
+        by_port = defaultdict(list)
+        by_byte = defaultdict(list)
+        generic = []
+        for index, signature in enumerate(self.signatures):
+            for port in signature.ports:
+                by_port[port].append(index)
+            first = _first_bytes(signature)
+            if first is None:
+                generic.append(index)
+            else:
+                for byte in first:
+                    by_byte[byte].append(index)
+        self.by_port = {port: self._group(indexes) for port, indexes in by_port.items()}
+        self.by_byte = {byte: self._group(indexes) for byte, indexes in by_byte.items()}
+        self.generic = self._group(generic) if generic else None
+
+    @staticmethod
+    def _inline(signature: Signature) -> bytes:
+        return b'(?i:%s)' % signature.pattern if signature.ignore_case else signature.pattern
+
+    def _group(self, indexes):
+        # Each alternative is wrapped in a named group, the outermost group closing last is the one reported
+        return re.compile(b'|'.join(b'(?P<s%d>%s)' % (index, self._inline(self.signatures[index]))
+                                    for index in indexes), re.S)
+
+    def match(self, response: bytes, port: Optional[int] = None) -> Optional[dict]:
+        if not response:
+            return None
+        # Group of the port, then of the first byte, then the patterns that can start with anything:
+        # each try is one regex run over a handful of candidates instead of the whole list
+        for group in (self.by_port.get(port), self.by_byte.get(response[0]), self.generic):
+            if group is None:
+                continue
+            found = group.match(response)
+            if found:
+                index = int(found.lastgroup[1:])
+                # The groups of the matched signature come right after its named group
+                base = group.groupindex[found.lastgroup]
+                version = b''.join(part if isinstance(part, bytes) else found.group(base + part) or b''
+                                   for part in self.versions[index])
+                signature = self.signatures[index]
+                return {'service': signature.service, 'product': signature.product,
+                        'version': version.decode('latin-1').strip()}
+        return None
+
+
+def banner_hash(response: bytes) -> str:
+    return hashlib.sha1(response).hexdigest()
+
+
+class ServiceFingerprinter:
+    """Identifies the service on open TCP ports from what it answers to a few probes."""
+
+    def __init__(self, signatures: Optional[SignatureIndex] = None, probes: Iterable[Probe] = PROBES,
+                 cache=None, concurrency: int = 50, connect_timeout: float = 1.0,
+                 read_timeout: float = 2.0, max_response: int = 4096):
+        self.signatures = signatures or SignatureIndex()
+        self.probes = list(probes)
+        self.cache = cache
+        self.results = {}
+        self.last_probe = {}
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_response = max_response
+        self.loop = None
+        self.connections = None
+        self.concurrency = concurrency
+
+    def probe_order(self, ip: str, port: int) -> list:
+        # The port is left to speak first (SSH, FTP, SMTP... send a banner), then the probes meant
+        # for it and the generic ones; the probe that identified it last time goes first
+        null = [probe for probe in self.probes if not probe.payload]
+        specific = [probe for probe in self.probes if probe.payload and port in probe.ports]
+        others = [probe for probe in self.probes if probe.payload and port not in probe.ports]
+        order = null + specific + others
+        last = self.last_probe.get((ip, port))
+        if last in order:
+            order.remove(last)
+            order.insert(0, last)
+        return order
+
+    async def identify(self, ip: str, port: int) -> dict:
+        """Service, product, version and first response of ip:port, 'service' is '' when unknown."""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # A semaphore belongs to one event loop, each asyncio.run() gets its own
+            self.loop = loop
+            self.connections = asyncio.Semaphore(self.concurrency)
+        fallback = None
+        for probe in self.probe_order(ip, port):
+            async with self.connections:
+                response = await self.exchange(ip, port, probe.payload)
+            if response is None:
+                # Nothing listens anymore, later probes would fail the same way
+                break
+            if not response:
+                continue
+            # Cached by response hash, an unchanged service costs one exchange
+            key = (ip, port, banner_hash(response))
+            result = self._cached(key)
+            if result is None:
+                match = self.signatures.match(response, port)
+                if match is None:
+                    fallback = fallback or (key, probe, response)
+                    continue
+                result = {**match, 'banner': response[:256].decode('latin-1'), 'probe': probe.name}
+                self._store(key, result)
+            self.last_probe[(ip, port)] = probe
+            return result
+        if fallback is None:
+            return {'service': '', 'product': '', 'version': '', 'banner': '', 'probe': ''}
+        # Unknown service: the first response is remembered so the next run stops at it
+        key, probe, response = fallback
+        result = {'service': '', 'product': '', 'version': '', 'banner': response[:256].decode('latin-1'),
+                  'probe': probe.name}
+        self._store(key, result)
+        self.last_probe[(ip, port)] = probe
+        return result
+
+    async def identify_all(self, ip: str, ports: Iterable[int]) -> dict:
+        ports = list(ports)
+        results = await asyncio.gather(*(self.identify(ip, port) for port in ports))
+        return dict(zip(ports, results))
+
+    def _complete(self, response: bytes, port: int) -> bool:
+        # A product or version is as precise as the answer gets, no need to wait for the rest
+        match = self.signatures.match(response, port)
+        return match is not None and bool(match['product'] or match['version'])
+
+    async def exchange(self, ip: str, port: int, payload: bytes) -> Optional[bytes]:
+        """Response to payload, b'' when the server said nothing in time, None when the connection failed."""
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        response = b''
+        try:
+            if payload:
+                writer.write(payload)
+                await writer.drain()
+            timeout = self.read_timeout
+            while len(response) < self.max_response:
+                chunk = await asyncio.wait_for(reader.read(self.max_response - len(response)), timeout)
+                if not chunk:
+                    break
+                response += chunk
+                if self._complete(response, port):
+                    break
+                # Once the server has started answering, the rest comes quickly or not at all
+                timeout = min(timeout, 0.2)
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+        return response
+
+    def _cached(self, key):
+        if key in self.results:
+            return self.results[key]
+        if self.cache is not None:
+            ip, port, digest = key
+            result = self.cache.get(ip, 'service', f"{port}:{digest}")
+            if result is not None:
+                self.results[key] = result
+            return result
+        return None
+
+    def _store(self, key, result):
+        self.results[key] = result
+        if self.cache is not None:
+            ip, port, digest = key
+            self.cache.put(ip, 'service', f"{port}:{digest}", result)
+
+
+def describe_service(result: dict) -> str:
+    return ' '.join(part for part in (result['product'], result['version']) if part)
+
+
+def main():
+    from network_scan import parse_ports
+    parser = argparse.ArgumentParser(description="Identify the services listening on open TCP ports")
+    parser.add_argument('host')
+    parser.add_argument('-p', '--ports', default='21-25,80,110,143,443,3306,6379,8080')
+    parser.add_argument('--timeout', type=float, default=2.0, help="Seconds to wait for a response")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    fingerprinter = ServiceFingerprinter(read_timeout=args.timeout)
+    results = asyncio.run(fingerprinter.identify_all(args.host, parse_ports(args.ports)))
+    for port, result in results.items():
+        if result['probe']:
+            print(f"{port:>6}  {result['service'] or '?':<8} {describe_service(result)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,22 @@
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, 
-                            QPushButton, QTextEdit, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QLineEdit)
+                            QPushButton, QTextEdit, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QLineEdit,
+                            QCheckBox)
 from PyQt5.QtGui import QPalette, QColor, QFont
-from PyQt5.QtCore import pyqtSlot, Qt
-from network_scan import NetworkScanner
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, Qt, QThread
+import asyncio
+import logging
+import threading
+from network_scan import NetworkScanner, parse_ports, service_name
+from port_scanner import AsyncPortScanner
+from service_fingerprint import describe_service
+from inventory import describe_change
+
+logger = logging.getLogger(__name__)
 
 class ServiceOSDetection(QWidget):
-    def __init__(self, target_ip):
+    def __init__(self, target_ip, cache=None, inventory=None):
         super().__init__()
+        self.inventory = inventory
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
 
@@ -100,10 +110,26 @@ class ServiceOSDetection(QWidget):
         self.port_range_input.setPlaceholderText("Insérer un plage de ports (ex: 1-1024)")
         self.layout.addWidget(self.port_range_input)
 
+        self.force_refresh_checkbox = QCheckBox("Ignorer les résultats en cache")
+        self.layout.addWidget(self.force_refresh_checkbox)
+
+        self.nmap_ports_checkbox = QCheckBox("Scanner les ports avec nmap (processus parallèles)")
+        self.layout.addWidget(self.nmap_ports_checkbox)
+
         self.scan_button = QPushButton("Détecter Services et OS")
         self.scan_button.clicked.connect(self.start_detection)
         self.layout.addWidget(self.scan_button)
 
+        self.cancel_button = QPushButton("Annuler")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_detection)
+        self.layout.addWidget(self.cancel_button)
+        self.worker = None
+        # Worker whose nmap -O still runs, a cancelled one included: no other detection starts meanwhile
+        self.os_worker = None
+        self.closed = False
+        self.port_rows = {}
+
         self.results_display = QTextEdit()
         self.results_display.setMaximumHeight(80)
         self.layout.addWidget(self.results_display)
@@ -115,41 +141,190 @@ class ServiceOSDetection(QWidget):
         self.port_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.layout.addWidget(self.port_table)
 
-        self.network_scanner = NetworkScanner()
+        self.network_scanner = NetworkScanner(cache=cache)
         self.target_ip = target_ip
 
         self.port_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.port_table.setFixedWidth(1000)
         self.results_display.setReadOnly(True)
 
+        # A host detected recently shows its OS right away, without running nmap
+        cached_os = cache.get(target_ip, 'os', '-O') if cache is not None else None
+        if cached_os is not None:
+            self.results_display.append(f"IP: {target_ip}")
+            self.results_display.append(f"OS détecté (cache): {cached_os}")
+
     @pyqtSlot()
     def start_detection(self):
         ip = self.target_ip
-        port_range = self.port_range_input.text()
-        ports = self.network_scanner.scan_ports_anomaly(ip, port_range)
-        os = self.network_scanner.detect_os(ip)
+        try:
+            ports = parse_ports(self.port_range_input.text())
+        except ValueError:
+            self.results_display.setText("Plage de ports invalide (ex: 1-1024)")
+            return
 
         self.port_table.clearContents()
+        self.port_table.setRowCount(0)
+        self.port_rows = {}
         self.results_display.clear()
         self.results_display.append(f"IP: {ip}")
-        self.results_display.append(f"OS détecté: {os}")
-        # self.results_display.append("\nPorts ouverts et services:")
-        
-        # Populate the table
-        self.port_table.setRowCount(len(ports))
-        for row, port in enumerate(ports):
-            service_item = QTableWidgetItem(f"{port['service']} {port['version']}" if port['service'] else "-")
-            port_item = QTableWidgetItem(str(port['port']))
-            status_item = QTableWidgetItem(port['status'])
-            
-            self.port_table.setItem(row, 0, service_item)
-            self.port_table.setItem(row, 1, port_item)
-            self.port_table.setItem(row, 2, status_item)
-            
-            if port['status'] == 'open':
-                status_item.setBackground(QColor(255, 0, 0))  # Red background for open ports
-                # self.results_display.append(f"Port {port['port']}: {port['service']} {port['version']}")
-
-        # self.port_table.resizeColumnsToContents()
-        # self.port_table.resizeRowsToContents()
+        self.results_display.append("Détection en cours...")
+        self.scan_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+
+        self.worker = DetectionWorker(self.network_scanner, ip, ports, self.force_refresh_checkbox.isChecked(),
+                                      self.nmap_ports_checkbox.isChecked())
+        self.worker.port_found.connect(self.add_port_row)
+        self.worker.service_identified.connect(self.update_service)
+        self.worker.os_detected.connect(lambda os: self.results_display.append(f"OS détecté: {os}"))
+        self.worker.ports_scanned.connect(self.on_ports_scanned)
+        self.worker.os_finished.connect(self.os_detection_finished)
+        self.worker.finished.connect(self.detection_finished)
+        self.os_worker = self.worker
+        self.worker.start()
+
+    def cancel_detection(self):
+        if self.worker is not None:
+            self.results_display.append("Détection annulée")
+            self.worker.cancel()
+
+    def detection_finished(self):
+        self.cancel_button.setEnabled(False)
+        self.worker = None
+        if self.os_worker is not None:
+            self.results_display.append("Attente de la fin de la détection de l'OS...")
+        else:
+            self.scan_button.setEnabled(True)
+
+    def os_detection_finished(self):
+        self.os_worker = None
+        if self.closed:
+            self.network_scanner.shutdown()
+        elif self.worker is None:
+            self.scan_button.setEnabled(True)
+
+    def add_port_row(self, port):
+        row = self.port_table.rowCount()
+        self.port_table.insertRow(row)
+        self.port_rows[port['port']] = row
+        service_item = QTableWidgetItem(self.service_label(port))
+        port_item = QTableWidgetItem(str(port['port']))
+        status_item = QTableWidgetItem(port['status'])
+
+        self.port_table.setItem(row, 0, service_item)
+        self.port_table.setItem(row, 1, port_item)
+        self.port_table.setItem(row, 2, status_item)
+
+        if port['status'] == 'open':
+            status_item.setBackground(QColor(255, 0, 0))  # Red background for open ports
+
+    def update_service(self, port):
+        self.port_table.item(self.port_rows[port['port']], 0).setText(self.service_label(port))
+
+    @staticmethod
+    def service_label(port):
+        return f"{port['service']} {port['version']}".strip() if port['service'] else "-"
+
+    def on_ports_scanned(self, ports, rows):
+        closed = len(ports) - len(rows)
+        self.results_display.append(f"{len(rows)} ports ouverts ou filtrés, {closed} fermés")
+        if self.inventory is not None:
+            open_ports = {port['port']: port['service'] for port in rows if port['status'] == 'open'}
+            for change in self.inventory.record_ports(self.target_ip, open_ports, ports):
+                self.results_display.append(describe_change(change))
+
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        # A running nmap -O is left to finish, the scanner is shut down once it is done
+        self.closed = True
+        if self.os_worker is None:
+            self.network_scanner.shutdown()
+        event.accept()
+
+
+class DetectionWorker(QThread):
+    """Port scan and OS detection of one host, run together off the UI thread."""
+    port_found = pyqtSignal(dict)
+    os_detected = pyqtSignal(str)
+    service_identified = pyqtSignal(dict)
+    ports_scanned = pyqtSignal(list, list)  # every scanned port, rows of the open and filtered ones
+    os_finished = pyqtSignal()  # nmap -O is done, also after the worker itself finished
+
+    def __init__(self, network_scanner, ip, ports, force_refresh=False, use_nmap=False):
+        super().__init__()
+        self.network_scanner = network_scanner
+        self.ip = ip
+        self.ports = ports
+        self.force_refresh = force_refresh
+        self.use_nmap = use_nmap
+        self.scanner = AsyncPortScanner()
+        self.cancelled = False
+
+    def cancel(self):
+        # A running nmap -O cannot be interrupted, it is left to finish in the background
+        self.cancelled = True
+        self.scanner.stop()
+
+    def run(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        os_result = loop.create_future()
+
+        def detect_os():
+            try:
+                name = self.network_scanner.detect_os(self.ip, self.force_refresh)
+            except Exception as e:
+                logger.error(f"OS detection of {self.ip} failed: {str(e)}")
+                name = 'Unknown'
+            self.os_finished.emit()
+            try:
+                loop.call_soon_threadsafe(lambda: os_result.done() or os_result.set_result(name))
+            except RuntimeError:
+                pass  # the worker was cancelled and its loop is closed
+
+        threading.Thread(target=detect_os, daemon=True).start()
+        rows = await self._scan_ports()
+        if rows is not None:
+            self.ports_scanned.emit(self.ports, rows)
+        # Cancelling also stops waiting for nmap
+        while not self.cancelled:
+            try:
+                self.os_detected.emit(await asyncio.wait_for(asyncio.shield(os_result), 0.2))
+                break
+            except asyncio.TimeoutError:
+                continue
+
+    async def _scan_ports(self):
+        rows = []
+        identifications = []
+        if self.use_nmap:
+            results = self.network_scanner.scan_nmap_ports(self.ip, self.ports, lambda: self.cancelled,
+                                                           self.force_refresh)
+        else:
+            results = self.network_scanner.scan_open_ports(self.ip, self.ports, self.scanner, self.force_refresh)
+        async for port, state in results:
+            rows.append(self._row(port, state))
+            self.port_found.emit(rows[-1])
+            if state == 'open':
+                identifications.append(asyncio.ensure_future(self._identify(rows[-1])))
+
+        while identifications and not self.cancelled:
+            await asyncio.wait(identifications, timeout=0.2)
+            identifications = [task for task in identifications if not task.done()]
+        for task in identifications:
+            task.cancel()
+        return None if self.cancelled else rows
+
+    async def _identify(self, row):
+        result = await self.network_scanner.fingerprinter.identify(self.ip, row['port'])
+        if result['service']:
+            row['service'] = result['service']
+            row['version'] = describe_service(result)
+            self.service_identified.emit(row)
 
+    def _row(self, port, state):
+        return {'port': port, 'status': state, 'service': service_name(port), 'version': ''}
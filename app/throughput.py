@@ -0,0 +1,378 @@
+import argparse
+import socket
+import struct
+import tempfile
+import threading
+import time
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 5201
+TCP_BLOCK_SIZE = 128 * 1024
+UDP_PAYLOAD_SIZE = 1400
+
+# TCP: client -> responder, mode (U = client sends, D = responder sends) + duration in ms
+TCP_HEADER = struct.Struct('!cI')
+# TCP: responder -> client after an upload, bytes received + elapsed microseconds
+TCP_REPORT = struct.Struct('!QQ')
+# UDP: datagram kind (S start, P payload, F finish, R report) + sequence number
+UDP_HEADER = struct.Struct('!cQ')
+# UDP start request: direction, duration in ms, rate in kbit/s
+UDP_START = struct.Struct('!cII')
+# UDP report: bytes and packets received, highest sequence number seen
+UDP_REPORT = struct.Struct('!QQQ')
+
+
+@dataclass
+class ThroughputResult:
+    protocol: str
+    direction: str
+    streams: int
+    duration: float
+    bytes: int
+    mbps: float
+    packets_lost: int = 0
+
+
+def _payload_file(size):
+    payload = tempfile.TemporaryFile()
+    payload.write(bytes(size))
+    payload.flush()
+    return payload
+
+
+def _send_payload(sock, payload, deadline):
+    sent = 0
+    while time.monotonic() < deadline:
+        sent += sock.sendfile(payload, 0, TCP_BLOCK_SIZE)
+    return sent
+
+
+def _recv_all(sock, view):
+    received = 0
+    while True:
+        n = sock.recv_into(view)
+        if n == 0:
+            return received
+        received += n
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        data += chunk
+    return data
+
+
+def _pace(sent_bytes, started, rate_bps):
+    ahead = sent_bytes * 8 / rate_bps - (time.monotonic() - started)
+    if ahead > 0:
+        time.sleep(ahead)
+
+
+class ThroughputResponder:
+    def __init__(self, host='0.0.0.0', port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.running = False
+        self.threads = []
+        self.udp_sessions = {}
+        self.tcp_sock = None
+        self.udp_sock = None
+
+    def start(self):
+        self.tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp_sock.bind((self.host, self.port))
+        self.tcp_sock.listen(64)
+        # Port 0 lets the OS choose, the UDP socket follows the TCP one
+        self.port = self.tcp_sock.getsockname()[1]
+        self.tcp_sock.settimeout(0.5)
+
+        self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.udp_sock.bind((self.host, self.port))
+        self.udp_sock.settimeout(0.5)
+
+        self.running = True
+        for target in (self.serve_tcp, self.serve_udp):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Throughput responder listening on {self.host}:{self.port}")
+        return self.port
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.tcp_sock.close()
+        self.udp_sock.close()
+        logger.info("Throughput responder stopped")
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while self.running:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def serve_tcp(self):
+        while self.running:
+            try:
+                conn, address = self.tcp_sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self.handle_tcp, args=(conn, address), daemon=True).start()
+
+    def handle_tcp(self, conn, address):
+        with conn:
+            try:
+                mode, duration_ms = TCP_HEADER.unpack(_recv_exact(conn, TCP_HEADER.size))
+                if mode == b'U':
+                    view = memoryview(bytearray(TCP_BLOCK_SIZE))
+                    started = time.monotonic()
+                    received = _recv_all(conn, view)
+                    elapsed_us = int((time.monotonic() - started) * 1_000_000)
+                    conn.sendall(TCP_REPORT.pack(received, elapsed_us))
+                    logger.info(f"TCP upload from {address[0]}: {received} bytes")
+                elif mode == b'D':
+                    with _payload_file(TCP_BLOCK_SIZE) as payload:
+                        sent = _send_payload(conn, payload, time.monotonic() + duration_ms / 1000)
+                    logger.info(f"TCP download to {address[0]}: {sent} bytes")
+            except ConnectionError:
+                # Availability probes connect and close without sending a header
+                logger.debug(f"TCP connection from {address[0]} closed before completing a test")
+            except OSError as e:
+                logger.warning(f"TCP throughput session with {address[0]} aborted: {e}")
+
+    def serve_udp(self):
+        view = memoryview(bytearray(65536))
+        while self.running:
+            try:
+                n, address = self.udp_sock.recvfrom_into(view)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if n < UDP_HEADER.size:
+                continue
+            kind, seq = UDP_HEADER.unpack_from(view)
+            if kind == b'P':
+                session = self.udp_sessions.get(address)
+                if session is not None:
+                    session[0] += n
+                    session[1] += 1
+                    session[2] = max(session[2], seq)
+            elif kind == b'S':
+                direction, duration_ms, rate_kbps = UDP_START.unpack_from(view, UDP_HEADER.size)
+                if direction == b'U':
+                    self.udp_sessions[address] = [0, 0, 0]
+                else:
+                    threading.Thread(target=self.send_udp, args=(address, duration_ms, rate_kbps), daemon=True).start()
+            elif kind == b'F':
+                received, packets, last_seq = self.udp_sessions.pop(address, [0, 0, 0])
+                report = UDP_HEADER.pack(b'R', 0) + UDP_REPORT.pack(received, packets, last_seq)
+                self.udp_sock.sendto(report, address)
+
+    def send_udp(self, address, duration_ms, rate_kbps):
+        datagram = bytearray(UDP_PAYLOAD_SIZE)
+        rate_bps = rate_kbps * 1000
+        started = time.monotonic()
+        deadline = started + duration_ms / 1000
+        seq = 0
+        sent = 0
+        while self.running and time.monotonic() < deadline:
+            UDP_HEADER.pack_into(datagram, 0, b'P', seq)
+            sent += self.udp_sock.sendto(datagram, address)
+            seq += 1
+            _pace(sent, started, rate_bps)
+        # The finish marker may be dropped like any datagram, so send a few
+        for _ in range(3):
+            self.udp_sock.sendto(UDP_HEADER.pack(b'F', seq), address)
+        logger.info(f"UDP download to {address[0]}: {seq} datagrams")
+
+
+class ThroughputTester:
+    def __init__(self, host, port=DEFAULT_PORT, streams=4, duration=5.0, protocol='tcp', udp_rate_mbps=100.0):
+        self.host = host
+        self.port = port
+        self.streams = streams
+        self.duration = duration
+        self.protocol = protocol
+        self.udp_rate_mbps = udp_rate_mbps
+
+    def responder_available(self, timeout=1.0) -> bool:
+        try:
+            with socket.create_connection((self.host, self.port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    def measure(self) -> tuple[float, float]:
+        upload = self.run('upload')
+        download = self.run('download')
+        return upload.mbps, download.mbps
+
+    def run(self, direction) -> ThroughputResult:
+        logger.info(f"Starting {self.protocol.upper()} {direction} test to {self.host}:{self.port} "
+                    f"({self.streams} streams, {self.duration}s)")
+        if self.protocol == 'tcp':
+            target = self.tcp_upload if direction == 'upload' else self.tcp_download
+        else:
+            target = self.udp_upload if direction == 'upload' else self.udp_download
+
+        results = [None] * self.streams
+        errors = []
+
+        def run_stream(index):
+            try:
+                results[index] = target()
+            except (ConnectionError, OSError) as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run_stream, args=(i,)) for i in range(self.streams)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        total_bytes = sum(r[0] for r in results)
+        elapsed = max(r[1] for r in results) or self.duration
+        lost = sum(r[2] for r in results)
+        mbps = total_bytes * 8 / elapsed / 1_000_000
+        logger.info(f"{self.protocol.upper()} {direction} result: {mbps:.2f} Mbps ({total_bytes} bytes in {elapsed:.2f}s)")
+        return ThroughputResult(self.protocol, direction, self.streams, elapsed, total_bytes, mbps, lost)
+
+    def connect_tcp(self, mode):
+        sock = socket.create_connection((self.host, self.port), timeout=self.duration + 5)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(TCP_HEADER.pack(mode, int(self.duration * 1000)))
+        return sock
+
+    def tcp_upload(self):
+        with self.connect_tcp(b'U') as sock, _payload_file(TCP_BLOCK_SIZE) as payload:
+            _send_payload(sock, payload, time.monotonic() + self.duration)
+            sock.shutdown(socket.SHUT_WR)
+            received, elapsed_us = TCP_REPORT.unpack(_recv_exact(sock, TCP_REPORT.size))
+        return received, elapsed_us / 1_000_000, 0
+
+    def tcp_download(self):
+        with self.connect_tcp(b'D') as sock:
+            view = memoryview(bytearray(TCP_BLOCK_SIZE))
+            started = time.monotonic()
+            received = _recv_all(sock, view)
+            elapsed = time.monotonic() - started
+        return received, elapsed, 0
+
+    def connect_udp(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.connect((self.host, self.port))
+        sock.settimeout(1.0)
+        return sock
+
+    def udp_start(self, sock, direction):
+        rate_kbps = int(self.udp_rate_mbps * 1000 / self.streams)
+        sock.send(UDP_HEADER.pack(b'S', 0) + UDP_START.pack(direction, int(self.duration * 1000), rate_kbps))
+        return rate_kbps * 1000
+
+    def udp_upload(self):
+        with self.connect_udp() as sock:
+            rate_bps = self.udp_start(sock, b'U')
+            datagram = bytearray(UDP_PAYLOAD_SIZE)
+            started = time.monotonic()
+            deadline = started + self.duration
+            seq = 0
+            sent = 0
+            while time.monotonic() < deadline:
+                UDP_HEADER.pack_into(datagram, 0, b'P', seq)
+                sent += sock.send(datagram)
+                seq += 1
+                _pace(sent, started, rate_bps)
+            elapsed = time.monotonic() - started
+            for _ in range(3):
+                sock.send(UDP_HEADER.pack(b'F', seq))
+                try:
+                    report = sock.recv(UDP_HEADER.size + UDP_REPORT.size)
+                except socket.timeout:
+                    continue
+                if report[:1] == b'R':
+                    received, packets, _ = UDP_REPORT.unpack_from(report, UDP_HEADER.size)
+                    return received, elapsed, seq - packets
+        raise ConnectionError("No report received from throughput responder")
+
+    def udp_download(self):
+        with self.connect_udp() as sock:
+            self.udp_start(sock, b'D')
+            view = memoryview(bytearray(65536))
+            received = 0
+            packets = 0
+            last_seq = 0
+            started = None
+            finished = None
+            deadline = time.monotonic() + self.duration + 2
+            while time.monotonic() < deadline:
+                try:
+                    n = sock.recv_into(view)
+                except socket.timeout:
+                    break
+                kind, seq = UDP_HEADER.unpack_from(view)
+                if kind == b'F':
+                    last_seq = seq
+                    finished = time.monotonic()
+                    break
+                if started is None:
+                    started = time.monotonic()
+                received += n
+                packets += 1
+                last_seq = max(last_seq, seq + 1)
+            if started is None:
+                raise ConnectionError("No data received from throughput responder")
+            elapsed = (finished or time.monotonic()) - started
+        return received, elapsed, last_seq - packets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host-to-host throughput responder and tester")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="Run the throughput responder")
+    serve_parser.add_argument('--bind', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+
+    test_parser = subparsers.add_parser('test', help="Measure throughput against a responder")
+    test_parser.add_argument('host')
+    test_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    test_parser.add_argument('--protocol', choices=['tcp', 'udp'], default='tcp')
+    test_parser.add_argument('--streams', type=int, default=4)
+    test_parser.add_argument('--duration', type=float, default=5.0)
+    test_parser.add_argument('--rate', type=float, default=100.0, help="UDP target rate in Mbps")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'serve':
+        ThroughputResponder(args.bind, args.port).serve_forever()
+    else:
+        tester = ThroughputTester(args.host, args.port, args.streams, args.duration, args.protocol, args.rate)
+        for direction in ('upload', 'download'):
+            result = tester.run(direction)
+            print(f"{direction}: {result.mbps:.2f} Mbps, {result.packets_lost} packets lost")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import logging
+import socket
+from collections import defaultdict
+from itertools import count
+from typing import AsyncIterator, Iterable, Optional
+from traceroute_engine import AVAILABLE_PROTOCOLS, create_engine
+
+logger = logging.getLogger(__name__)
+
+SOURCE = 'source'  # key of the local host, first node of every path
+
+
+class TopologyNode:
+    __slots__ = ('key', 'ip', 'layer', 'row', 'rtt', 'targets')
+
+    def __init__(self, key: str, ip: Optional[str], layer: int, row: int, rtt: Optional[float] = None):
+        self.key = key
+        self.ip = ip  # None for the local host and for hops that did not answer
+        self.layer = layer
+        self.row = row
+        self.rtt = rtt
+        self.targets = set()
+
+
+class PathTopology:
+    """Hops of the traces to several targets merged into one graph, a node per address."""
+
+    def __init__(self):
+        self.nodes = {SOURCE: TopologyNode(SOURCE, None, 0, 0)}
+        self.edges = set()
+        self.paths = defaultdict(dict)  # target -> {hop: node key}
+        self.rows = defaultdict(set)  # layer -> rows taken
+        self.rows[0].add(0)
+
+    def _key_at(self, target: str, hop: int) -> Optional[str]:
+        return SOURCE if hop == 0 else self.paths[target].get(hop)
+
+    def _free_row(self, layer: int, wanted: int) -> int:
+        taken = self.rows[layer]
+        for distance in count():
+            for row in (wanted + distance, wanted - distance):
+                if row not in taken:
+                    taken.add(row)
+                    return row
+
+    def add_hop(self, target: str, hop: int, ip: Optional[str], rtt: Optional[float]) -> tuple:
+        """Record a hop of the path to target, return (node, whether it is new, edges added)."""
+        # Hops that did not answer cannot be merged, they get a node per target
+        key = ip if ip is not None else f"*{target}#{hop}"
+        self.paths[target][hop] = key
+        node = self.nodes.get(key)
+        created = node is None
+        if created:
+            # Column of the hop and free row closest to the neighbour, nodes never move afterwards
+            neighbour = self._key_at(target, hop - 1) or self._key_at(target, hop + 1)
+            wanted = self.nodes[neighbour].row if neighbour in self.nodes else 0
+            node = self.nodes[key] = TopologyNode(key, ip, hop, self._free_row(hop, wanted), rtt)
+        elif rtt is not None:
+            node.rtt = rtt
+        node.targets.add(target)
+
+        edges = []
+        for edge in ((self._key_at(target, hop - 1), key), (key, self._key_at(target, hop + 1))):
+            if None not in edge and edge[0] != edge[1] and edge not in self.edges:
+                self.edges.add(edge)
+                edges.append(edge)
+        return node, created, edges
+
+
+class MultiTracer:
+    """Traces to several targets at once, at most `concurrency` running together."""
+
+    def __init__(self, protocol: str = 'udp', concurrency: int = 8, probes: int = 1, **options):
+        self.protocol = protocol
+        self.concurrency = concurrency
+        # One probe per hop by default: the graph needs the addresses more than averaged round trips,
+        # and routers shared by many paths rate limit the ICMP messages they send back
+        self.options = dict(options, probes=probes)
+        self.engines = []
+        self.errors = {}  # target -> message, for the targets that could not be traced
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+        for engine in self.engines:
+            engine.stop()
+
+    async def trace(self, targets: Iterable[str]) -> AsyncIterator[tuple]:
+        """Yield (target, hop, address, rtt in ms) as the hops of every trace answer, address and
+        rtt being None for the hops that never did."""
+        targets = list(dict.fromkeys(targets))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        hops = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        async def run(target):
+            async with semaphore:
+                if self.stopped:
+                    return
+                try:
+                    address = (await loop.getaddrinfo(target, None, family=socket.AF_INET))[0][4][0]
+                except socket.gaierror as e:
+                    self.errors[target] = f"Unknown host: {e}"
+                    return
+                # An engine per trace, its own identifiers and ports tell the replies apart on shared routers
+                engine = create_engine(self.protocol, **self.options)
+                self.engines.append(engine)
+                # With every TTL probed at once the destination also answers the probes sent past it,
+                # only the lowest of those hops is kept
+                held = {}
+                async for hop, ip, rtt in engine.trace(address):
+                    if ip == address:
+                        held[hop] = rtt
+                    else:
+                        hops.put_nowait((target, hop, ip, rtt))
+                if engine.destination_hop in held:
+                    hops.put_nowait((target, engine.destination_hop, address, held[engine.destination_hop]))
+
+        tasks = [loop.create_task(run(target)) for target in targets]
+        done = asyncio.gather(*tasks)
+        try:
+            while not (done.done() and hops.empty()):
+                getter = loop.create_task(hops.get())
+                await asyncio.wait({getter, done}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            # Raises the first failure that is not about a single target, e.g. no raw socket rights
+            done.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+        logger.info(f"Traced {len(targets)} targets ({self.protocol}), {len(self.errors)} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace several targets at once and print the merged topology")
+    parser.add_argument('targets', nargs='+')
+    parser.add_argument('-P', '--protocol', choices=AVAILABLE_PROTOCOLS, default=AVAILABLE_PROTOCOLS[0])
+    parser.add_argument('-j', '--concurrency', type=int, default=8)
+    parser.add_argument('-m', '--max-hops', type=int, default=30)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    async def run():
+        topology = PathTopology()
+        tracer = MultiTracer(args.protocol, args.concurrency, max_hops=args.max_hops)
+        async for target, hop, ip, rtt in tracer.trace(args.targets):
+            topology.add_hop(target, hop, ip, rtt)
+        for target, error in tracer.errors.items():
+            print(f"{target}: {error}")
+        for node in sorted(topology.nodes.values(), key=lambda node: (node.layer, node.row)):
+            if node.key != SOURCE:
+                print(f"{node.layer:>3} {node.row:>4}  {node.ip or '*':<16} {', '.join(sorted(node.targets))}")
+        print(f"{len(topology.nodes) - 1} nodes, {len(topology.edges)} edges")
+
+    try:
+        asyncio.run(run())
+    except PermissionError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import re
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QGraphicsView, QGraphicsScene, QTextEdit,
+    QMessageBox, QGraphicsObject, QGraphicsLineItem, QGraphicsItem, QComboBox, QSpinBox, QLabel
+)
+from PyQt5.QtGui import QPainter, QPen, QColor, QBrush, QFont
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal, QRectF, QPointF
+from traceroute_engine import AVAILABLE_PROTOCOLS
+from traceroute_window import NODE_WIDTH, NODE_HEIGHT, H_SPACING, V_SPACING, format_ms
+from topology import SOURCE, MultiTracer, PathTopology
+from geoip import is_public
+
+logger = logging.getLogger(__name__)
+
+FIT_INTERVAL_MS = 300  # the view is fitted to the graph at most this often while it grows
+
+
+def node_position(node):
+    # One column per hop, left to right
+    return QPointF(node.layer * H_SPACING, node.row * V_SPACING)
+
+
+class TopologyThread(QThread):
+    hop_signal = pyqtSignal(str, int, str, float)  # target, hop, address or '*', rtt in ms
+    log_signal = pyqtSignal(str)
+    error_signal = pyqtSignal(str)
+
+    def __init__(self, targets, protocol='udp', concurrency=8):
+        super().__init__()
+        self.targets = targets
+        self.tracer = MultiTracer(protocol, concurrency)
+
+    def run(self):
+        try:
+            asyncio.run(self._run())
+        except PermissionError:
+            self.error_signal.emit("Traceroute needs raw sockets, please run the application as administrator.")
+        except FileNotFoundError:
+            self.error_signal.emit("Traceroute command not found. Please ensure it's installed and in your system's PATH.")
+        except Exception as e:
+            self.error_signal.emit(f"An unexpected error occurred: {e}")
+
+    async def _run(self):
+        async for target, hop, ip, rtt in self.tracer.trace(self.targets):
+            self.hop_signal.emit(target, hop, ip or '*', rtt if rtt is not None else -1.0)
+        for target, error in self.tracer.errors.items():
+            self.log_signal.emit(f"{target}: {error}")
+
+    def stop(self):
+        self.tracer.stop()
+        self.wait()
+
+
+class TopologyNodeItem(QGraphicsObject):
+    def __init__(self, node, parent=None):
+        super().__init__(parent)
+        self.node = node
+        self.hostname = None
+        self.location = {}
+        self.rect = QRectF(0, 0, NODE_WIDTH, NODE_HEIGHT)
+        self.setPos(node_position(node))
+        self.setZValue(1)
+        # Labels are drawn once into a pixmap, repaints while panning or zooming do not redo the text
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+    def boundingRect(self):
+        return self.rect
+
+    def paint(self, painter, option, widget):
+        if self.node.key == SOURCE:
+            color = QColor(180, 230, 180)
+        elif self.node.ip is None:
+            color = QColor(220, 220, 220)
+        else:
+            color = QColor(200, 200, 255)
+        painter.setBrush(QBrush(color))
+        painter.drawRoundedRect(self.rect, 5, 5)
+        painter.setFont(QFont("Arial", 8))
+        painter.drawText(self.rect, Qt.AlignCenter, self.label())
+
+    def label(self):
+        if self.node.key == SOURCE:
+            return "Cet ordinateur"
+        name = self.hostname or self.node.ip or '*'
+        if len(name) > 24:
+            name = name[:23] + '…'
+        if self.location.get('country'):
+            name += f" ({self.location['country']})"
+        return f"{name}\n{format_ms(self.node.rtt)} ms, {len(self.node.targets)} cible(s)"
+
+    def mousePressEvent(self, event):
+        scene = self.scene()
+        if scene and scene.views():
+            view = scene.views()[0]
+            if view and isinstance(view.parent(), TopologyVisualization):
+                view.parent().show_node_details(self)
+
+
+class TopologyVisualization(QWidget):
+    def __init__(self, geoip=None, reverse_dns=None):
+        super().__init__()
+        self.geoip = geoip
+        self.reverse_dns = reverse_dns
+        if reverse_dns is not None:
+            reverse_dns.name_resolved.connect(self.name_resolved)
+        self.topology = PathTopology()
+        self.node_items = {}  # node key -> TopologyNodeItem
+        self.thread = None
+        self.fit_timer = QTimer(self)
+        self.fit_timer.setSingleShot(True)
+        self.fit_timer.setInterval(FIT_INTERVAL_MS)
+        self.fit_timer.timeout.connect(self.fit_view)
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout()
+        self.setWindowTitle("Topologie des chemins")
+        self.setMinimumSize(1000, 800)
+
+        self.targets_input = QTextEdit()
+        self.targets_input.setPlaceholderText("Cibles (IP ou domaines), une par ligne ou séparées par des virgules")
+        self.targets_input.setMaximumHeight(100)
+        layout.addWidget(self.targets_input)
+
+        options_layout = QHBoxLayout()
+        self.protocol_combo = QComboBox()
+        for protocol in AVAILABLE_PROTOCOLS:
+            self.protocol_combo.addItem(protocol.upper(), protocol)
+        options_layout.addWidget(self.protocol_combo)
+        options_layout.addWidget(QLabel("Traces simultanées:"))
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 64)
+        self.concurrency_spin.setValue(8)
+        options_layout.addWidget(self.concurrency_spin)
+        layout.addLayout(options_layout)
+
+        buttons_layout = QHBoxLayout()
+        self.start_button = QPushButton("Tracer la topologie")
+        self.start_button.clicked.connect(self.start_topology)
+        buttons_layout.addWidget(self.start_button)
+        self.stop_button = QPushButton("Arrêter")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_topology)
+        buttons_layout.addWidget(self.stop_button)
+        layout.addLayout(buttons_layout)
+
+        self.scene = QGraphicsScene()
+        self.view = QGraphicsView(self.scene)
+        self.view.setRenderHint(QPainter.Antialiasing)
+        self.view.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.view.setOptimizationFlag(QGraphicsView.DontSavePainterState)
+        layout.addWidget(self.view, 1)
+
+        self.log_area = QTextEdit()
+        self.log_area.setReadOnly(True)
+        self.log_area.setMaximumHeight(120)
+        layout.addWidget(self.log_area)
+
+        self.setLayout(layout)
+
+    def start_topology(self):
+        targets = [target for target in re.split(r'[\s,;]+', self.targets_input.toPlainText()) if target]
+        if not targets:
+            return
+        self.start_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+        self.log_area.clear()
+        self.clear_topology()
+        self.log_area.append(f"Traceroute de {len(targets)} cible(s)...")
+        self.thread = TopologyThread(targets, self.protocol_combo.currentData(), self.concurrency_spin.value())
+        self.thread.hop_signal.connect(self.add_hop)
+        self.thread.log_signal.connect(self.log_area.append)
+        self.thread.error_signal.connect(self.display_error)
+        self.thread.finished.connect(self.on_topology_finished)
+        self.thread.start()
+
+    def stop_topology(self):
+        if self.thread is not None:
+            self.stop_button.setEnabled(False)
+            self.thread.stop()
+
+    def clear_topology(self):
+        self.scene.clear()
+        self.topology = PathTopology()
+        self.node_items = {}
+        self.add_node_item(self.topology.nodes[SOURCE])
+
+    def add_hop(self, target, hop, ip, rtt):
+        node, created, edges = self.topology.add_hop(target, hop, None if ip == '*' else ip,
+                                                     rtt if rtt >= 0 else None)
+        if created:
+            self.add_node_item(node)
+            self.schedule_fit()
+        else:
+            self.node_items[node.key].update()
+        for start, end in edges:
+            self.add_edge_item(start, end)
+
+    def add_node_item(self, node):
+        item = TopologyNodeItem(node)
+        if node.ip is not None:
+            if self.geoip is not None and is_public(node.ip):
+                item.location = self.geoip.lookup(node.ip)
+            if self.reverse_dns is not None:
+                item.hostname = self.reverse_dns.name(node.ip)
+        self.scene.addItem(item)
+        self.node_items[node.key] = item
+
+    def add_edge_item(self, start, end):
+        # Nodes never move once placed, so edges are plain static lines
+        start_item, end_item = self.node_items[start], self.node_items[end]
+        line = QGraphicsLineItem(start_item.x() + NODE_WIDTH, start_item.y() + NODE_HEIGHT / 2,
+                                 end_item.x(), end_item.y() + NODE_HEIGHT / 2)
+        line.setPen(QPen(QColor(52, 152, 219), 1.5))
+        self.scene.addItem(line)
+
+    def schedule_fit(self):
+        if not self.fit_timer.isActive():
+            self.fit_timer.start()
+
+    def fit_view(self):
+        self.view.fitInView(self.scene.itemsBoundingRect(), Qt.KeepAspectRatio)
+
+    def name_resolved(self, ip, name):
+        item = self.node_items.get(ip)
+        if item is not None:
+            item.hostname = name
+            item.update()
+
+    def display_error(self, error_message):
+        QMessageBox.critical(self, "Error", error_message)
+
+    def on_topology_finished(self):
+        self.start_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.log_area.append(f"{len(self.topology.nodes) - 1} nœuds, {len(self.topology.edges)} liens")
+        self.fit_view()
+
+    def closeEvent(self, event):
+        if self.thread is not None:
+            self.thread.stop()
+        event.accept()
+
+    def show_node_details(self, item):
+        node = item.node
+        if node.ip is None:
+            return
+        details = f"IP: {node.ip}\n"
+        if item.hostname:
+            details += f"Nom: {item.hostname}\n"
+        details += f"Saut: {node.layer}\n"
+        details += f"Temps moyen: {format_ms(node.rtt)} ms\n"
+        if item.location:
+            details += f"Localisation: {item.location.get('country', 'N/A')} {item.location.get('city', '')}\n"
+            details += f"ASN: {item.location.get('asn', 'N/A')} {item.location.get('organization', '')}\n"
+        details += "\nCibles passant par ce nœud:\n" + "\n".join(sorted(node.targets))
+        QMessageBox.information(self, f"Nœud {node.ip}", details)
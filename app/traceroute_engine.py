@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import ipaddress
+import logging
+import random
+import re
+import socket
+import statistics
+import struct
+import sys
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+PROTOCOLS = ('udp', 'icmp', 'tcp')
+DEFAULT_PORTS = {'udp': 33434, 'tcp': 80}
+# Windows has no add_reader on its default event loop and only lets raw sockets receive ICMP with
+# admin-only capture modes, traces go through the system tracert there
+USE_TRACERT = sys.platform == 'win32'
+AVAILABLE_PROTOCOLS = ('icmp',) if USE_TRACERT else PROTOCOLS
+# "  3    12 ms    <1 ms     *     10.0.0.1", or "Request timed out." in the system language
+TRACERT_LINE = re.compile(r'^\s*(\d+)\s+((?:(?:<?\d+\s*ms|\*)\s+){3})(.*?)\s*$')
+
+
+class HopStats:
+    """Round trips of the last `window` probes of one hop, None for a probe that got no answer."""
+    __slots__ = ('address', 'rtts', 'sent')
+
+    def __init__(self, window: int = 100):
+        self.address = None
+        self.rtts = deque(maxlen=window)
+        self.sent = 0
+
+    def add(self, address: Optional[str], rtt: Optional[float]):
+        if address is not None:
+            self.address = address
+        self.rtts.append(rtt)
+        self.sent += 1
+
+    def summary(self) -> dict:
+        received = [rtt for rtt in self.rtts if rtt is not None]
+        summary = {'ip': self.address or '*', 'sent': self.sent,
+                   'loss': 100.0 * (len(self.rtts) - len(received)) / len(self.rtts) if self.rtts else 0.0,
+                   'last': self.rtts[-1] if self.rtts else None}
+        if received:
+            summary.update(avg=statistics.fmean(received), best=min(received), worst=max(received),
+                           stddev=statistics.pstdev(received))
+        else:
+            summary.update(avg=None, best=None, worst=None, stddev=None)
+        return summary
+
+
+class TracerouteEngine:
+    """Traceroute sending the probes of every TTL at once and matching the ICMP replies as they come."""
+
+    def __init__(self, protocol: str = 'udp', max_hops: int = 30, probes: int = 3, timeout: float = 2.0,
+                 port: Optional[int] = None, interval: float = 0.0005):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown traceroute protocol: {protocol}")
+        self.protocol = protocol
+        self.max_hops = max_hops
+        self.probes = probes
+        self.timeout = timeout
+        self.port = port or DEFAULT_PORTS.get(protocol, 0)
+        self.interval = interval
+        self.destination_hop = None
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    def _probe(self, target: str, index: int, ttl: int):
+        from scapy.all import IP, UDP, ICMP, TCP, Raw
+        # Paris-style: every probe of a trace shares the flow load balancers hash on (addresses,
+        # protocol, ports, ICMP checksum) and stays on one path. Probes are told apart by the IP
+        # identifier routers quote back, or the ICMP/TCP sequence in replies from the destination
+        ip = IP(dst=target, ttl=ttl, id=(self.ip_id + index) & 0xFFFF)
+        if self.protocol == 'udp':
+            return ip / UDP(sport=self.sport, dport=self.port) / Raw(b'\x00' * 8)
+        if self.protocol == 'icmp':
+            # The payload word makes up for the sequence number, so the checksum stays the same
+            return ip / ICMP(id=self.ident, seq=index) / Raw(struct.pack('!H', 0xFFFF - index))
+        return ip / TCP(sport=self.sport, dport=self.port, flags='S', seq=self.ident << 16 | index)
+
+    def _match(self, packet, target: str) -> Optional[tuple]:
+        """(probe index, replying address, reached the destination) of a reply to one of our probes."""
+        from scapy.all import IP, ICMP, IPerror, UDPerror, ICMPerror, TCPerror, TCP
+        if not packet.haslayer(IP):
+            return None
+        source = packet[IP].src
+        if packet.haslayer(IPerror):
+            quoted = packet[IPerror]
+            if quoted.dst != target or not (quoted.haslayer(UDPerror) or quoted.haslayer(ICMPerror)
+                                            or quoted.haslayer(TCPerror)):
+                return None
+            if quoted.haslayer(UDPerror) and quoted[UDPerror].sport != self.sport:
+                return None
+            if quoted.haslayer(TCPerror) and quoted[TCPerror].sport != self.sport:
+                return None
+            if quoted.haslayer(ICMPerror) and quoted[ICMPerror].id != self.ident:
+                return None
+            # Time exceeded comes from a router, unreachable from the destination or a filter
+            return (quoted.id - self.ip_id) & 0xFFFF, source, packet[ICMP].type == 3
+        if self.protocol == 'icmp' and packet.haslayer(ICMP) and packet[ICMP].type == 0:
+            if source == target and packet[ICMP].id == self.ident:
+                return packet[ICMP].seq, source, True
+        if self.protocol == 'tcp' and packet.haslayer(TCP) and source == target:
+            tcp = packet[TCP]
+            if tcp.dport == self.sport and tcp.sport == self.port and (tcp.ack - 1) >> 16 == self.ident:
+                return (tcp.ack - 1) & 0xFFFF, source, True
+        return None
+
+    async def trace(self, target: str, max_hops: Optional[int] = None) -> AsyncIterator[tuple]:
+        """Yield (hop, address, average rtt in ms) each time a hop answers, then (hop, None, None)
+        for the hops below the last one that never answered."""
+        from scapy.all import IP
+        loop = asyncio.get_running_loop()
+        target = (await loop.getaddrinfo(target, None, family=socket.AF_INET))[0][4][0]
+        max_hops = max_hops or self.max_hops
+        count = max_hops * self.probes
+        # The kernel fills in an identifier of 0 itself, so none of the probes may get it
+        self.ip_id = random.randrange(1, 0x10000 - count)
+        self.ident = random.randrange(1, 0x8000)
+        self.sport = random.randrange(33000, 61000)
+        self.destination_hop = None
+
+        probes = [bytes(self._probe(target, index, index % max_hops + 1)) for index in range(count)]
+        sent = [None] * count
+        hops = {}   # ttl -> [address, rtts]
+        replies = asyncio.Queue()
+
+        def on_readable(sock):
+            while True:
+                try:
+                    data = sock.recv(65535)
+                except (BlockingIOError, InterruptedError):
+                    return
+                received = time.time()
+                match = self._match(IP(data), target)
+                if match is not None and match[0] < count and sent[match[0]] is not None:
+                    replies.put_nowait((*match, received))
+
+        # Raw sockets get every ICMP (and TCP) packet the host receives, no capture library needed
+        try:
+            receivers = [socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)]
+            if self.protocol == 'tcp':
+                receivers.append(socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP))
+            sender = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        except PermissionError as e:
+            raise PermissionError(f"Raw sockets need administrator rights: {e}") from e
+        for sock in receivers:
+            sock.setblocking(False)
+            loop.add_reader(sock.fileno(), on_readable, sock)
+        try:
+            for index, probe in enumerate(probes):
+                if self.stopped:
+                    return
+                sent[index] = time.time()
+                sender.sendto(probe, (target, 0))
+                if self.interval and index % max_hops == max_hops - 1:
+                    await asyncio.sleep(self.interval)
+            deadline = time.monotonic() + self.timeout
+            answered = set()
+
+            while not self.stopped:
+                last_hop = self.destination_hop or max_hops
+                if all(index in answered for index in range(count) if index % max_hops < last_hop):
+                    break
+                try:
+                    index, address, reached, received = await asyncio.wait_for(
+                        replies.get(), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    break
+                if index in answered:
+                    continue
+                answered.add(index)
+                ttl = index % max_hops + 1
+                if reached and address == target and (self.destination_hop is None or ttl < self.destination_hop):
+                    # Replies to higher TTLs may arrive first, hops yielded above the new one are dropped
+                    self.destination_hop = ttl
+                    for higher in [hop for hop in hops if hop > ttl]:
+                        del hops[higher]
+                if self.destination_hop is not None and ttl > self.destination_hop:
+                    continue
+                hop = hops.setdefault(ttl, [address, []])
+                hop[1].append((received - sent[index]) * 1000)
+                yield ttl, hop[0], sum(hop[1]) / len(hop[1])
+
+            last_hop = self.destination_hop or max(hops, default=0)
+            for ttl in range(1, last_hop + 1):
+                if ttl not in hops:
+                    yield ttl, None, None
+        finally:
+            for sock in receivers:
+                loop.remove_reader(sock.fileno())
+                sock.close()
+            sender.close()
+            logger.debug(f"Traceroute to {target} ({self.protocol}): {len(hops)} hops answered, "
+                        f"destination {'at hop ' + str(self.destination_hop) if self.destination_hop else 'not reached'}")
+
+    async def monitor(self, target: str, interval: float = 1.0, window: int = 100) -> AsyncIterator[dict]:
+        """mtr-style: trace the path again every interval seconds and yield {hop: HopStats} after
+        each round. Only the last `window` probes of each hop are kept."""
+        logger.info(f"Monitoring the path to {target} ({self.protocol}) every {interval}s")
+        hops = {}
+        while not self.stopped:
+            started = time.monotonic()
+            # Once the destination is known there is no point probing past it, the extra probes
+            # would only use up its ICMP rate limit
+            max_hops = self.destination_hop
+            answers = {}
+            async for hop, address, rtt in self.trace(target, max_hops):
+                answers[hop] = (address, rtt)
+            if self.stopped:
+                return
+            if self.destination_hop is not None:
+                for hop in [hop for hop in hops if hop > self.destination_hop]:
+                    del hops[hop]
+            # A destination that did not answer this time counts as a loss, it is still on the path
+            last_hop = self.destination_hop or max([*answers, *hops], default=0)
+            for hop in range(1, last_hop + 1):
+                hops.setdefault(hop, HopStats(window)).add(*answers.get(hop, (None, None)))
+            yield hops
+            while not self.stopped and time.monotonic() - started < interval:
+                await asyncio.sleep(min(0.1, interval))
+
+
+class TracertEngine(TracerouteEngine):
+    """Fallback running the system tracert and parsing its output, for Windows."""
+
+    def __init__(self, protocol: str = 'icmp', max_hops: int = 30, probes: int = 3, timeout: float = 2.0,
+                 port: Optional[int] = None, interval: float = 0.0005):
+        # tracert sends three ICMP probes per hop, one hop after the other: much slower than the
+        # raw socket engine, monitor() works the same on top of it
+        if protocol != 'icmp':
+            logger.info(f"tracert only probes with ICMP, {protocol} traceroute is not available")
+        super().__init__('icmp', max_hops, probes, timeout, port, interval)
+        self.process = None
+
+    def stop(self):
+        super().stop()
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+
+    async def trace(self, target: str, max_hops: Optional[int] = None) -> AsyncIterator[tuple]:
+        loop = asyncio.get_running_loop()
+        target = (await loop.getaddrinfo(target, None, family=socket.AF_INET))[0][4][0]
+        self.destination_hop = None
+        if self.stopped:
+            return
+        self.process = await asyncio.create_subprocess_exec(
+            'tracert', '-4', '-d', '-h', str(max_hops or self.max_hops), '-w', str(int(self.timeout * 1000)), target,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            async for line in self.process.stdout:
+                match = TRACERT_LINE.match(line.decode(errors='replace'))
+                if match is None:
+                    continue
+                hop, address = int(match.group(1)), match.group(3)
+                times = [float(time_ms) for time_ms in re.findall(r'<?(\d+)\s*ms', match.group(2))]
+                try:
+                    ipaddress.IPv4Address(address)
+                except ValueError:
+                    times = []
+                if not times:
+                    yield hop, None, None
+                    continue
+                if address == target:
+                    self.destination_hop = hop
+                yield hop, address, sum(times) / len(times)
+        finally:
+            if self.process.returncode is None:
+                self.process.kill()
+            await self.process.wait()
+
+
+def create_engine(protocol: str = 'udp', *args, **kwargs) -> TracerouteEngine:
+    """Raw socket engine, or the tracert one on Windows."""
+    return (TracertEngine if USE_TRACERT else TracerouteEngine)(protocol, *args, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Traceroute probing every TTL at once")
+    parser.add_argument('target')
+    parser.add_argument('-P', '--protocol', choices=AVAILABLE_PROTOCOLS, default=AVAILABLE_PROTOCOLS[0])
+    parser.add_argument('-m', '--max-hops', type=int, default=30)
+    parser.add_argument('-q', '--probes', type=int, default=3)
+    parser.add_argument('-w', '--timeout', type=float, default=2.0)
+    parser.add_argument('-p', '--port', type=int)
+    parser.add_argument('-c', '--cycles', type=int, help="mtr mode: trace the path this many times, one probe per hop each")
+    parser.add_argument('-i', '--interval', type=float, default=1.0, help="Seconds between two cycles in mtr mode")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    async def run_cycles():
+        engine = create_engine(args.protocol, args.max_hops, 1, min(args.timeout, args.interval), args.port)
+        cycle = 0
+        async for hops in engine.monitor(args.target, args.interval):
+            cycle += 1
+            if cycle == args.cycles:
+                engine.stop()
+        print(f"{'hop':>3}  {'address':<16}{'loss%':>7}{'sent':>6}{'last':>8}{'avg':>8}{'best':>8}{'worst':>8}{'stdev':>8}")
+        for hop, stats in sorted(hops.items()):
+            summary = stats.summary()
+            times = ''.join(f"{summary[key]:>8.2f}" if summary[key] is not None else f"{'-':>8}"
+                            for key in ('last', 'avg', 'best', 'worst', 'stddev'))
+            print(f"{hop:>3}  {summary['ip']:<16}{summary['loss']:>7.1f}{summary['sent']:>6}{times}")
+
+    async def run():
+        engine = create_engine(args.protocol, args.max_hops, args.probes, args.timeout, args.port)
+        started = time.monotonic()
+        async for hop, address, rtt in engine.trace(args.target):
+            elapsed = time.monotonic() - started
+            print(f"{hop:>3}  {address or '*':<16}" + (f"{rtt:>9.2f} ms" if rtt is not None else "") +
+                  f"   (+{elapsed:.3f}s)")
+
+    try:
+        asyncio.run(run_cycles() if args.cycles else run())
+    except PermissionError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,111 @@
-import subprocess
-import re
-import requests
+import asyncio
+import socket
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QPushButton, QLineEdit, QGraphicsView, 
-    QGraphicsScene, QApplication, QTextEdit, QMessageBox, QGraphicsObject
+    QGraphicsScene, QApplication, QTextEdit, QMessageBox, QGraphicsObject, QComboBox, QCheckBox
 )
 from PyQt5.QtGui import QPainter, QPen, QColor, QBrush, QFont, QPolygonF, QPalette
 from PyQt5.QtCore import (
     Qt, QThread, pyqtSignal, QRectF, QPointF, QPropertyAnimation, 
     QObject, pyqtProperty
 )
+from traceroute_engine import AVAILABLE_PROTOCOLS, create_engine
+from geoip import is_public
+
+NODE_WIDTH = 150
+NODE_HEIGHT = 50
+H_SPACING = 200
+V_SPACING = 80
+MTR_INTERVAL = 1.0  # seconds between two traces in continuous mode
+
+
+def hop_position(hop_number):
+    # Three hops per row, each row starting below the last hop of the previous one
+    row, column = divmod(hop_number - 1, 3)
+    return QPointF(row * 2 * H_SPACING + column * H_SPACING, row * V_SPACING)
+
+
+def format_ms(value):
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def arrow_points(prev_node, node):
+    if prev_node.pos().y() == node.pos().y():
+        return (QPointF(prev_node.pos().x() + NODE_WIDTH, prev_node.pos().y() + NODE_HEIGHT / 2),
+                QPointF(node.pos().x(), node.pos().y() + NODE_HEIGHT / 2))
+    return (QPointF(prev_node.pos().x() + NODE_WIDTH / 2, prev_node.pos().y() + NODE_HEIGHT),
+            QPointF(node.pos().x() + NODE_WIDTH / 2, node.pos().y()))
 
 class TracerouteThread(QThread):
     update_signal = pyqtSignal(int, str, float)
     log_signal = pyqtSignal(str)
     error_signal = pyqtSignal(str)
+    destination_signal = pyqtSignal(int)  # hop of the destination, hops above it are not on the path
+    stats_signal = pyqtSignal(int, dict)  # continuous mode: hop number, HopStats.summary()
 
-    def __init__(self, target):
+    def __init__(self, target, protocol='udp', continuous=False):
         super().__init__()
         self.target = target
+        self.continuous = continuous
+        if continuous:
+            # One probe per hop and per round, a hop not answering before the next round counts as lost
+            self.engine = create_engine(protocol, probes=1, timeout=MTR_INTERVAL)
+        else:
+            self.engine = create_engine(protocol)
 
     def run(self):
         try:
-            process = subprocess.Popen(["tracert", "-4", self.target], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            for line in process.stdout:
-                self.log_signal.emit(line.strip().encode("utf-8").decode("utf-8", errors="replace"))
-                match = re.search(r'^\s*(\d+)(?:\s+(<?\d+\s*ms|\*)\s+(<?\d+\s*ms|\*)\s+(<?\d+\s*ms|\*))+\s+(.+)$', line)
-                if match:
-                    hop_number = int(match.group(1))
-                    times = [t.strip() for t in match.group(2, 3, 4)]
-                    ip_or_hostname = match.group(5).strip()
-                    if '[' in ip_or_hostname:
-                        ip = re.search(r'\[(.*?)\]', ip_or_hostname).group(1)
-                    else:
-                        ip = ip_or_hostname
-                
-                    valid_times = [int(t[:-2]) for t in times if t != '*' and t != '<1 ms']
-                    avg_time = sum(valid_times) / len(valid_times) if valid_times else 0
-                
-                    self.update_signal.emit(hop_number, ip, avg_time)
-            process.wait()
-            if process.returncode != 0:
-                self.error_signal.emit(f"Traceroute failed with error code: {process.returncode}")
+            asyncio.run(self._run())
+        except PermissionError:
+            self.error_signal.emit("Traceroute needs raw sockets, please run the application as administrator.")
         except FileNotFoundError:
             self.error_signal.emit("Traceroute command not found. Please ensure it's installed and in your system's PATH.")
+        except socket.gaierror:
+            self.error_signal.emit(f"Unknown host: {self.target}")
         except Exception as e:
             self.error_signal.emit(f"An unexpected error occurred: {e}")
 
+    async def _run(self):
+        if self.continuous:
+            await self._monitor()
+            return
+        destination_hop = None
+        async for hop_number, ip, avg_time in self.engine.trace(self.target):
+            if self.engine.destination_hop != destination_hop:
+                destination_hop = self.engine.destination_hop
+                self.destination_signal.emit(destination_hop)
+            if ip is None:
+                self.log_signal.emit(f"{hop_number:>2}  *")
+                self.update_signal.emit(hop_number, '*', 0.0)
+            else:
+                self.log_signal.emit(f"{hop_number:>2}  {ip:<16} {avg_time:.2f} ms")
+                self.update_signal.emit(hop_number, ip, avg_time)
+
+    async def _monitor(self):
+        last_hop = None
+        async for hops in self.engine.monitor(self.target, MTR_INTERVAL):
+            if max(hops, default=0) != last_hop:
+                last_hop = max(hops, default=0)
+                self.destination_signal.emit(last_hop)
+            for hop_number, stats in hops.items():
+                summary = stats.summary()
+                self.update_signal.emit(hop_number, summary['ip'], summary['avg'] or 0.0)
+                self.stats_signal.emit(hop_number, summary)
+
+    def stop(self):
+        self.engine.stop()
+        self.wait()
+
 class Node(QObject):
     def __init__(self, ip, x, y, hop_number, avg_time):
         super().__init__()
         self.ip = ip
         self.hop_number = hop_number
         self.avg_time = avg_time
-        self.rect = QRectF(0, 0, 150, 40)
+        self.stats = None  # summary of the last probes in continuous mode
+        self.location = {}  # GeoIP/ASN record of the address
+        self.hostname = None  # reverse DNS name, once resolved
+        self.rect = QRectF(0, 0, NODE_WIDTH, NODE_HEIGHT)
         self.x = x
         self.y = y
 
@@ -64,7 +116,20 @@ class Node(QObject):
         painter.setBrush(QBrush(QColor(200, 200, 255)))
         painter.drawRoundedRect(self.rect, 5, 5)
         painter.setFont(QFont("Arial", 8))
-        painter.drawText(self.rect, Qt.AlignCenter, f"{self.hop_number}: {self.ip}\n{self.avg_time:.2f} ms")
+        painter.drawText(self.rect, Qt.AlignCenter, self.label())
+
+    def label(self):
+        name = self.hostname or self.ip
+        if len(name) > 24:
+            name = name[:23] + '…'
+        title = f"{self.hop_number}: {name}"
+        if self.location.get('country'):
+            title += f" ({self.location['country']})"
+        if self.stats is None:
+            return f"{title}\n{self.avg_time:.2f} ms"
+        times = ' / '.join(format_ms(self.stats[key]) for key in ('last', 'avg', 'best', 'worst'))
+        return (f"{title}\n{times} ms\n"
+                f"σ {format_ms(self.stats['stddev'])} ms, perte {self.stats['loss']:.0f}%")
 
     def pos(self):
         return QPointF(self.x, self.y)
@@ -154,10 +219,17 @@ class ArrowGraphicsItem(QGraphicsObject):
         self.arrow.paint(painter, option, widget)
 
 class TracerouteVisualization(QWidget):
-    def __init__(self):
+    def __init__(self, geoip=None, reverse_dns=None):
         super().__init__()
-        self.nodes = []
-        self.arrows = []
+        self.geoip = geoip
+        self.reverse_dns = reverse_dns
+        if reverse_dns is not None:
+            reverse_dns.name_resolved.connect(self.name_resolved)
+        # Keyed by hop number, hops arrive in any order
+        self.nodes = {}
+        self.node_items = {}
+        self.arrows = {}  # hop number -> arrow item coming from the previous hop
+        self.thread = None
         self.initUI()
 
     def initUI(self):
@@ -202,6 +274,14 @@ class TracerouteVisualization(QWidget):
         self.tracert_input.setPlaceholderText("Insérer IP ou bien Domain")
         layout.addWidget(self.tracert_input)
 
+        self.protocol_combo = QComboBox()
+        for protocol in AVAILABLE_PROTOCOLS:
+            self.protocol_combo.addItem(protocol.upper(), protocol)
+        layout.addWidget(self.protocol_combo)
+
+        self.continuous_checkbox = QCheckBox("Mode continu (mtr)")
+        layout.addWidget(self.continuous_checkbox)
+
         self.log_area = QTextEdit()
         self.log_area.setReadOnly(True)
         layout.addWidget(self.log_area)
@@ -210,6 +290,11 @@ class TracerouteVisualization(QWidget):
         self.start_button.clicked.connect(self.start_visualization)
         layout.addWidget(self.start_button)
 
+        self.stop_button = QPushButton("Arrêter")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_visualization)
+        layout.addWidget(self.stop_button)
+
         self.scene = QGraphicsScene()
         self.view = QGraphicsView(self.scene)
         self.view.setRenderHint(QPainter.Antialiasing)
@@ -223,58 +308,90 @@ class TracerouteVisualization(QWidget):
         self.clear_visualization()
         target = self.tracert_input.text()
         if target:
-            self.thread = TracerouteThread(target)
+            self.thread = TracerouteThread(target, self.protocol_combo.currentData(),
+                                           self.continuous_checkbox.isChecked())
             self.thread.update_signal.connect(self.update_visualization)
+            self.thread.stats_signal.connect(self.update_hop_stats)
+            self.thread.destination_signal.connect(self.trim_path)
             self.thread.log_signal.connect(self.log_output)
             self.thread.error_signal.connect(self.display_error)
             self.thread.finished.connect(self.on_traceroute_finished)
             self.thread.start()
+            self.stop_button.setEnabled(True)
 
-    def update_visualization(self, hop_number, ip, avg_time):
-        node_width = 150
-        node_height = 40
-        h_spacing = 200
-        v_spacing = 80
-
-        if hop_number == 1:
-            x = 0
-            y = 0
-        else:
-            prev_node = self.nodes[-1]
-            if hop_number % 3 == 1:
-                x = prev_node.pos().x()
-                y = prev_node.pos().y() + v_spacing
-            else:
-                x = prev_node.pos().x() + h_spacing
-                y = prev_node.pos().y()
+    def stop_visualization(self):
+        self.stop_button.setEnabled(False)
+        self.thread.stop()
 
-        node = Node(ip, x, y, hop_number, avg_time)
+    def update_visualization(self, hop_number, ip, avg_time):
+        if hop_number in self.nodes:
+            # Later probes of a hop only refresh its label
+            node = self.nodes[hop_number]
+            if node.ip != ip:
+                node.ip = ip
+                node.location = self.locate(ip)
+                node.hostname = self.host_name(ip)
+            node.avg_time = avg_time
+            self.node_items[hop_number].update()
+            return
+
+        position = hop_position(hop_number)
+        node = Node(ip, position.x(), position.y(), hop_number, avg_time)
+        node.location = self.locate(ip)
+        node.hostname = self.host_name(ip)
         node_item = NodeGraphicsItem(node)
         self.scene.addItem(node_item)
-        self.nodes.append(node)
+        self.nodes[hop_number] = node
+        self.node_items[hop_number] = node_item
 
-        if len(self.nodes) > 1:
-            prev_node = self.nodes[-2]
-            if prev_node.pos().y() == node.pos().y():
-                start_point = QPointF(prev_node.pos().x() + node_width, prev_node.pos().y() + node_height / 2)
-                end_point = QPointF(node.pos().x(), node.pos().y() + node_height / 2)
-            else:
-                start_point = QPointF(prev_node.pos().x() + node_width / 2, prev_node.pos().y() + node_height)
-                end_point = QPointF(node.pos().x() + node_width / 2, node.pos().y())
-    
-            arrow = AnimatedArrow(start_point, end_point, avg_time)
-            arrow_item = ArrowGraphicsItem(arrow)
-            self.scene.addItem(arrow_item)
-            self.arrows.append(arrow)
-            arrow.start_animation()
+        for hop in (hop_number, hop_number + 1):
+            if hop - 1 in self.nodes and hop in self.nodes:
+                self.add_arrow(hop)
 
         self.view.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
         self.view.centerOn(0, 0)
 
+    def locate(self, ip):
+        if self.geoip is None or not is_public(ip):
+            return {}
+        return self.geoip.lookup(ip)
+
+    def host_name(self, ip):
+        # Cached name right away, otherwise the label is updated by name_resolved
+        if self.reverse_dns is None or ip == '*':
+            return None
+        return self.reverse_dns.name(ip)
+
+    def name_resolved(self, ip, name):
+        for hop_number, node in self.nodes.items():
+            if node.ip == ip:
+                node.hostname = name
+                self.node_items[hop_number].update()
+
+    def update_hop_stats(self, hop_number, stats):
+        self.nodes[hop_number].stats = stats
+        self.node_items[hop_number].update()
+
+    def add_arrow(self, hop_number):
+        start_point, end_point = arrow_points(self.nodes[hop_number - 1], self.nodes[hop_number])
+        arrow = AnimatedArrow(start_point, end_point, self.nodes[hop_number].avg_time)
+        arrow_item = ArrowGraphicsItem(arrow)
+        self.scene.addItem(arrow_item)
+        self.arrows[hop_number] = arrow_item
+        arrow.start_animation()
+
+    def trim_path(self, destination_hop):
+        for hop_number in [hop for hop in self.nodes if hop > destination_hop]:
+            self.scene.removeItem(self.node_items.pop(hop_number))
+            del self.nodes[hop_number]
+            if hop_number in self.arrows:
+                self.scene.removeItem(self.arrows.pop(hop_number))
+
     def clear_visualization(self):
         self.scene.clear()
-        self.nodes = []
-        self.arrows = []
+        self.nodes = {}
+        self.node_items = {}
+        self.arrows = {}
 
     def log_output(self, line):
         self.log_area.append(line)
@@ -285,28 +402,45 @@ class TracerouteVisualization(QWidget):
 
     def on_traceroute_finished(self):
         self.start_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+
+    def closeEvent(self, event):
+        if self.thread is not None:
+            self.thread.stop()
+        event.accept()
 
     def show_node_details(self, node):
+        if node.ip == '*':
+            return
         try:
             details = f"Détails du saut {node.hop_number}\n\n"
             details += f"IP: {node.ip}\n"
-            details += f"Temps moyen: {node.avg_time:.2f} ms\n\n"
-
-            response = requests.get(f"https://ipapi.co/{node.ip}/json/")
-            if response.status_code == 200:
-                data = response.json()
-                details += "Informations de géolocalisation:\n"
-                details += f"Pays: {data.get('country_name', 'N/A')}\n"
-                details += f"Région: {data.get('region', 'N/A')}\n"
-                details += f"Ville: {data.get('city', 'N/A')}\n"
-                details += f"Code postal: {data.get('postal', 'N/A')}\n"
-                details += f"Latitude: {data.get('latitude', 'N/A')}\n"
-                details += f"Longitude: {data.get('longitude', 'N/A')}\n"
-                details += f"Fuseau horaire: {data.get('timezone', 'N/A')}\n"
-                details += f"ISP: {data.get('org', 'N/A')}\n"
+            if node.hostname:
+                details += f"Nom: {node.hostname}\n"
+            details += f"Temps moyen: {node.avg_time:.2f} ms\n"
+            if node.stats is not None:
+                details += (f"Dernier / meilleur / pire: {format_ms(node.stats['last'])} / "
+                            f"{format_ms(node.stats['best'])} / {format_ms(node.stats['worst'])} ms\n")
+                details += f"Écart type: {format_ms(node.stats['stddev'])} ms\n"
+                details += f"Perte: {node.stats['loss']:.1f}% ({node.stats['sent']} sondes)\n"
+            details += "\n"
+
+            if not is_public(node.ip):
+                details += "Adresse privée, pas de géolocalisation.\n"
+            elif self.geoip is None or not self.geoip.available():
+                details += "Base GeoIP non importée (python app/geoip.py import).\n"
+            elif not node.location:
+                details += "Adresse absente de la base GeoIP.\n"
             else:
-                details += "Impossible de récupérer les informations de géolocalisation.\n"
-        
+                details += "Informations de géolocalisation:\n"
+                details += f"Pays: {node.location.get('country', 'N/A')}\n"
+                details += f"Région: {node.location.get('region', 'N/A')}\n"
+                details += f"Ville: {node.location.get('city', 'N/A')}\n"
+                details += f"Latitude: {node.location.get('latitude', 'N/A')}\n"
+                details += f"Longitude: {node.location.get('longitude', 'N/A')}\n"
+                details += f"ASN: {node.location.get('asn', 'N/A')}\n"
+                details += f"ISP: {node.location.get('organization', 'N/A')}\n"
+
             QMessageBox.information(self, f"Détails du saut {node.hop_number}", details)
         except Exception as e:
             QMessageBox.warning(self, "Erreur", f"Impossible de récupérer les détails: {str(e)}")
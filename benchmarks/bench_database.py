@@ -0,0 +1,87 @@
+"""Time the history and host lookup queries on a synthetic database, with and without their indexes.
+
+    python benchmarks/bench_database.py --hosts 200 --rows 2000000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from models import Database, QUERY_PLAN_CHECKS, now_us  # noqa: E402
+
+
+def populate(db, hosts, rows):
+    with db.conn:
+        db.conn.executemany('INSERT INTO hosts (name, ip) VALUES (?, ?)',
+                            ((f"host-{i}", f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}") for i in range(hosts)))
+    start = now_us() - rows * 60_000_000
+    batch = 100_000
+    for offset in range(0, rows, batch):
+        count = min(batch, rows - offset)
+        with db.conn:
+            db.conn.executemany('''
+                INSERT INTO mesures (host_id, ts, latence, packets_perdus, upload, download)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', ((random.randint(1, hosts), start + (offset + i) * 60_000_000, random.uniform(1, 100),
+                   random.randint(0, 100), random.uniform(1, 900), random.uniform(1, 900)) for i in range(count)))
+
+
+def time_queries(db, hosts, repeat, indexed=True):
+    timings = {}
+    generators = {
+        'history': lambda: (random.randint(1, hosts),),
+        'history page': lambda: (random.randint(1, hosts), 0, 2 ** 62, 2 ** 62, 0, 500),
+        'host by ip': lambda: (f"10.0.{random.randint(0, hosts - 1) // 256}.{random.randint(0, 255)}",),
+        'host by name': lambda: (f"host-{random.randint(0, hosts - 1)}",),
+        'interface history': lambda: ('eth0',),
+        'rollup series': lambda: ('latence', random.randint(1, hosts), 3600, 0, 2 ** 40),
+    }
+    for name, query, sample in QUERY_PLAN_CHECKS:
+        if not indexed:
+            query = re.sub(r'FROM (\w+)', r'FROM \1 NOT INDEXED', query)
+        # Checks without a generator run with the sample parameters they are declared with
+        params = generators.get(name, lambda: sample)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            db.conn.execute(query, params()).fetchall()
+        timings[name] = (time.perf_counter() - started) / repeat * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=2_000_000, help="Measurement runs to generate")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'bench.db'), retention_days=None)
+        started = time.perf_counter()
+        populate(db, args.hosts, args.rows)
+        db.rebuild_rollups()
+        db.conn.execute('ANALYZE')
+        print(f"Populated {args.rows} rows for {args.hosts} hosts in {time.perf_counter() - started:.1f}s "
+              f"(schema version {db.schema_version()})")
+
+        before = time_queries(db, args.hosts, args.repeat, indexed=False)
+        after = time_queries(db, args.hosts, args.repeat)
+
+        print(f"{'query':<20}{'no index (ms)':>14}{'indexed (ms)':>14}{'speedup':>10}")
+        for name in before:
+            print(f"{name:<20}{before[name]:>14.2f}{after[name]:>14.2f}{before[name] / max(after[name], 1e-6):>9.1f}x")
+
+        problems = db.check_query_plans()
+        print("Query plans: " + ("all indexed" if not problems else f"{len(problems)} not indexed"))
+        for name, query, params in QUERY_PLAN_CHECKS:
+            print(f"  {name}: {' / '.join(db.query_plan(query, params))}")
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Run the discovery sweep against a simulated network and report when hosts show up.
+
+    python benchmarks/bench_discovery.py --range 10.0.0.0/16 --up 0.05 --rate 5000
+
+Replies come back after a random round trip and some are lost, so the retry pass matters.
+A scan returning everything at the end (nmap -sn) would show nothing before the total time.
+"""
+import argparse
+import asyncio
+import ipaddress
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from host_discovery import HostDiscovery  # noqa: E402
+
+
+class SimulatedProber:
+    name = 'simulated'
+
+    def __init__(self, up_hosts, rtt=(0.001, 0.05), loss=0.02):
+        self.up_hosts = up_hosts
+        self.rtt = rtt
+        self.loss = loss
+
+    async def start(self, on_reply):
+        self.loop = asyncio.get_running_loop()
+        self.on_reply = on_reply
+
+    def send(self, ip):
+        if ip in self.up_hosts and random.random() >= self.loss:
+            self.loop.call_later(random.uniform(*self.rtt), self.on_reply, ip, '02:00:00:00:00:01')
+
+    async def drain(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+async def run(ip_range, up_fraction, rate, timeout):
+    addresses = [str(ip) for ip in ipaddress.ip_network(ip_range).hosts()]
+    up_hosts = set(random.sample(addresses, int(len(addresses) * up_fraction)))
+    discovery = HostDiscovery(SimulatedProber(up_hosts), rate=rate, timeout=timeout, resolve_names=False)
+    started = time.perf_counter()
+    arrivals = []
+    async for _ in discovery.sweep(ip_range):
+        arrivals.append(time.perf_counter() - started)
+    return len(addresses), len(up_hosts), arrivals, time.perf_counter() - started, discovery.sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--range', default='10.0.0.0/16')
+    parser.add_argument('--up', type=float, default=0.05, help="Fraction of addresses that answer")
+    parser.add_argument('--rate', type=float, nargs='+', default=[2000, 10000, 50000])
+    parser.add_argument('--timeout', type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"{'rate/s':>8}{'probes':>9}{'found':>12}{'first (s)':>11}{'half (s)':>10}{'total (s)':>11}")
+    for rate in args.rate:
+        addresses, up, arrivals, total, sent = asyncio.run(run(args.range, args.up, rate, args.timeout))
+        first = arrivals[0] if arrivals else float('nan')
+        half = arrivals[len(arrivals) // 2] if arrivals else float('nan')
+        print(f"{rate:>8.0f}{sent:>9}{len(arrivals):>6}/{up:<5}{first:>11.3f}{half:>10.2f}{total:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
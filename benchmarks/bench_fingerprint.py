@@ -0,0 +1,114 @@
+"""Fingerprint local mock services, then compare indexed signature matching with a linear scan.
+
+    python benchmarks/bench_fingerprint.py --matches 100000
+
+Each mock service listens on a random localhost port and answers like the real one would:
+a banner on connect, or a reply to the HTTP or Redis probe. The second run shows the cost
+once the probe that identified each port and its banner are known.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from service_fingerprint import SIGNATURES, ServiceFingerprinter, SignatureIndex, describe_service  # noqa: E402
+
+MYSQL_GREETING = b'\x0a5.7.42-log\x00' + b'\x00' * 40
+# Service expected -> (banner sent on connect, {request: reply})
+MOCK_SERVICES = {
+    'ssh OpenSSH 9.6p1': (b'SSH-2.0-OpenSSH_9.6p1 Ubuntu-3ubuntu13\r\n', {}),
+    'ftp vsftpd 3.0.5': (b'220 (vsFTPd 3.0.5)\r\n', {}),
+    'smtp Postfix smtpd': (b'220 mail.example.org ESMTP Postfix (Ubuntu)\r\n', {}),
+    'pop3 Dovecot pop3d': (b'+OK Dovecot (Ubuntu) ready.\r\n', {}),
+    'mysql MySQL 5.7.42-log': (len(MYSQL_GREETING).to_bytes(3, 'little') + b'\x00' + MYSQL_GREETING, {}),
+    'http nginx 1.24.0': (b'', {b'GET': b'HTTP/1.1 200 OK\r\nServer: nginx/1.24.0\r\nContent-Length: 0\r\n\r\n'}),
+    'redis Redis 7.2.4': (b'', {b'*1': b'$120\r\n# Server\r\nredis_version:7.2.4\r\nredis_mode:standalone\r\n'}),
+    ' ': (b'', {}),  # accepts and never answers
+}
+
+
+async def start_mocks():
+    servers = {}
+    for expected, (banner, replies) in MOCK_SERVICES.items():
+        async def handle(reader, writer, banner=banner, replies=replies):
+            if banner:
+                writer.write(banner)
+            try:
+                request = await asyncio.wait_for(reader.read(1024), 5)
+                for prefix, reply in replies.items():
+                    if request.startswith(prefix):
+                        writer.write(reply)
+                await writer.drain()
+            except (OSError, asyncio.TimeoutError):
+                pass
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        servers[server.sockets[0].getsockname()[1]] = (expected, server)
+    return servers
+
+
+async def fingerprint(read_timeout):
+    servers = await start_mocks()
+    fingerprinter = ServiceFingerprinter(read_timeout=read_timeout)
+    try:
+        async def timed(port):
+            started = time.perf_counter()
+            result = await fingerprinter.identify('127.0.0.1', port)
+            return result, time.perf_counter() - started
+
+        runs = []
+        for _ in range(2):
+            timings = await asyncio.gather(*(timed(port) for port in servers))
+            runs.append(dict(zip(servers, timings)))
+    finally:
+        for _, server in servers.values():
+            server.close()
+    return servers, runs
+
+
+def bench_matching(count):
+    index = SignatureIndex()
+    linear = [(signature, re.compile(index._inline(signature), re.S)) for signature in SIGNATURES]
+    responses = [banner or next(iter(replies.values()), b'') for banner, replies in MOCK_SERVICES.values()]
+    # Unknown services answer too, those go through every signature in a linear scan
+    responses = [response for response in responses if response] + [b'hello\r\n', b'\x00\x01\x02', b'OK ready\r\n']
+    samples = [random.choice(responses) for _ in range(count)]
+
+    started = time.perf_counter()
+    for response in samples:
+        index.match(response)
+    indexed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for response in samples:
+        next((signature for signature, pattern in linear if pattern.match(response)), None)
+    return indexed, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--read-timeout', type=float, default=0.5)
+    parser.add_argument('--matches', type=int, default=100000)
+    args = parser.parse_args()
+
+    servers, runs = asyncio.run(fingerprint(args.read_timeout))
+    cold, warm = runs
+    print(f"{'port':>6}  {'service':<28}{'first (s)':>10}{'second (s)':>11}  result")
+    for port, (expected, _) in sorted(servers.items()):
+        result, first = cold[port]
+        found = f"{result['service']} {describe_service(result)}".strip() or '-'
+        status = 'ok' if found == (expected.strip() or '-') else 'expected ' + expected
+        print(f"{port:>6}  {found:<28}{first:>10.3f}{warm[port][1]:>11.3f}  {status}")
+
+    indexed, linear = bench_matching(args.matches)
+    print(f"{args.matches} matches: indexed {indexed:.2f}s, linear {linear:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Import a generated DB-IP style range file into a temporary database and time the lookups.
+
+    python benchmarks/bench_geoip.py --ranges 1000000 --lookups 100000
+"""
+import argparse
+import os
+import random
+import socket
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from geoip import GeoIPDatabase  # noqa: E402
+from models import Database  # noqa: E402
+
+COUNTRIES = ['FR', 'DE', 'US', 'TN', 'JP', 'BR', 'GB', 'CA']
+
+
+def write_ranges(path, count):
+    # Consecutive ranges of random size covering most of the IPv4 space, a thousand distinct places
+    step = (2 ** 32) // count
+    places = [f"EU,{random.choice(COUNTRIES)},Region {i % 20},City {i},{random.uniform(-90, 90):.4f},"
+              f"{random.uniform(-180, 180):.4f}" for i in range(1000)]
+    with open(path, 'w') as f:
+        start = 0
+        for _ in range(count):
+            end = start + random.randint(1, step) - 1
+            f.write(f"{socket.inet_ntoa(struct.pack('!I', start))},{socket.inet_ntoa(struct.pack('!I', end))},"
+                    f"{random.choice(places)}\n")
+            start += step
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ranges', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'ranges.csv')
+        write_ranges(csv_path, args.ranges)
+        db = Database(os.path.join(directory, 'bench.db'), retention_days=None)
+        try:
+            started = time.perf_counter()
+            GeoIPDatabase(db).import_csv(csv_path, 'dbip-city')
+            print(f"import of {args.ranges} ranges: {time.perf_counter() - started:.2f}s")
+
+            geoip = GeoIPDatabase(db)
+            started = time.perf_counter()
+            geoip.table('location')
+            print(f"load: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+            ips = [socket.inet_ntoa(struct.pack('!I', random.getrandbits(32))) for _ in range(args.lookups)]
+            # Traceroute hops and scanned hosts come back often, a working set smaller than the cache
+            repeated = ips[:1000] * (len(ips) // 1000)
+            for label, sample in (("uncached", ips), ("cached", repeated)):
+                started = time.perf_counter()
+                for ip in sample:
+                    geoip.lookup(ip)
+                print(f"{label} lookup: {(time.perf_counter() - started) / len(sample) * 1e6:.2f} us")
+            started = time.perf_counter()
+            geoip.lookup_many(ips)
+            print(f"lookup_many: {(time.perf_counter() - started) / len(ips) * 1e6:.2f} us per address")
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Measure measurement ingest through the database writer thread.
+
+    python benchmarks/bench_ingest.py --measurements 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from models import Database  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--measurements', type=int, default=100_000)
+    parser.add_argument('--hosts', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'bench.db'), batch_size=args.batch_size)
+        started = time.perf_counter()
+        for i in range(args.measurements):
+            db.add_mesure(i % args.hosts + 1, latence=12.5, packets_perdus=0, upload=90.0, download=450.0)
+        queued = time.perf_counter() - started
+        db.flush()
+        committed = time.perf_counter() - started
+        rows = db.reader().execute('SELECT COUNT(*) FROM mesures').fetchone()[0]
+        db.close()
+
+    print(f"Queued {args.measurements} measurements in {queued:.2f}s "
+          f"({args.measurements / queued:,.0f}/s on the calling thread)")
+    print(f"Committed {rows} runs in {committed:.2f}s ({rows / committed:,.0f}/s end to end)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Scan localhost with listeners on random ports and check the scanner finds exactly those.
+
+    python benchmarks/bench_port_scan.py --listeners 50 --ports 1-65535 --concurrency 1000
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from network_scan import parse_ports  # noqa: E402
+from port_scanner import AsyncPortScanner  # noqa: E402
+
+
+def open_listeners(count, ports):
+    listeners = []
+    for port in random.sample(ports, len(ports)):
+        if len(listeners) == count:
+            break
+        sock = socket.socket()
+        try:
+            sock.bind(('127.0.0.1', port))
+        except OSError:
+            sock.close()
+            continue
+        sock.listen(128)
+        listeners.append(sock)
+    return listeners
+
+
+async def scan(ports, concurrency, rate):
+    scanner = AsyncPortScanner(concurrency=concurrency, rate=rate)
+    started = time.perf_counter()
+    first_open = None
+    async for port, state in scanner.scan('127.0.0.1', ports):
+        if state == 'open' and first_open is None:
+            first_open = time.perf_counter() - started
+    return scanner.results['127.0.0.1'], time.perf_counter() - started, first_open
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--listeners', type=int, default=50)
+    parser.add_argument('--ports', default='1024-65535')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[100, 500, 1000])
+    parser.add_argument('--rate', type=float, help="Per-host connection attempts per second")
+    args = parser.parse_args()
+
+    ports = parse_ports(args.ports)
+    listeners = open_listeners(args.listeners, ports)
+    expected = {sock.getsockname()[1] for sock in listeners}
+    try:
+        print(f"{'concurrency':>12}{'ports':>8}{'seconds':>9}{'ports/s':>10}{'first open':>12}  result")
+        for concurrency in args.concurrency:
+            states, elapsed, first_open = asyncio.run(scan(ports, concurrency, args.rate))
+            found = set(states.ports('open'))
+            # Other services listening on the machine show up as unexpected open ports
+            result = "ok" if expected <= found else f"missed {sorted(expected - found)[:10]}"
+            extra = len(found - expected)
+            print(f"{concurrency:>12}{len(ports):>8}{elapsed:>9.2f}{len(ports) / elapsed:>10,.0f}"
+                  f"{first_open or float('nan'):>12.3f}  {result}" + (f", {extra} other open" if extra else ""))
+    finally:
+        for sock in listeners:
+            sock.close()
+
+
+if __name__ == '__main__':
+    main()
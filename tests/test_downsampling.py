@@ -0,0 +1,39 @@
+import numpy as np
+
+from downsampling import lttb
+
+
+def test_short_series_unchanged():
+    x, y = np.arange(5.0), np.array([1.0, 3.0, 2.0, 5.0, 4.0])
+    out_x, out_y = lttb(x, y, 10)
+    assert np.array_equal(out_x, x) and np.array_equal(out_y, y)
+    out_x, _ = lttb(x, y, 2)
+    assert np.array_equal(out_x, x)
+
+
+def test_keeps_ends_and_threshold():
+    x = np.arange(1000.0)
+    y = np.sin(x / 50)
+    out_x, out_y = lttb(x, y, 100)
+    assert len(out_x) == len(out_y) == 100
+    assert out_x[0] == 0 and out_x[-1] == 999
+    assert np.all(np.diff(out_x) > 0)
+    # Every kept point is a point of the series
+    assert np.array_equal(out_y, y[out_x.astype(int)])
+
+
+def test_keeps_spikes():
+    x = np.arange(1000.0)
+    y = np.zeros(1000)
+    y[[123, 456, 789]] = [50.0, -80.0, 30.0]
+    out_x, out_y = lttb(x, y, 50)
+    assert {123.0, 456.0, 789.0} <= set(out_x.tolist())
+    assert out_y.max() == 50.0 and out_y.min() == -80.0
+
+
+def test_one_point_per_bucket():
+    x = np.arange(10.0)
+    y = np.array([0, 1, 0, 1, 0, 9, 0, 1, 0, 0], dtype=float)
+    out_x, out_y = lttb(x, y, 3)
+    assert out_x.tolist() == [0.0, 5.0, 9.0]
+    assert out_y.tolist() == [0.0, 9.0, 0.0]
@@ -0,0 +1,39 @@
+from array import array
+
+import numpy as np
+
+from geoip import RangeTable, ip_to_int
+
+
+def make_table():
+    ranges = [('1.0.0.0', '1.0.0.255', 0), ('1.0.1.0', '1.0.3.255', 1), ('8.8.8.0', '8.8.8.255', 0)]
+    return RangeTable(array('I', [ip_to_int(start) for start, _, _ in ranges]),
+                      array('I', [ip_to_int(end) for _, end, _ in ranges]),
+                      array('I', [record for _, _, record in ranges]),
+                      [('AU', 'Research'), ('CN', 'Fuzhou')])
+
+
+def test_find():
+    table = make_table()
+    assert len(table) == 3
+    assert table.find(ip_to_int('1.0.0.0')) == ('AU', 'Research')
+    assert table.find(ip_to_int('1.0.2.17')) == ('CN', 'Fuzhou')
+    assert table.find(ip_to_int('1.0.3.255')) == ('CN', 'Fuzhou')
+    assert table.find(ip_to_int('8.8.8.8')) == ('AU', 'Research')
+    # Before the first range, in a gap and after the last one
+    assert table.find(ip_to_int('0.255.255.255')) is None
+    assert table.find(ip_to_int('1.0.4.0')) is None
+    assert table.find(ip_to_int('9.0.0.0')) is None
+
+
+def test_find_many_matches_find():
+    table = make_table()
+    addresses = ['0.0.0.1', '1.0.0.7', '1.0.1.0', '1.0.4.1', '8.8.8.255', '8.8.9.0', '255.255.255.255']
+    values = [ip_to_int(address) for address in addresses]
+    assert table.find_many(np.array(values, dtype=np.uint32)) == [table.find(value) for value in values]
+
+
+def test_ip_to_int():
+    assert ip_to_int('1.0.0.1') == 16777217
+    assert ip_to_int('16777217') == 16777217
+    assert ip_to_int('2001:db8::1') is None
@@ -0,0 +1,79 @@
+from inventory import Inventory, describe_change
+
+
+def host(ip, mac='N/A', hostname=''):
+    return {'ip': ip, 'hostname': hostname, 'status': 'Up', 'adresse_mac': mac}
+
+
+def kinds(changes):
+    return sorted((change['kind'], change['ip']) for change in changes)
+
+
+def test_hosts_new_gone_back(db):
+    inventory = Inventory(db)
+    changes = inventory.record_hosts('192.168.1.0/24', [host('192.168.1.1', 'aa:aa'), host('192.168.1.2')])
+    assert kinds(changes) == [('host_new', '192.168.1.1'), ('host_new', '192.168.1.2')]
+    assert {change['ip']: change['detail'] for change in changes} == {'192.168.1.1': 'aa:aa', '192.168.1.2': None}
+
+    changes = inventory.record_hosts('192.168.1.0/24', [host('192.168.1.1', 'aa:aa')])
+    assert kinds(changes) == [('host_gone', '192.168.1.2')]
+    # Nothing changed since the last scan
+    assert inventory.record_hosts('192.168.1.0/24', [host('192.168.1.1', 'aa:aa')]) == []
+
+    changes = inventory.record_hosts('192.168.1.0/24', [host('192.168.1.1', 'aa:aa'), host('192.168.1.2')])
+    assert kinds(changes) == [('host_back', '192.168.1.2')]
+
+
+def test_hosts_outside_the_scan_are_kept(db):
+    inventory = Inventory(db)
+    inventory.record_hosts('10.0.0.0/24', [host('10.0.0.5'), host('10.0.1.5')])
+    assert inventory.record_hosts('10.0.1.0/24', [host('10.0.1.5')]) == []
+    # Hosts of a failed chunk are not reported gone
+    assert inventory.record_hosts('10.0.0.0/24', [], unscanned=['10.0.0.0/25']) == []
+    assert inventory.hosts['10.0.0.5']['up']
+
+
+def test_mac_change(db):
+    inventory = Inventory(db)
+    inventory.record_hosts('10.0.0.0/24', [host('10.0.0.5', 'aa:aa')])
+    # A probe reporting no MAC is not a change
+    assert inventory.record_hosts('10.0.0.0/24', [host('10.0.0.5')]) == []
+    changes = inventory.record_hosts('10.0.0.0/24', [host('10.0.0.5', 'bb:bb')])
+    assert [(change['kind'], change['detail']) for change in changes] == [('mac_changed', 'aa:aa -> bb:bb')]
+
+
+def test_ports_opened_and_closed(db):
+    inventory = Inventory(db)
+    changes = inventory.record_ports('10.0.0.5', {22: 'ssh', 80: 'http'}, range(1, 1025))
+    assert [describe_change(change) for change in changes] == \
+        ["Port ouvert: 10.0.0.5 (22 ssh)", "Port ouvert: 10.0.0.5 (80 http)"]
+
+    changes = inventory.record_ports('10.0.0.5', {22: 'ssh', 443: 'https'}, range(1, 1025))
+    assert [(change['kind'], change['detail']) for change in changes] == \
+        [('port_opened', '443 https'), ('port_closed', '80')]
+
+    # Port 22 is outside this scan and stays open
+    changes = inventory.record_ports('10.0.0.5', {}, [443])
+    assert [(change['kind'], change['detail']) for change in changes] == [('port_closed', '443')]
+    assert set(inventory.open_ports['10.0.0.5']) == {22}
+
+
+def test_state_and_events_are_persisted(db):
+    inventory = Inventory(db)
+    inventory.record_hosts('10.0.0.0/24', [host('10.0.0.5', 'aa:aa', 'nas')])
+    inventory.record_ports('10.0.0.5', {22: 'ssh'}, [22, 80])
+
+    reloaded = Inventory(db)
+    assert reloaded.hosts == {'10.0.0.5': {'mac': 'aa:aa', 'hostname': 'nas', 'up': True}}
+    assert reloaded.open_ports == {'10.0.0.5': {22: 'ssh'}}
+    assert [(kind, ip) for _, kind, ip, _ in reloaded.events()] == \
+        [('port_opened', '10.0.0.5'), ('host_new', '10.0.0.5')]
+
+
+def test_changes_are_emitted(db):
+    inventory = Inventory(db)
+    emitted = []
+    inventory.changes_detected.connect(emitted.append)
+    inventory.record_hosts('10.0.0.0/24', [host('10.0.0.5')])
+    inventory.record_hosts('10.0.0.0/24', [host('10.0.0.5')])
+    assert [kinds(changes) for changes in emitted] == [[('host_new', '10.0.0.5')]]
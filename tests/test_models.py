@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from models import MIGRATIONS, QUERY_PLAN_CHECKS, Database
+
+
+def baseline_database(path):
+    # Version 0 schema, as written before migrations existed
+    db = Database(path, apply_migrations=False, retention_days=None)
+    with db.conn:
+        db.conn.execute("INSERT INTO hosts (id, name, ip) VALUES (1, 'router', '192.168.1.1')")
+        db.conn.executemany('INSERT INTO latence (host_id, date, valeur, packets_perdus) VALUES (?, ?, ?, ?)',
+                            [(1, '2024-01-01 10:00:00', 12.5, 0), (1, '2024-01-01 10:00:30', 20.0, 1)])
+        db.conn.executemany('INSERT INTO bande_passante (host_id, date, upload, download) VALUES (?, ?, ?, ?)',
+                            [(1, '2024-01-01 10:00:00', 5.0, 50.0), (1, '2024-01-01 11:00:00', 6.0, 60.0)])
+        db.conn.execute("INSERT INTO interface_stats (interface, date, bytes_sent, bytes_recv) "
+                        "VALUES ('eth0', '2024-01-01 10:00:00', 100, 200)")
+    db.close()
+
+
+def epoch_us(date):
+    return int(datetime.fromisoformat(date).timestamp() * 1_000_000)
+
+
+def test_migrate_baseline(tmp_path):
+    path = str(tmp_path / 'baseline.db')
+    baseline_database(path)
+    db = Database(path, retention_days=None)
+    try:
+        assert db.schema_version() == MIGRATIONS[-1][0]
+        # Latency and bandwidth saved with the same date are one run
+        assert db.conn.execute('SELECT ts, latence, packets_perdus, upload, download FROM mesures '
+                               'ORDER BY ts').fetchall() == [
+            (epoch_us('2024-01-01 10:00:00'), 12.5, 0, 5.0, 50.0),
+            (epoch_us('2024-01-01 10:00:30'), 20.0, 1, None, None),
+            (epoch_us('2024-01-01 11:00:00'), None, None, 6.0, 60.0),
+        ]
+        assert db.conn.execute("SELECT ts, bytes_sent FROM interface_stats").fetchall() == \
+            [(epoch_us('2024-01-01 10:00:00'), 100)]
+        assert db.conn.execute("SELECT count, min_value, max_value FROM rollups "
+                               "WHERE metric = 'latence' AND resolution = 3600").fetchall() == [(2, 12.5, 20.0)]
+        tables = {row[0] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {'latence', 'bande_passante'}.isdisjoint(tables)
+        assert {'scan_cache', 'inventory_hosts', 'inventory_ports', 'inventory_events', 'geoip_ranges'} <= tables
+    finally:
+        db.close()
+
+
+def test_migrate_is_idempotent(tmp_path):
+    path = str(tmp_path / 'baseline.db')
+    baseline_database(path)
+    Database(path, retention_days=None).close()
+    db = Database(path, retention_days=None)
+    try:
+        assert db.schema_version() == MIGRATIONS[-1][0]
+        assert db.conn.execute('SELECT COUNT(*) FROM mesures').fetchone()[0] == 3
+    finally:
+        db.close()
+
+
+def test_hot_queries_use_indexes(db):
+    assert db.check_query_plans() == []
+    for name, query, params in QUERY_PLAN_CHECKS:
+        assert any(step.startswith('SEARCH') for step in db.query_plan(query, params)), name
+
+
+def test_query_plan_check_reports_a_missing_index(tmp_path):
+    path = str(tmp_path / 'network_monitor.db')
+    db = Database(path, retention_days=None)
+    db.conn.execute('DROP INDEX idx_mesures_host_ts')
+    db.close()
+    db = Database(path, retention_days=None)
+    try:
+        assert {'history', 'history page'} <= {name for name, _ in db.check_query_plans()}
+    finally:
+        db.close()
@@ -0,0 +1,87 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+from port_scanner import AsyncPortScanner
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def closed_port():
+    # Bound without listening: connections are refused
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def saturated_port():
+    # A full accept queue makes the kernel drop new SYNs, as a firewall would
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(0)
+    port = sock.getsockname()[1]
+    clients = []
+    for _ in range(3):
+        client = socket.socket()
+        client.setblocking(False)
+        try:
+            client.connect(('127.0.0.1', port))
+        except BlockingIOError:
+            pass
+        clients.append(client)
+    time.sleep(0.1)
+    yield port
+    for client in clients:
+        client.close()
+    sock.close()
+
+
+def scan(scanner, ports):
+    async def run():
+        return [result async for result in scanner.scan('127.0.0.1', ports)]
+    return asyncio.run(run())
+
+
+def test_open_closed_filtered(listener, closed_port, saturated_port):
+    scanner = AsyncPortScanner(timeout=0.2, max_timeout=0.2, retries=0)
+    results = scan(scanner, [listener, closed_port, saturated_port])
+    assert sorted(results) == sorted([(listener, 'open'), (closed_port, 'closed'), (saturated_port, 'filtered')])
+    states = scanner.results['127.0.0.1']
+    assert states.ports('open') == [listener]
+    assert states.ports('closed') == [closed_port]
+    assert states.ports('filtered') == [saturated_port]
+
+
+def test_scan_hosts_reports_every_host(listener):
+    scanner = AsyncPortScanner(timeout=0.2)
+
+    async def run():
+        return [result async for result in scanner.scan_hosts(['127.0.0.1', '127.0.0.2'], [listener])]
+
+    assert sorted(asyncio.run(run())) == [('127.0.0.1', listener, 'open'), ('127.0.0.2', listener, 'closed')]
+
+
+def test_stop_ends_the_scan(closed_port):
+    scanner = AsyncPortScanner(concurrency=1)
+
+    async def run():
+        results = []
+        async for result in scanner.scan('127.0.0.1', [closed_port] * 100):
+            results.append(result)
+            scanner.stop()
+        return results
+
+    # The probe already running when stop() is called still completes
+    assert len(asyncio.run(run())) <= 2
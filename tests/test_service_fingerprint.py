@@ -0,0 +1,142 @@
+import asyncio
+
+from scan_cache import ScanCache
+from service_fingerprint import ServiceFingerprinter, Signature, SignatureIndex
+
+
+def test_match_by_port_group():
+    index = SignatureIndex()
+    assert index.match(b'SSH-2.0-OpenSSH_9.6p1 Ubuntu\r\n', 22) == \
+        {'service': 'ssh', 'product': 'OpenSSH', 'version': '9.6p1'}
+
+
+def test_match_by_first_byte_on_an_unusual_port():
+    index = SignatureIndex()
+    assert index.match(b'SSH-2.0-dropbear_2022.83\r\n', 2222) == \
+        {'service': 'ssh', 'product': 'Dropbear sshd', 'version': '2022.83'}
+    assert index.match(b'+OK Dovecot ready.\r\n', 10110)['product'] == 'Dovecot pop3d'
+
+
+def test_match_generic_fallback():
+    # The MySQL greeting starts with its length, only the generic group can match it
+    greeting = b'J\x00\x00\x00\x0a8.0.36-0ubuntu0.22.04.1\x00'
+    index = SignatureIndex()
+    assert 13306 not in index.by_port and greeting[0] not in index.by_byte
+    assert index.match(greeting, 13306) == \
+        {'service': 'mysql', 'product': 'MySQL', 'version': '8.0.36-0ubuntu0.22.04.1'}
+
+
+def test_match_unknown_or_empty_response():
+    index = SignatureIndex()
+    assert index.match(b'', 22) is None
+    assert index.match(b'\x00\x01garbage', 4444) is None
+
+
+def test_match_ignore_case():
+    index = SignatureIndex([Signature('ftp', rb'^220 [^\r\n]*ftp', ports=(21,), ignore_case=True)])
+    assert index.match(b'220 Welcome to the FTP server\r\n', 2121)['service'] == 'ftp'
+    assert index.match(b'220 welcome to the ftp server\r\n', 2121)['service'] == 'ftp'
+    strict = SignatureIndex([Signature('ftp', rb'^220 [^\r\n]*ftp', ports=(21,))])
+    assert strict.match(b'220 Welcome to the FTP server\r\n', 21) is None
+
+
+def test_match_version_template():
+    index = SignatureIndex()
+    assert index.match(b'SSH-1.99-Cisco-1.25\r\n', 22)['version'] == 'protocol 1.99'
+    assert index.match(b'RFB 003.008\n', 5900)['version'] == 'protocol 003.008'
+
+
+def test_match_reports_the_matched_alternative():
+    # Both signatures start with the same byte, the version comes from the groups of the one that matched
+    index = SignatureIndex([
+        Signature('a', rb'^Xa (\d+)', 'A', rb'v\1'),
+        Signature('b', rb'^Xb (\d+) (\d+)', 'B', rb'\2.\1'),
+    ])
+    assert index.match(b'Xb 1 2') == {'service': 'b', 'product': 'B', 'version': '2.1'}
+    assert index.match(b'Xa 7') == {'service': 'a', 'product': 'A', 'version': 'v7'}
+
+
+async def _serve(handler):
+    connections = []
+
+    async def on_connect(reader, writer):
+        connections.append(writer)
+        await handler(reader, writer)
+        writer.close()
+
+    server = await asyncio.start_server(on_connect, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1], connections
+
+
+async def _banner(reader, writer):
+    writer.write(b'SSH-2.0-OpenSSH_9.6\r\n')
+    await writer.drain()
+
+
+async def _http(reader, writer):
+    # Silent until it gets a request
+    await reader.readuntil(b'\r\n\r\n')
+    writer.write(b'HTTP/1.1 200 OK\r\nServer: nginx/1.24.0\r\n\r\n')
+    await writer.drain()
+
+
+def _fingerprinter(cache=None):
+    return ServiceFingerprinter(cache=cache, connect_timeout=0.5, read_timeout=0.3)
+
+
+def test_identify_banner():
+    async def run():
+        server, port, connections = await _serve(_banner)
+        async with server:
+            result = await _fingerprinter().identify('127.0.0.1', port)
+        return result, len(connections)
+
+    result, connections = asyncio.run(run())
+    assert (result['service'], result['product'], result['version'], result['probe']) == \
+        ('ssh', 'OpenSSH', '9.6', 'null')
+    assert result['banner'].startswith('SSH-2.0')
+    assert connections == 1
+
+
+def test_identify_probe_and_reuse():
+    async def run():
+        server, port, connections = await _serve(_http)
+        fingerprinter = _fingerprinter()
+        async with server:
+            first = await fingerprinter.identify('127.0.0.1', port)
+            probes = len(connections)
+            second = await fingerprinter.identify('127.0.0.1', port)
+        return first, second, probes, len(connections) - probes
+
+    first, second, first_probes, second_probes = asyncio.run(run())
+    assert (first['service'], first['product'], first['version'], first['probe']) == \
+        ('http', 'nginx', '1.24.0', 'http')
+    assert first_probes == 2  # null probe, then the HTTP request
+    assert second == first
+    assert second_probes == 1  # the probe that worked is sent first
+
+
+def test_identify_closed_port():
+    async def run():
+        server, port, _ = await _serve(_banner)
+        server.close()
+        await server.wait_closed()
+        return await _fingerprinter().identify('127.0.0.1', port)
+
+    assert asyncio.run(run())['service'] == ''
+
+
+def test_identify_reuses_the_scan_cache(db):
+    cache = ScanCache(db)
+
+    async def run():
+        server, port, _ = await _serve(_banner)
+        async with server:
+            await _fingerprinter(cache).identify('127.0.0.1', port)
+            # A new fingerprinter has nothing in memory, the result comes from the cache
+            fingerprinter = _fingerprinter(cache)
+            fingerprinter.signatures = SignatureIndex([])
+            return await fingerprinter.identify('127.0.0.1', port)
+
+    result = asyncio.run(run())
+    assert (result['service'], result['product'], result['version']) == ('ssh', 'OpenSSH', '9.6')
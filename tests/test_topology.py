@@ -0,0 +1,50 @@
+from topology import SOURCE, PathTopology
+
+
+def test_shared_hops_are_merged():
+    topology = PathTopology()
+    topology.add_hop('a', 1, '10.0.0.1', 1.0)
+    topology.add_hop('a', 2, '10.0.1.1', 5.0)
+    node, created, edges = topology.add_hop('b', 1, '10.0.0.1', 2.0)
+    assert not created
+    assert node.targets == {'a', 'b'}
+    assert node.rtt == 2.0
+    assert edges == []
+    node, created, edges = topology.add_hop('b', 2, '10.0.2.1', 6.0)
+    assert created and edges == [('10.0.0.1', '10.0.2.1')]
+    assert topology.edges == {(SOURCE, '10.0.0.1'), ('10.0.0.1', '10.0.1.1'), ('10.0.0.1', '10.0.2.1')}
+
+
+def test_layout_columns_and_rows():
+    topology = PathTopology()
+    first, _, _ = topology.add_hop('a', 2, '10.0.1.1', None)
+    second, _, _ = topology.add_hop('b', 2, '10.0.2.1', None)
+    # One column per hop, a free row in the column next to the wanted one
+    assert (first.layer, first.row) == (2, 0)
+    assert (second.layer, second.row) == (2, 1)
+    third, _, _ = topology.add_hop('c', 2, '10.0.3.1', None)
+    assert third.row == -1
+
+
+def test_hops_arriving_out_of_order():
+    topology = PathTopology()
+    _, _, edges = topology.add_hop('a', 2, '10.0.1.1', 3.0)
+    assert edges == []
+    _, _, edges = topology.add_hop('a', 1, '10.0.0.1', 1.0)
+    assert sorted(edges) == [('10.0.0.1', '10.0.1.1'), (SOURCE, '10.0.0.1')]
+
+
+def test_silent_hops_are_not_merged():
+    topology = PathTopology()
+    first, created_a, _ = topology.add_hop('a', 1, None, None)
+    second, created_b, _ = topology.add_hop('b', 1, None, None)
+    assert created_a and created_b
+    assert first is not second
+    assert first.ip is None and first.targets == {'a'}
+
+
+def test_rtt_kept_when_a_probe_times_out():
+    topology = PathTopology()
+    topology.add_hop('a', 1, '10.0.0.1', 4.0)
+    node, _, _ = topology.add_hop('b', 1, '10.0.0.1', None)
+    assert node.rtt == 4.0